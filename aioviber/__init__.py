@@ -2,5 +2,21 @@ from aioviber.bot import Bot  # noqa
 from aioviber.chat import Chat  # noqa
 from aioviber.eventtype import EventType  # noqa
 from aioviber.messagetype import MessageType  # noqa
-from aioviber.api import Api, BotConfiguration  # noqa
+from aioviber.api import Api, BotConfiguration, SessionConfig  # noqa
 from aioviber.keyboard import Keyboard, Button, ExternalLinkButton, Carousel  # noqa
+from aioviber.ratelimit import RateLimiter, TokenBucket  # noqa
+from aioviber.retry import RetryPolicy  # noqa
+from aioviber.exceptions import ViberError, ViberApiError  # noqa
+from aioviber.pipeline import SendPipeline  # noqa
+from aioviber.cache import Cache, MemoryBackend, SQLiteBackend  # noqa
+from aioviber.codec import JsonCodec, OrjsonCodec  # noqa
+from aioviber.template import MessageTemplate  # noqa
+from aioviber.outbox import Outbox  # noqa
+from aioviber.dispatcher import Dispatcher, Overflow  # noqa
+from aioviber.dedup import MemoryDedup, BloomDedup, SQLiteDedup  # noqa
+from aioviber.request import Request  # noqa
+from aioviber.ingress import ProcessQueue, SQLiteQueue  # noqa
+from aioviber.metrics import Metrics  # noqa
+from aioviber.hub import BotHub  # noqa
+from aioviber.profiling import Profiler, SlowCall  # noqa
+from aioviber.tracing import Tracer, LogExporter, OtlpExporter  # noqa
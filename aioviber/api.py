@@ -1,5 +1,6 @@
 import logging
-from typing import List
+import time
+from typing import List, Iterable, Union, AsyncIterator
 
 import aiohttp
 import asyncio as aio
@@ -7,7 +8,19 @@ from viberbot import BotConfiguration
 from viberbot.api.consts import VIBER_BOT_API_URL, BOT_API_ENDPOINT
 from viberbot.api.messages.message import Message
 
+from aioviber.cache import Cache
+from aioviber.codec import JsonCodec, default_codec
 from aioviber.eventtype import EventType
+from aioviber.exceptions import InvalidMessageError, error_from_result
+from aioviber.loader import BatchLoader
+from aioviber.metrics import Metrics
+from aioviber.outbox import Outbox
+from aioviber.pipeline import SendPipeline
+from aioviber.profiling import API, Profiler
+from aioviber.tracing import Tracer, current_span
+from aioviber.ratelimit import RateLimiter
+from aioviber.retry import RetryPolicy, NO_RETRY
+from aioviber.template import MessageTemplate
 
 default_headers = {
     'User-Agent': 'aioviber/1.0',
@@ -16,33 +29,214 @@ default_headers = {
     'Connection': 'keep-alive',
 }
 
+json_headers = dict(default_headers, **{'Content-Type': 'application/json'})
+
+BROADCAST_LIST_LIMIT = 300  # max receivers per broadcast_message request
+GET_ONLINE_LIMIT = 100  # max ids per get_online request
+
+
+class Endpoints(BOT_API_ENDPOINT):
+    BROADCAST_MESSAGE = 'broadcast_message'
+
+
+class SessionConfig:
+    """
+    Settings of the client session owned by Api.
+
+    :param limit: connections in the pool in total, 0 for no limit
+    :param limit_per_host: connections to one host, 0 for no limit
+    :param ttl_dns_cache: seconds to keep resolved addresses, None to cache forever
+    :param keepalive_timeout: seconds to keep an idle connection open
+    :param timeout: seconds for the whole request
+    :param connect_timeout: seconds to get a connection from the pool and connect
+    """
+
+    def __init__(self,
+                 limit: int = 100,
+                 limit_per_host: int = 0,
+                 ttl_dns_cache: int = 300,
+                 keepalive_timeout: float = 30,
+                 timeout: float = 30,
+                 connect_timeout: float = 10) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+
+    def create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+        )
+
 
 class Api:
-    endpoints = BOT_API_ENDPOINT
+    endpoints = Endpoints
 
     def __init__(self,
                  bot_configuration: BotConfiguration,
-                 session: aiohttp.ClientSession,
-                 loop: aio.AbstractEventLoop):
+                 session: aiohttp.ClientSession = None,
+                 loop: aio.AbstractEventLoop = None,
+                 rate_limiter: RateLimiter = None,
+                 retry_policy: RetryPolicy = None,
+                 pipeline: SendPipeline = None,
+                 user_details_cache: Cache = None,
+                 session_config: SessionConfig = None,
+                 codec: JsonCodec = None,
+                 outbox: Outbox = None,
+                 metrics: Metrics = None,
+                 base_url: str = None,
+                 profiler: Profiler = None,
+                 tracer: Tracer = None):
         self._logger = logging.getLogger('aioviber.api')
         self._bot_configuration = bot_configuration
-        self._viber_bot_api_url = VIBER_BOT_API_URL
-        self.session = session
+        # e.g. url of FakeViberApi for load tests
+        self._viber_bot_api_url = (base_url or VIBER_BOT_API_URL).rstrip('/')
         self.loop = loop
+        self.codec = codec or default_codec()
+
+        # Client session is created on start and closed on close unless it is passed from outside
+        self.session = session
+        self.session_config = session_config or SessionConfig()
+        self._owns_session = session is None
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or NO_RETRY
+        self.pipeline = pipeline or SendPipeline(loop=loop)
+        self.user_details_cache = user_details_cache or Cache()
+        self.status_loader = BatchLoader(self._load_users_status, max_batch_size=GET_ONLINE_LIMIT, loop=loop)
+
+        self.metrics = metrics
+        self.profiler = profiler
+        self.tracer = tracer
+
+        self.outbox = outbox
+        if outbox is not None:
+            outbox.api = self
 
-    async def _make_request(self, endpoint: str, data: dict = {}):
-        data['auth_token'] = self._bot_configuration.auth_token
+    async def start(self) -> None:
+        """ Create client session, should be called inside running loop """
+        if self.session is None:
+            self.session = self.session_config.create_session()
+        if self.outbox is not None:
+            await self.outbox.start()
+
+    async def close(self) -> None:
+        """ Stop outbox and close owned client session """
+        if self.outbox is not None:
+            await self.outbox.close()
+        if self._owns_session and self.session is not None:
+            session, self.session = self.session, None
+            await session.close()
+
+    def _forget_session(self) -> None:
+        """ Drop owned session without closing it, e.g. in a forked process
+        where the session belongs to the loop of the parent """
+        if self._owns_session:
+            self.session = None
+
+    async def _make_request(self, endpoint: str, data: Union[dict, bytes] = None, deadline: float = None):
+        """ Post request to Viber API retrying transient failures according
+        to retry_policy. `data` is a dict or a body already encoded with
+        auth_token (see MessageTemplate). `deadline` overrides the policy
+        deadline: seconds for the whole call, retries included;
+        aio.TimeoutError is raised when it is exceeded."""
+        if self.profiler is None and self.tracer is None:
+            return await self._call(endpoint, data, deadline)
+
+        receiver = (data.get('receiver') or data.get('id')) if isinstance(data, dict) else None
+        coro = self._call(endpoint, data, deadline)
+        if self.profiler is not None:
+            coro = self.profiler.measure(API, endpoint, receiver, coro)
+        if self.tracer is not None:
+            coro = self.tracer.trace('api', coro, endpoint=endpoint, receiver=receiver or '')
+        return await coro
+
+    async def _call(self, endpoint: str, data: Union[dict, bytes] = None, deadline: float = None):
+        if isinstance(data, bytes):
+            body = data
+        else:
+            data = {} if data is None else data
+            data['auth_token'] = self._bot_configuration.auth_token
+            body = self.codec.dumps(data)
         url = '{}/{}'.format(self._viber_bot_api_url, endpoint)
-        async with self.session.post(url=url, json=data, headers=default_headers) as response:
-            result = await response.json()
+
+        policy = self.retry_policy
+        deadline = policy.deadline if deadline is None else deadline
+        loop = self.loop or aio.get_event_loop()
+        expires = loop.time() + deadline if deadline is not None else None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = None
+            if expires is not None:
+                timeout = expires - loop.time()
+                if timeout <= 0:
+                    raise aio.TimeoutError()
+
+            try:
+                return await aio.wait_for(self._post(endpoint, url, body), timeout)
+            except Exception as e:
+                if attempt >= policy.attempts or not policy.is_retryable(e):
+                    raise
+                delay = policy.delay(attempt)
+                if expires is not None and loop.time() + delay >= expires:
+                    raise
+                self._logger.warning('%s attempt %d failed: %r, retry in %.2fs', endpoint, attempt, e, delay)
+                if self.tracer is not None:
+                    current_span().set('retries', attempt)
+                await aio.sleep(delay)
+
+    async def _post(self, endpoint: str, url: str, body: bytes) -> dict:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(endpoint)
+        if self.session is None:
+            self.session = self.session_config.create_session()
+
+        if self.metrics is None:
+            result = await self._send(url, body)
+        else:
+            result = await self._send_measured(endpoint, url, body)
 
         if result['status'] != 0:
-            error_text = "failed with result: {}".format(result)
-            self._logger.error(error_text)
-            raise Exception(error_text)
+            error = error_from_result(result)
+            self._logger.error(str(error))
+            raise error
 
         return result
 
+    async def _send(self, url: str, body: bytes) -> dict:
+        async with self.session.post(url=url, data=body, headers=json_headers) as response:
+            # Viber answers errors with status in 200 response, other codes come from proxies
+            response.raise_for_status()
+            return self.codec.loads(await response.read())
+
+    async def _send_measured(self, endpoint: str, url: str, body: bytes) -> dict:
+        metrics = self.metrics
+        metrics.api_in_flight.inc()
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = await self._send(url, body)
+            status = str(result.get('status'))
+            return result
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            metrics.api_in_flight.dec()
+            metrics.api_seconds.observe(time.perf_counter() - start, endpoint)
+            metrics.api_responses.inc(endpoint, status)
+
     async def send_message(self, to: str, message: Message) -> str:
         """ The send_message API allows PAs to send messages to Viber users
         who subscribe to the PA. Sending a message to a user will be possible
@@ -57,7 +251,7 @@ class Api:
         if not message.validate():
             error_text = "failed validating message: {0}".format(message)
             self._logger.error(error_text)
-            raise Exception(error_text)
+            raise InvalidMessageError(error_text)
 
         data = message.to_dict()
         data.update({
@@ -71,6 +265,115 @@ class Api:
 
         return result['message_token']
 
+    async def enqueue_message(self, to: str, message: Message) -> int:
+        """ Append message to the durable outbox instead of sending it right
+        away. Returns outbox entry id once the entry is written to disk."""
+        assert self.outbox is not None, 'outbox is not configured'
+
+        if not message.validate():
+            error_text = "failed validating message: {0}".format(message)
+            self._logger.error(error_text)
+            raise InvalidMessageError(error_text)
+
+        data = message.to_dict()
+        data.update({
+            'receiver': to,
+            'sender': {
+                'name': self._bot_configuration.name,
+                'avatar': self._bot_configuration.avatar
+            }
+        })
+        return await self.outbox.put(self.endpoints.SEND_MESSAGE, data)
+
+    def create_template(self, message: Message) -> MessageTemplate:
+        """ Validate and encode message once for sending with send_template """
+        return MessageTemplate(
+            message,
+            auth_token=self._bot_configuration.auth_token,
+            sender={
+                'name': self._bot_configuration.name,
+                'avatar': self._bot_configuration.avatar
+            },
+            codec=self.codec
+        )
+
+    async def send_template(self, to: str, template: MessageTemplate, tracking_data: str = None) -> str:
+        """ Send message prepared with create_template """
+        result = await self._make_request(self.endpoints.SEND_MESSAGE, template.render(to, tracking_data))
+
+        return result['message_token']
+
+    async def broadcast_message(
+            self,
+            receivers: Union[Iterable[str], AsyncIterator[str]],
+            message: Message,
+            chunk_size: int = BROADCAST_LIST_LIMIT,
+            concurrency: int = 10) -> List[dict]:
+        """ Send the same message to many subscribers with broadcast_message
+        requests. Receivers may be a plain iterable or an async iterator, so
+        huge lists can be streamed from a database; they are split into chunks
+        of `chunk_size` (Viber accepts up to 300) and at most `concurrency`
+        chunks are in flight at once.
+
+        Returns the list of failed receivers: items of Viber's `failed_list`
+        plus every receiver of a chunk whose request failed as a whole."""
+
+        assert 0 < chunk_size <= BROADCAST_LIST_LIMIT, 'chunk_size should be in 1..{}'.format(BROADCAST_LIST_LIMIT)
+        assert concurrency > 0, 'concurrency should be positive'
+
+        # message is encoded once, chunks only splice their broadcast_list
+        template = self.create_template(message)
+
+        failed = []  # type: List[dict]
+        pending = set()
+        semaphore = aio.Semaphore(concurrency)
+        chunk = []  # type: List[str]
+        loop = self.loop or aio.get_event_loop()
+
+        async def flush():
+            nonlocal chunk
+            await semaphore.acquire()
+            task = loop.create_task(self._broadcast_chunk(template, chunk, semaphore, failed))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            chunk = []
+
+        try:
+            if hasattr(receivers, '__aiter__'):
+                async for receiver in receivers:
+                    chunk.append(receiver)
+                    if len(chunk) >= chunk_size:
+                        await flush()
+            else:
+                for receiver in receivers:
+                    chunk.append(receiver)
+                    if len(chunk) >= chunk_size:
+                        await flush()
+
+            if chunk:
+                await flush()
+        except BaseException:
+            # receivers failed or the call is cancelled, do not leave chunks running
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            if pending:
+                await aio.wait(pending)
+
+        return failed
+
+    async def _broadcast_chunk(self, template: MessageTemplate, receivers: List[str], semaphore: aio.Semaphore,
+                               failed: List[dict]):
+        try:
+            result = await self._make_request(self.endpoints.BROADCAST_MESSAGE, template.render_broadcast(receivers))
+            failed.extend(result.get('failed_list', []))
+        except Exception as e:
+            self._logger.error('broadcast to %d receivers failed: %s', len(receivers), e)
+            failed.extend({'receiver': receiver, 'status': None, 'status_message': str(e)} for receiver in receivers)
+        finally:
+            semaphore.release()
+
     async def set_webhook(self, url: object, webhook_events: object = None) -> object:
         """ For each set_webhook request Viber will send a callback to the
         webhook URL to confirm it is available. The expected HTTP response to
@@ -108,9 +411,15 @@ class Api:
         self._logger.debug("unsetting webhook")
         return await self.set_webhook('')
 
-    async def send_messages(self, to: str, messages: List[Message]) -> List:
+    async def send_messages(self, to: str, messages: List[Message], ordered: bool = True) -> List:
+        """ Send several messages to one receiver. Ordered sends go through
+        the send pipeline and arrive in the list order, unordered ones are
+        sent all at once."""
         self._logger.debug("going to send messages: {0}, to: {1}".format(messages, to))
 
+        if ordered:
+            return await self.pipeline.send_messages(self.send_message, to, messages)
+
         return await aio.gather(
             *[self.send_message(to, message) for message in messages], loop=self.loop
         )
@@ -125,13 +434,28 @@ class Api:
         result = await self._make_request(self.endpoints.GET_ONLINE, {'ids': ids})
         return result['users']
 
+    async def get_user_status(self, user_id: str) -> dict:
+        """ Online status of one user. Concurrent calls are coalesced into
+        get_online requests of up to 100 ids by status_loader."""
+        assert isinstance(user_id, str), 'wrong type of user_id'
+        return await self.status_loader.load(user_id)
+
+    async def _load_users_status(self, ids: List[str]) -> dict:
+        return {user['id']: user for user in await self.get_users_status(ids)}
+
     async def get_user_details(self, user_id: str):
         """ The get_user_details request will fetch the details of a specific
         Viber user based on his unique user ID. The user ID can be obtained
         from the callbacks sent to the PA regrading user’s actions. This
-        request can be sent twice during a 12 hours period for each user ID."""
+        request can be sent twice during a 12 hours period for each user ID.
+
+        Details are cached by user_details_cache, concurrent calls for one
+        user share one request."""
 
         assert isinstance(user_id, str), 'wrong type of user_id'
+        return await self.user_details_cache.get_or_load(user_id, lambda: self._get_user_details(user_id))
+
+    async def _get_user_details(self, user_id: str):
         result = await self._make_request(self.endpoints.GET_USER_DETAILS, {'id': user_id})
         return result['user']
 
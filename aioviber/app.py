@@ -8,11 +8,18 @@ async def ping(request):
     return web.Response(text='pong')
 
 
+async def metrics(request):
+    body = request.app.bot.metrics.render().encode('utf-8')
+    return web.Response(body=body, headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
 def get_app(bot, static_serve=False) -> web.Application:
     app = web.Application(
         middlewares=[signature_middleware]
     )
     app.router.add_get('/ping', ping)
+    if getattr(bot, 'metrics', None) is not None:
+        app.router.add_get('/metrics', metrics)
     if static_serve:
         app.router.add_static('/static', 'static')
     app.bot = bot
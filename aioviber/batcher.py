@@ -0,0 +1,98 @@
+import asyncio as aio
+import logging
+from typing import Any, Awaitable, Callable, List, Set
+
+logger = logging.getLogger('aioviber.batcher')
+
+BatchHandler = Callable[[List], Awaitable]
+
+
+class StatusBatcher:
+    """
+    Buffer of events delivered to `handler` as a list: the buffer is
+    flushed when it reaches `max_size` events or `max_delay` seconds after
+    its first event. Exceptions of handler are logged.
+
+    At most `concurrency` batches are handled at once, a batch due while
+    all of them run is flushed when one is done. `add` raises aio.QueueFull
+    when such a batch is already full.
+
+    `add` takes an optional `done` callback, called once the batch with the
+    event is handled.
+    """
+
+    def __init__(self, handler: BatchHandler, max_size: int = 500, max_delay: float = 1.0,
+                 concurrency: int = 4) -> None:
+        assert max_size > 0, 'max_size should be positive'
+        assert concurrency > 0, 'concurrency should be positive'
+        self.handler = handler
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+
+        self._events = []  # type: List[Any]
+        self._callbacks = []  # type: List[Callable[[], Any]]
+        self._timer = None  # type: aio.Handle
+        self._tasks = set()  # type: Set[aio.Task]
+
+        # Stats
+        self.events = 0
+        self.batches = 0
+        self.errors = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    def add(self, event, done: Callable[[], Any] = None) -> None:
+        if len(self._events) >= self.max_size:
+            self.rejected += 1
+            raise aio.QueueFull()
+        self.events += 1
+        self._events.append(event)
+        if done is not None:
+            self._callbacks.append(done)
+
+        if len(self._events) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = aio.get_event_loop().call_later(self.max_delay, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._events or len(self._tasks) >= self.concurrency:
+            return
+
+        events, self._events = self._events, []
+        callbacks, self._callbacks = self._callbacks, []
+        self.batches += 1
+        task = aio.ensure_future(self._run(events, callbacks))
+        self._tasks.add(task)
+        task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: aio.Task) -> None:
+        self._tasks.discard(task)
+        # events without a timer wait for a free slot
+        if self._events and self._timer is None:
+            self.flush()
+
+    async def _run(self, events: List, callbacks: List[Callable[[], Any]]) -> None:
+        try:
+            await self.handler(events)
+        except Exception:
+            self.errors += 1
+            logger.exception('status batch of %d events failed', len(events))
+        finally:
+            for callback in callbacks:
+                callback()
+
+    async def close(self) -> None:
+        """ Flush buffered events and wait for running batches """
+        self.flush()
+        while self._tasks:
+            await aio.wait(list(self._tasks))
+            self.flush()
@@ -1,20 +1,34 @@
 import logging
+import time
 import asyncio as aio
-import re
 
-import aiohttp
 from aiohttp import web
 from viberbot import BotConfiguration
-from viberbot.api.viber_requests import ViberMessageRequest
-from viberbot.api.viber_requests import ViberRequest, create_request
 from urllib.parse import urlparse
 
 from aioviber.app import get_app
+from aioviber.batcher import StatusBatcher
+from aioviber.cache import Cache
 from aioviber.chat import Chat
+from aioviber.codec import JsonCodec, default_codec
+from aioviber.dedup import Dedup, callback_key
+from aioviber.dispatcher import Dispatcher, sender_id
 from aioviber.eventtype import EventType
+from aioviber.ingress import IngressQueue, QueueWorker
 
-from aioviber.api import Api
+from aioviber.api import Api, SessionConfig
 from aioviber.messagetype import MessageType
+from aioviber.metrics import Metrics
+from aioviber.middleware import read_payload
+from aioviber.router import CommandRouter
+from aioviber.outbox import Outbox
+from aioviber.ratelimit import RateLimiter
+from aioviber.request import Request
+from aioviber.pipeline import SendPipeline
+from aioviber.profiling import HANDLER, Profiler
+from aioviber.tracing import Tracer, attach, current_span, detach
+from aioviber.retry import RetryPolicy
+from aioviber.workers import Supervisor
 
 API_URL = "https://chatapi.viber.com/pa"
 USER_AGENT = "aioviber/1.0"
@@ -39,7 +53,22 @@ class Bot:
                  port: int = 8000,
                  loop: aio.AbstractEventLoop = None,
                  check_signature: bool = True,
-                 static_serve: bool = False) -> None:
+                 static_serve: bool = False,
+                 rate_limiter: RateLimiter = None,
+                 retry_policy: RetryPolicy = None,
+                 pipeline: SendPipeline = None,
+                 user_details_cache: Cache = None,
+                 session_config: SessionConfig = None,
+                 codec: JsonCodec = None,
+                 outbox: Outbox = None,
+                 dispatcher: Dispatcher = None,
+                 dedup: Dedup = None,
+                 viberbot_requests: bool = True,
+                 ingress: IngressQueue = None,
+                 metrics: Metrics = None,
+                 api_base_url: str = None,
+                 profiler: Profiler = None,
+                 tracer: Tracer = None) -> None:
         assert len(name) < 28, "Length of name should be shorty then 28 symbols"
         self.name = name
         self.avatar = avatar
@@ -52,35 +81,81 @@ class Bot:
         # Loop
         self.loop = aio.get_event_loop() if loop is None else loop
 
-        # Viber API
-        self._session = None
+        # JSON codec for webhook requests and api calls
+        self.codec = codec or default_codec()
+
+        # Viber API, client session is managed by api with app startup and cleanup
         self.api = Api(bot_configuration=BotConfiguration(
             name=self.name,
             avatar=self.avatar,
             auth_token=self.auth_token
-        ), session=self.session, loop=self.loop)
+        ), loop=self.loop,
+            rate_limiter=rate_limiter, retry_policy=retry_policy, pipeline=pipeline,
+            user_details_cache=user_details_cache, session_config=session_config,
+            codec=self.codec, outbox=outbox, metrics=metrics, base_url=api_base_url, profiler=profiler,
+            tracer=tracer)
 
         # Viber webhook
         self.webhook = webhook
         self.webhook_events = webhook_events
         self._set_webhook_on_startup = set_webhook_on_startup
         self._unset_webhook_on_cleanup = unset_webhook_on_cleanup
+        # False in worker processes, the webhook is managed by the primary process
+        self._webhook_owner = True
 
         def no_event_handle(event_type: str):
-            return lambda msg: logger.debug("no event handle for %s", event_type)
+            def handle(request):
+                logger.debug("no event handle for %s", event_type)
+
+            handle.noop = True
+            return handle
+
+        def no_message_handle(chat):
+            pass
 
-        def no_message_handle(message_type: str):
-            return lambda msg: logger.debug("no message handle for %s", message_type)
+        # messages without a handler are only logged, chat is not built for them
+        no_message_handle.noop = True
 
         # Callback — function for request processing messages excluded
         self._events_callbacks = {et: no_event_handle(et) for et in EventType.all()}
 
         # command — functions for processing text messages
-        self._commands = []
-        self._default_command = lambda chat: None
+        self._commands = CommandRouter()
+        self._default_command = no_message_handle
 
         # handle — functions for processing messages exclude text
-        self._handlers = {mt: no_message_handle(mt) for mt in MessageType.all()}
+        self._handlers = {mt: no_message_handle for mt in MessageType.all()}
+
+        # Workers for webhook requests processing, requests of one user are processed in order
+        self.dispatcher = dispatcher or Dispatcher(key=sender_id)
+
+        # Filter of callbacks re-sent by Viber
+        self.dedup = dedup
+
+        # Batch handler of delivered / seen / failed events, see `status_handler`
+        self.status_batcher = None  # type: StatusBatcher
+
+        # Queue of webhook bodies for worker processes, see `run_worker`
+        self.ingress = ingress
+
+        # Handlers get viberbot requests (compatible) or lightweight aioviber Request
+        self.viberbot_requests = viberbot_requests
+
+        # Metrics served on /metrics
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.gauge('aioviber_dispatcher_queued', 'Requests waiting for a worker',
+                          lambda: self.dispatcher.depth)
+            metrics.gauge('aioviber_handlers_in_flight', 'Requests being processed',
+                          lambda: self.dispatcher.active)
+            metrics.gauge('aioviber_pipeline_in_flight', 'Messages of send_messages being sent',
+                          lambda: self.api.pipeline.in_flight)
+
+        # Reports of slow handlers and api calls
+        self.profiler = profiler
+
+        # Traces of callbacks: webhook, handlers and api calls they make
+        self.tracer = tracer
 
         # Application
         self.check_signature = check_signature
@@ -88,15 +163,27 @@ class Bot:
 
     @property
     def session(self):
-        if not self._session:
-            self._session = aiohttp.ClientSession(loop=self.loop)
-        return self._session
+        return self.api.session
+
+    def _set_loop(self, loop: aio.AbstractEventLoop) -> None:
+        """ Switch bot to another loop, e.g. the own loop of a worker process """
+        self.loop = loop
+        self.api.loop = loop
+        self.api.pipeline.loop = loop
+        self.api.status_loader.loop = loop
 
     async def set_webhook_on_startup(self):
+        if not self._webhook_owner:
+            return
         await aio.sleep(3)  # waiting while api will be available
         logger.info('set web hook on startup %s', self.webhook)
         self.loop.create_task(self.api.set_webhook(self.webhook, self.webhook_events))
 
+    async def unset_webhook_on_cleanup(self):
+        if not self._webhook_owner:
+            return
+        await self.api.unset_webhook()
+
     def get_app(self, static_serve=False) -> web.Application:
         """
         Create aiohttp application for webhook handling
@@ -107,70 +194,176 @@ class Bot:
         webhook_path = urlparse(self.webhook).path
         app.router.add_post(webhook_path, self.webhook_handle)
 
+        app.on_startup.append(lambda a: a.bot.api.start())
+        app.on_startup.append(lambda a: a.bot.dispatcher.start())
+        app.on_cleanup.append(lambda a: a.bot.close_status_batcher())
+        app.on_cleanup.append(lambda a: a.bot.dispatcher.close())
+
         # viber webhooks registering
         if self._unset_webhook_on_cleanup:
-            app.on_cleanup.append(lambda a: a.bot.api.unset_webhook())
+            app.on_cleanup.append(lambda a: a.bot.unset_webhook_on_cleanup())
 
         if self._set_webhook_on_startup:
             app.on_startup.append(lambda a: a.bot.set_webhook_on_startup())
 
+        # after unset_webhook
+        app.on_cleanup.append(lambda a: a.bot.api.close())
+
         return app
 
     async def webhook_handle(self, request) -> web.Response:
-        data = await request.json()
-        viber_request = create_request(data)  # type: ViberRequest
+        if self.metrics is None and self.tracer is None:
+            return await self._handle_webhook(request)
 
-        t = self.loop.create_task(self._process_request(viber_request))
-        # TODO add error processing
+        start = time.perf_counter()
+        if self.tracer is None:
+            response = await self._handle_webhook(request)
+        else:
+            with self.tracer.span('webhook') as span:
+                response = await self._handle_webhook(request)
+                span.set('status', response.status)
+        if self.metrics is not None:
+            self.metrics.webhook_seconds.observe(time.perf_counter() - start, response.status)
+        return response
+
+    async def _handle_webhook(self, request) -> web.Response:
+        if self.ingress is not None:
+            # body is processed by worker processes
+            try:
+                await self.ingress.put(await request.read())
+            except aio.QueueFull:
+                logger.warning('ingress queue is full')
+                return web.Response(status=503)
+            return web.Response()
+
+        data = await read_payload(request, self.codec)
+        if self.tracer is not None:
+            self.tracer.bind_callback(current_span(), data)
+
+        key = callback_key(data) if self.dedup is not None else None
+        if key is not None:
+            if self.dedup.is_duplicate(key):
+                logger.debug('duplicate callback %s', key)
+                return web.Response()
+
+        if 'event' not in data:
+            logger.warning('request without event: %s', data)
+            return web.Response(status=400)
+
+        viber_request = Request(data)
+        accepted = False
+        try:
+            if not self._batch_status(viber_request):
+                await self.dispatcher.submit(viber_request, viber_request.event_type, self._process_request)
+            accepted = True
+        except aio.QueueFull:
+            logger.warning('queue is full, reject %s', viber_request.event_type)
+            return web.Response(status=503)
+        finally:
+            # Viber re-sends rejected callbacks, the retry should not be taken for a duplicate
+            if not accepted and key is not None:
+                self.dedup.forget(key)
 
         return web.Response()
 
-    async def _process_request(self, request: ViberRequest) -> None:
-        logger.debug('request: %s', str(request))
+    def _batch_status(self, request: Request, done=None) -> bool:
+        """
+        Pass status update to the batch handler, False when it should be
+        processed alone. Raises aio.QueueFull when the batcher is full.
+        """
+        if self.status_batcher is None or request.event_type not in EventType.message_status_update():
+            return False
+        self.status_batcher.add(self._handler_request(request), done)
+        return True
 
-        coro = None
+    async def close_status_batcher(self) -> None:
+        if self.status_batcher is not None:
+            await self.status_batcher.close()
 
-        # Process request with function from _events_callbacks
-        if request.event_type in EventType.all():
-            coro = self._events_callbacks[request.event_type](request)
+    def _handler_request(self, request: Request):
+        """ Request in the form handlers expect """
+        return request.to_viber_request() if self.viberbot_requests else request
 
-        # Process messages
-        if request.event_type == EventType.MESSAGE:
-            coro = self._process_message(request)
+    async def _process_request(self, request: Request) -> None:
+        logger.debug('request: %s', str(request))
 
-        if coro:
-            # TODO: add error processing
-            t = self.loop.create_task(coro)
+        if request.event_type == EventType.MESSAGE:
+            # Process messages
+            await self._process_message(request)
+        elif request.event_type in self._events_callbacks:
+            # Process request with function from _events_callbacks
+            callback = self._events_callbacks[request.event_type]
+            coro = callback(request if getattr(callback, 'noop', False) is True else self._handler_request(request))
+            if coro:
+                await self._run_handler(request.event_type, request.sender_id, coro)
+
+    async def _run_handler(self, label: str, sender: str, coro) -> None:
+        """ Await handler coroutine, its duration is recorded by label """
+        if self.profiler is not None:
+            coro = self.profiler.measure(HANDLER, label, sender, coro)
+        if self.tracer is not None:
+            coro = self.tracer.trace('handler', coro, handler=label, sender=sender or '')
+        if self.metrics is None:
+            await coro
+            return
+
+        start = time.perf_counter()
+        try:
+            await coro
+        finally:
+            self.metrics.handler_seconds.observe(time.perf_counter() - start, label)
 
-    async def _process_message(self, request: ViberMessageRequest) -> None:
+    async def _process_message(self, request: Request) -> None:
         logger.debug('_process_message %s', request)
 
-        if request.message._message_type == MessageType.TEXT:  # isinstance
+        args = ()
+        if request.message_type == MessageType.TEXT:
             # Process text messages by commands
-            for pattern, handler in self._commands:
-                matched = re.search(pattern, str(request.message.text), re.I)
-                if matched:
-                    return await handler(Chat(self.api, message=request), matched)
-            return await self._default_command(Chat(self.api, message=request))
+            routed = self._commands.match(str(request.text))
+            if routed is not None:
+                handler, matched = routed
+                label, args = matched.re.pattern, (matched,)
+            else:
+                label, handler = 'default', self._default_command
         else:
             # Process other messages types with _handlers
-            return await self._handlers[request.message._message_type](Chat(self.api, message=request))
+            label, handler = request.message_type, self._handlers[request.message_type]
 
-    def run(self) -> None:
-        web.run_app(self.app, host=self.host, port=self.port, loop=self.loop)
+        if getattr(handler, 'noop', False) is True:
+            logger.debug("no message handle for %s", label)
+            return
 
-    def __del__(self) -> None:
+        # handler request (viberbot request by default) is built only for a real handler
+        coro = handler(Chat(self.api, message=self._handler_request(request)), *args)
+        if coro:
+            await self._run_handler(label, request.sender_id, coro)
 
-        try:
-            self.session.close()
-        except AttributeError:
-            pass
+    def run(self, workers: int = 1, reuse_port: bool = None, health_port: int = None) -> None:
+        """
+        Serve the bot. With `workers` > 1 the bot is served by forked worker
+        processes on the same port, see `aioviber.workers.Supervisor`.
+        """
+        if workers == 1:
+            web.run_app(self.app, host=self.host, port=self.port, loop=self.loop)
+            return
+
+        Supervisor(self, workers, reuse_port=reuse_port, health_port=health_port).run()
+
+    def run_worker(self, prefetch: int = 100) -> None:
+        """
+        Process webhook bodies of the ingress queue until SIGINT / SIGTERM.
+        The worker runs in its own process with the same commands and
+        handlers as the bot serving the webhook.
+        """
+        assert self.ingress is not None, 'bot has no ingress queue'
+        worker = QueueWorker(self, self.ingress, prefetch=prefetch)
+        self.loop.run_until_complete(worker.run(handle_signals=True))
 
     def add_command(self, regexp, fn):
         """
         Register regexp based command for text messages processing
         """
-        self._commands.append((regexp, fn))
+        self._commands.add(regexp, fn)
 
     def default(self, coro):
         """
@@ -245,6 +438,35 @@ class Bot:
 
         return wrap
 
+    def status_handler(self, max_size: int = 500, max_delay: float = 1.0, concurrency: int = 4):
+        """
+        Set batch handler for message status updates:
+            - delivered
+            - seen
+            - failed
+        The handler gets a list of requests, up to max_size of them or the
+        ones received within max_delay seconds, at most `concurrency` lists
+        at once. Event handlers of these events are not called. Batches are
+        measured as the 'status' handler.
+        """
+
+        def decorator(coro):
+            assert aio.iscoroutinefunction(coro), 'Decorated function should be coroutine'
+
+            async def handle(requests) -> None:
+                # a batch holds callbacks of many traces, it starts a trace of its own
+                token = attach(None)
+                try:
+                    await self._run_handler('status', None, coro(requests))
+                finally:
+                    detach(token)
+
+            self.status_batcher = StatusBatcher(handle, max_size=max_size, max_delay=max_delay,
+                                                concurrency=concurrency)
+            return coro
+
+        return decorator
+
     def on_subscribed(self):
         def decorator(coro):
             assert aio.iscoroutinefunction(coro), 'function should be coroutine'
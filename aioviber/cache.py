@@ -0,0 +1,146 @@
+import asyncio as aio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from aioviber.sqlite import ProcessConnectionMixin
+
+MISSING = object()
+
+
+class CacheBackend:
+    """ Storage interface for Cache """
+
+    def get(self, key: str, default=MISSING) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """ In-memory LRU with per-entry TTL """
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        assert maxsize > 0, 'maxsize should be positive'
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # type: Dict[str, Tuple[float, Any]]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default=MISSING) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class SQLiteBackend(ProcessConnectionMixin, CacheBackend):
+    """
+    SQLite file backend, survives restarts. Values are stored as JSON.
+    Queries are tiny and local so they run synchronously on the loop.
+    """
+
+    def __init__(self, path: str, maxsize: int = 100000, table: str = 'aioviber_cache') -> None:
+        self.path = path
+        self.maxsize = maxsize
+        self.table = table
+        self._writes = 0
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT, expires REAL)'.format(table)
+        )
+
+    def get(self, key: str, default=MISSING) -> Any:
+        row = self._db.execute(
+            'SELECT value FROM {} WHERE key = ? AND expires >= ?'.format(self.table), (key, time.time())
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._db.execute(
+            'INSERT OR REPLACE INTO {} (key, value, expires) VALUES (?, ?, ?)'.format(self.table),
+            (key, json.dumps(value), time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.prune()
+
+    def delete(self, key: str) -> None:
+        self._db.execute('DELETE FROM {} WHERE key = ?'.format(self.table), (key,))
+
+    def prune(self) -> None:
+        """ Drop expired entries and the ones which expire first over maxsize """
+        self._db.execute('DELETE FROM {} WHERE expires < ?'.format(self.table), (time.time(),))
+        self._db.execute(
+            'DELETE FROM {table} WHERE key IN '
+            '(SELECT key FROM {table} ORDER BY expires DESC LIMIT -1 OFFSET ?)'.format(table=self.table),
+            (self.maxsize,)
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class Cache:
+    """
+    TTL cache with single-flight loading: while a key is being loaded all
+    callers asking for it wait for the same request.
+    """
+
+    def __init__(self, backend: CacheBackend = None, ttl: float = 12 * 60 * 60) -> None:
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self._in_flight = {}  # type: Dict[Hashable, aio.Future]
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable]) -> Any:
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._in_flight[key] = aio.ensure_future(self._load(key, load))
+        else:
+            self.shared += 1
+
+        # one cancelled caller should not cancel the load for the others
+        return await aio.shield(task)
+
+    async def _load(self, key: str, load: Callable[[], Awaitable]) -> Any:
+        try:
+            value = await load()
+            self.backend.set(key, value, self.ttl)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def invalidate(self, key: str) -> None:
+        self.backend.delete(key)
@@ -10,6 +10,7 @@ from viberbot.api.viber_requests import ViberMessageRequest
 
 from aioviber.api import Api
 from aioviber.keyboard import Keyboard, Carousel
+from aioviber.template import MessageTemplate
 
 
 class Chat:
@@ -29,10 +30,11 @@ class Chat:
             pass
         return sender
 
-    def send_messages(self, messages: List[Message]):
+    def send_messages(self, messages: List[Message], ordered: bool = True):
         return self.api.send_messages(
             to=self.sender.id,
-            messages=messages
+            messages=messages,
+            ordered=ordered
         )
 
     def send_message(self, message: Message):
@@ -41,6 +43,13 @@ class Chat:
             message=message
         )
 
+    def send_template(self, template: MessageTemplate, tracking_data: str = None):
+        return self.api.send_template(
+            to=self.sender.id,
+            template=template,
+            tracking_data=tracking_data
+        )
+
     def send_text(self, text: str, keyboard: Keyboard = None, min_api_version=None, tracking_data: str = None):
         return self.api.send_message(
             to=self.sender.id,
@@ -0,0 +1,40 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JsonCodec:
+    """ Stdlib json codec """
+    name = 'json'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        if isinstance(data, (bytes, bytearray)):
+            # json.loads takes bytes only since Python 3.6
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """ orjson codec, several times faster than stdlib """
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        assert orjson is not None, 'orjson is not installed'
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+def default_codec() -> JsonCodec:
+    """ orjson when it is installed, stdlib json otherwise """
+    return OrjsonCodec() if orjson is not None else JsonCodec()
@@ -0,0 +1,191 @@
+import hashlib
+import math
+import time
+from typing import Dict, Optional, Set
+
+from aioviber.sqlite import ProcessConnectionMixin
+
+
+class Dedup:
+    """
+    Interface of duplicate callbacks filter. Keys are remembered for at
+    least `window` seconds.
+    """
+
+    def __init__(self, window: float = 300) -> None:
+        self.window = window
+
+        # Stats
+        self.duplicates = 0
+
+    def is_duplicate(self, key: str) -> bool:
+        """ Remember key, True when it has been seen recently """
+        duplicate = self._check_and_add(key)
+        if duplicate:
+            self.duplicates += 1
+        return duplicate
+
+    def _check_and_add(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def seen(self, key: str) -> bool:
+        """ True when key has been seen recently, key is not remembered """
+        raise NotImplementedError
+
+    def add(self, key: str) -> None:
+        """ Remember key, e.g. once its callback is processed """
+        raise NotImplementedError
+
+    def forget(self, key: str) -> None:
+        """ Drop key, e.g. when its callback was rejected and will be re-sent """
+        raise NotImplementedError
+
+
+class _Rotating(Dedup):
+    """ Two generations, the older one is dropped every window seconds """
+
+    def __init__(self, window: float = 300) -> None:
+        super().__init__(window)
+        self._rotated = time.monotonic()
+        self._current = self._new()
+        self._previous = self._new()
+        # forgotten keys are new again, Bloom filters can not drop keys
+        self._forgotten = {}  # type: Dict[str, float]
+
+    def _new(self):
+        raise NotImplementedError
+
+    def _rotate(self) -> None:
+        now = time.monotonic()
+        if now - self._rotated < self.window:
+            return
+        # both generations are stale after two windows
+        self._previous = self._current if now - self._rotated < 2 * self.window else self._new()
+        self._current = self._new()
+        self._rotated = now
+        self._forgotten = {key: at for key, at in self._forgotten.items() if now - at < 2 * self.window}
+
+    def _check_and_add(self, key: str) -> bool:
+        self._rotate()
+        if self._forgotten.pop(key, None) is not None:
+            self._current.add(key)
+            return False
+        if key in self._current or key in self._previous:
+            return True
+        self._current.add(key)
+        return False
+
+    def seen(self, key: str) -> bool:
+        self._rotate()
+        return key not in self._forgotten and (key in self._current or key in self._previous)
+
+    def add(self, key: str) -> None:
+        self._rotate()
+        self._forgotten.pop(key, None)
+        self._current.add(key)
+
+    def forget(self, key: str) -> None:
+        self._forgotten[key] = time.monotonic()
+
+
+class MemoryDedup(_Rotating):
+    """ Exact filter on two rotating sets, memory is bounded by two windows of traffic """
+
+    def _new(self) -> Set[str]:
+        return set()
+
+
+class BloomFilter:
+    """ Bloom filter for `capacity` keys with false positive rate `error_rate` """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        assert capacity > 0, 'capacity should be positive'
+        assert 0 < error_rate < 1, 'error_rate should be in (0, 1)'
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.md5(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self._bits[p >> 3] |= 1 << (p & 7)
+
+
+class BloomDedup(_Rotating):
+    """
+    Filter on two rotating Bloom filters: fixed memory for `capacity` keys
+    per window, but a new key is taken for a duplicate with `error_rate`
+    probability (roughly doubled, as both generations are checked).
+    """
+
+    def __init__(self, window: float = 300, capacity: int = 100000, error_rate: float = 0.0001) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        super().__init__(window)
+
+    def _new(self) -> BloomFilter:
+        return BloomFilter(self.capacity, self.error_rate)
+
+
+class SQLiteDedup(ProcessConnectionMixin, Dedup):
+    """ Exact filter in a SQLite file shared by several processes """
+
+    def __init__(self, path: str, window: float = 300, table: str = 'aioviber_dedup') -> None:
+        super().__init__(window)
+        self.table = table
+        self.path = path
+        self._checks = 0
+        self._db.execute('CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, seen REAL)'.format(table))
+
+    def _check_and_add(self, key: str) -> bool:
+        now = time.time()
+        self._checks += 1
+        if self._checks % 1000 == 0:
+            self.prune(now)
+
+        cursor = self._db.execute(
+            'INSERT OR IGNORE INTO {} (key, seen) VALUES (?, ?)'.format(self.table), (key, now)
+        )
+        if cursor.rowcount == 1:
+            return False
+
+        # key is known, it is a duplicate only when seen within window
+        cursor = self._db.execute(
+            'UPDATE {} SET seen = ? WHERE key = ? AND seen < ?'.format(self.table), (now, key, now - self.window)
+        )
+        return cursor.rowcount == 0
+
+    def seen(self, key: str) -> bool:
+        row = self._db.execute(
+            'SELECT 1 FROM {} WHERE key = ? AND seen >= ?'.format(self.table), (key, time.time() - self.window)
+        ).fetchone()
+        return row is not None
+
+    def add(self, key: str) -> None:
+        self._db.execute('INSERT OR REPLACE INTO {} (key, seen) VALUES (?, ?)'.format(self.table), (key, time.time()))
+
+    def forget(self, key: str) -> None:
+        self._db.execute('DELETE FROM {} WHERE key = ?'.format(self.table), (key,))
+
+    def prune(self, now: float = None) -> None:
+        now = time.time() if now is None else now
+        self._db.execute('DELETE FROM {} WHERE seen < ?'.format(self.table), (now - self.window,))
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def callback_key(data: dict) -> Optional[str]:
+    """ Dedup key of a callback: event type and message_token, None when there is no token """
+    token = data.get('message_token')
+    if token is None:
+        return None
+    return '{}:{}'.format(data.get('event'), token)
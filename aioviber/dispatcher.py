@@ -0,0 +1,167 @@
+import asyncio as aio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, List
+
+from aioviber import tracing
+from aioviber.eventtype import EventType
+from aioviber.request import Request
+
+logger = logging.getLogger('aioviber.dispatcher')
+
+
+class Overflow:
+    block = 'block'  # wait for a free slot, webhook response is delayed
+    reject = 'reject'  # respond 503, Viber will re-send the callback
+    shed = 'shed'  # drop low priority events, reject the others
+
+    all = (block, reject, shed)
+
+
+def sender_id(request) -> str:
+    """ Id of the user a viber request is about, empty for webhook requests """
+    if isinstance(request, Request):
+        return request.sender_id or ''
+    for attr in ('sender', 'user'):
+        user = getattr(request, attr, None)
+        if user is not None:
+            return user.id
+    return getattr(request, 'user_id', None) or ''
+
+
+class Dispatcher:
+    """
+    Bounded worker pool for webhook requests processing: `workers`
+    coroutines take requests from a queue of `queue_size`. When the queue is
+    full the `overflow` policy decides what happens to a new request.
+    Exceptions of handlers are logged.
+
+    With `key` every worker gets its own lane — a queue of
+    queue_size / workers — and requests are put to a lane by a stable hash of
+    `key(request)`. Requests with the same key are processed one by one in
+    arrival order, different keys are processed in parallel across lanes.
+
+    Requests are processed by `handler` or by the handler passed to
+    `submit`, so one dispatcher can serve several bots. The tracing span
+    current at submit is current while the request is processed.
+
+    :param low_priority: event types which may be dropped with `shed` policy
+    :param key: function returning lane key of request, e.g. `sender_id`
+    """
+
+    def __init__(self,
+                 workers: int = 10,
+                 queue_size: int = 1000,
+                 overflow: str = Overflow.reject,
+                 low_priority: List[str] = None,
+                 key: Callable[[Any], str] = None) -> None:
+        assert workers > 0, 'workers should be positive'
+        assert overflow in Overflow.all, 'Wrong overflow policy'
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.low_priority = set(low_priority if low_priority is not None else [EventType.SEEN, EventType.DELIVERED])
+        self.key = key
+        self.handler = None  # type: Callable[[Any], Awaitable]
+
+        self._queues = []  # type: List[aio.Queue]
+        self._workers = []  # type: List[aio.Task]
+
+        # Stats
+        self.processed = 0
+        self.errors = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.active = 0
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'active': self.active,
+            'processed': self.processed,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        if self.key is None:
+            self._queues = [aio.Queue(self.queue_size)]
+            self._workers = [aio.ensure_future(self._work(self._queues[0])) for _ in range(self.workers)]
+        else:
+            lane_size = max(1, self.queue_size // self.workers)
+            self._queues = [aio.Queue(lane_size) for _ in range(self.workers)]
+            self._workers = [aio.ensure_future(self._work(queue)) for queue in self._queues]
+
+    async def close(self, timeout: float = 5) -> None:
+        """ Wait up to timeout for queued requests, then stop workers """
+        if not self.running:
+            return
+        try:
+            await aio.wait_for(aio.gather(*[queue.join() for queue in self._queues]), timeout)
+        except aio.TimeoutError:
+            logger.warning('dispatcher closed with %d queued requests', self.depth)
+
+        for worker in self._workers:
+            worker.cancel()
+        await aio.wait(self._workers)
+        self._workers = []
+
+    async def submit(self, request, event_type: str = None, handler: Callable[[Any], Awaitable] = None) -> bool:
+        """
+        Queue request for `handler`, dispatcher handler by default.
+        Returns False when it is dropped, raises aio.QueueFull when it is rejected.
+        """
+        handler = handler or self.handler
+        assert handler is not None, 'dispatcher has no handler'
+        if not self.running:
+            await self.start()
+
+        queue = self._lane(request)
+        item = (handler, request, tracing.current_span())
+        try:
+            queue.put_nowait(item)
+            return True
+        except aio.QueueFull:
+            if self.overflow == Overflow.block:
+                await queue.put(item)
+                return True
+
+            if self.overflow == Overflow.shed and event_type in self.low_priority:
+                self.dropped += 1
+                return False
+
+            self.rejected += 1
+            raise
+
+    def _lane(self, request) -> aio.Queue:
+        if self.key is None:
+            return self._queues[0]
+        key = self.key(request) or ''
+        return self._queues[zlib.crc32(key.encode('utf-8')) % len(self._queues)]
+
+    async def _work(self, queue: aio.Queue) -> None:
+        while True:
+            handler, request, span = await queue.get()
+            self.active += 1
+            token = tracing.attach(span)
+            try:
+                await handler(request)
+            except Exception:
+                self.errors += 1
+                logger.exception('request processing failed: %s', request)
+            finally:
+                tracing.detach(token)
+                self.active -= 1
+                self.processed += 1
+                queue.task_done()
@@ -0,0 +1,134 @@
+from typing import Dict, Type
+
+
+class ViberError(Exception):
+    """ Base class for aioviber errors """
+
+
+class InvalidMessageError(ViberError):
+    """ Message did not pass validation before sending """
+
+
+class ViberApiError(ViberError):
+    """
+    Viber API responded with non-zero status.
+    https://developers.viber.com/docs/api/rest-bot-api/#error-codes
+    """
+    status = None  # type: int
+    transient = False  # worth retrying
+
+    def __init__(self, result: dict) -> None:
+        self.result = result
+        self.status_message = result.get('status_message')
+        super().__init__("failed with result: {}".format(result))
+
+
+class InvalidUrlError(ViberApiError):
+    status = 1
+
+
+class InvalidAuthTokenError(ViberApiError):
+    status = 2
+
+
+class BadDataError(ViberApiError):
+    status = 3
+
+
+class MissingDataError(ViberApiError):
+    status = 4
+
+
+class ReceiverNotRegisteredError(ViberApiError):
+    status = 5
+
+
+class ReceiverNotSubscribedError(ViberApiError):
+    status = 6
+
+
+class PublicAccountBlockedError(ViberApiError):
+    status = 7
+
+
+class PublicAccountNotFoundError(ViberApiError):
+    status = 8
+
+
+class PublicAccountSuspendedError(ViberApiError):
+    status = 9
+
+
+class WebhookNotSetError(ViberApiError):
+    status = 10
+
+
+class ReceiverNoSuitableDeviceError(ViberApiError):
+    status = 11
+
+
+class TooManyRequestsError(ViberApiError):
+    status = 12
+    transient = True
+
+
+class ApiVersionNotSupportedError(ViberApiError):
+    status = 13
+
+
+class IncompatibleWithVersionError(ViberApiError):
+    status = 14
+
+
+class PublicAccountNotAuthorizedError(ViberApiError):
+    status = 15
+
+
+class InchatReplyMessageNotAllowedError(ViberApiError):
+    status = 16
+
+
+class PublicAccountIsNotInlineError(ViberApiError):
+    status = 17
+
+
+class NoPublicChatError(ViberApiError):
+    status = 18
+
+
+class CannotSendBroadcastError(ViberApiError):
+    status = 19
+
+
+class BroadcastNotAllowedError(ViberApiError):
+    status = 20
+
+
+class UnsupportedCountryError(ViberApiError):
+    status = 21
+
+
+class PaymentUnsupportedError(ViberApiError):
+    status = 22
+
+
+class FreeMessagesExceededError(ViberApiError):
+    status = 23
+
+
+class NoBalanceError(ViberApiError):
+    status = 24
+
+
+class GeneralError(ViberApiError):
+    """ Any other status code """
+    transient = True
+
+
+ERRORS = {
+    cls.status: cls for cls in ViberApiError.__subclasses__() if cls.status is not None
+}  # type: Dict[int, Type[ViberApiError]]
+
+
+def error_from_result(result: dict) -> ViberApiError:
+    return ERRORS.get(result.get('status'), GeneralError)(result)
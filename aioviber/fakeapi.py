@@ -0,0 +1,302 @@
+import argparse
+import asyncio as aio
+import itertools
+import json
+import math
+import random
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from aiohttp import web
+
+from aioviber.eventtype import EventType
+from aioviber.ratelimit import TokenBucket
+
+OK = {'status': 0, 'status_message': 'ok'}
+
+STATUS_MESSAGES = {
+    2: 'invalidAuthToken',
+    3: 'badData',
+    5: 'receiverNotRegistered',
+    6: 'receiverNotSubscribed',
+    12: 'tooManyRequests',
+}
+
+Observer = Callable[[str, dict], None]
+Latency = Union[float, Callable[[random.Random], float]]
+
+
+def constant(seconds: float) -> Latency:
+    return lambda rng: seconds
+
+
+def uniform(low: float, high: float) -> Latency:
+    return lambda rng: rng.uniform(low, high)
+
+
+def exponential(mean: float) -> Latency:
+    return lambda rng: rng.expovariate(1 / mean)
+
+
+def lognormal(median: float, sigma: float = 0.5) -> Latency:
+    """ Long tailed latency, half of the requests are faster than median """
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+class Faults:
+    """
+    Faults injected by FakeViberApi, shares are in [0, 1].
+
+    :param latency: seconds or a distribution, e.g. `lognormal(0.05)`
+    :param error_rate: share of requests answered with a status of `error_statuses`
+    :param throttle_rate: share of requests answered with status 12 tooManyRequests
+    :param max_rps: requests over this rate are answered with status 12
+    :param http_error_rate: share of requests answered with HTTP 500, 502 or 503
+    :param drop_rate: share of requests whose connection is closed without a response
+    :param seed: seed of the random generator for reproducible runs
+    """
+
+    def __init__(self,
+                 latency: Latency = 0,
+                 error_rate: float = 0,
+                 error_statuses: Tuple[int, ...] = (5, 6),
+                 throttle_rate: float = 0,
+                 max_rps: float = None,
+                 http_error_rate: float = 0,
+                 drop_rate: float = 0,
+                 seed: int = None) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.throttle_rate = throttle_rate
+        self.bucket = TokenBucket(max_rps) if max_rps else None
+        self.http_error_rate = http_error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+
+    def delay(self) -> float:
+        latency = self.latency
+        return max(0.0, latency(self.random) if callable(latency) else latency)
+
+    def throttled(self) -> bool:
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            return True
+        if self.bucket is not None:
+            if self.bucket.fill < 1:
+                return True
+            self.bucket.reserve()
+        return False
+
+
+NO_FAULTS = Faults()
+
+
+class FakeViberApi:
+    """
+    Stand-in for chatapi.viber.com serving `/pa/<endpoint>` for
+    benchmarks, load tests and tests. Responses have the shapes of the
+    Viber REST API; requests with a wrong auth token get status 2.
+    `faults` are injected into every endpoint, `endpoint_faults` override
+    them per endpoint. Observers are called with the endpoint and the
+    decoded body of every request answered with status 0.
+
+        fake = FakeViberApi(auth_token, faults=Faults(latency=lognormal(0.05), throttle_rate=0.01))
+        await fake.start()
+        api = Api(bot_configuration, base_url=fake.url)
+
+    Run it standalone with `python -m aioviber.fakeapi --help`.
+    """
+
+    def __init__(self,
+                 auth_token: str = None,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 faults: Faults = None,
+                 endpoint_faults: Dict[str, Faults] = None) -> None:
+        self.auth_token = auth_token
+        self.host = host
+        self.port = port
+        self.faults = faults or NO_FAULTS
+        self.endpoint_faults = endpoint_faults or {}
+        self.observers = []  # type: List[Observer]
+        self.requests = []  # type: List[Tuple[str, dict]]
+        self.keep_requests = True
+
+        self._tokens = itertools.count(5741311803571721087)
+        self._runner = None  # type: web.AppRunner
+        self.app = self.get_app()
+
+        # Stats
+        self.received = 0
+        self.errors = 0
+        self.throttled = 0
+        self.http_errors = 0
+        self.dropped = 0
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}/pa'.format(self.host, self.port)
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'errors': self.errors,
+            'throttled': self.throttled,
+            'http_errors': self.http_errors,
+            'dropped': self.dropped,
+        }
+
+    def get_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/pa/{endpoint}', self.handle)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.received += 1
+        endpoint = request.match_info['endpoint']
+        faults = self.endpoint_faults.get(endpoint, self.faults)
+
+        delay = faults.delay()
+        if delay:
+            await aio.sleep(delay)
+
+        rng = faults.random
+        if faults.drop_rate and rng.random() < faults.drop_rate:
+            self.dropped += 1
+            request.transport.close()
+            return web.Response()
+        if faults.http_error_rate and rng.random() < faults.http_error_rate:
+            self.http_errors += 1
+            return web.Response(status=rng.choice((500, 502, 503)))
+
+        try:
+            data = json.loads((await request.read()).decode('utf-8'))
+        except ValueError:
+            return self.error(3)
+
+        if self.auth_token is not None and data.get('auth_token') != self.auth_token:
+            return self.error(2)
+        if faults.throttled():
+            self.throttled += 1
+            return self.error(12)
+        if faults.error_rate and rng.random() < faults.error_rate:
+            self.errors += 1
+            return self.error(rng.choice(faults.error_statuses))
+
+        result = self.result(endpoint, data)
+        if result is None:
+            return self.error(3)
+
+        if self.keep_requests:
+            self.requests.append((endpoint, data))
+        for observer in self.observers:
+            observer(endpoint, data)
+        return self.response(result)
+
+    def result(self, endpoint: str, data: dict) -> Optional[dict]:
+        """ Successful result of endpoint, None for bad data """
+        if endpoint == 'send_message':
+            if 'receiver' not in data:
+                return None
+            return dict(OK, message_token=next(self._tokens), chat_hostname='SN-CHAT-01_')
+
+        if endpoint == 'broadcast_message':
+            if not data.get('broadcast_list'):
+                return None
+            return dict(OK, message_token=next(self._tokens), failed_list=[])
+
+        if endpoint == 'set_webhook':
+            if 'url' not in data:
+                return None
+            event_types = data.get('event_types') or [
+                EventType.DELIVERED, EventType.SEEN, EventType.FAILED, EventType.SUBSCRIBED,
+                EventType.UNSUBSCRIBED, EventType.CONVERSATION_STARTED,
+            ]
+            return dict(OK, event_types=event_types if data['url'] else [])
+
+        if endpoint == 'get_online':
+            ids = data.get('ids')
+            if not ids:
+                return None
+            return dict(OK, users=[self.online_status(user_id) for user_id in ids])
+
+        if endpoint == 'get_user_details':
+            if 'id' not in data:
+                return None
+            return dict(OK, message_token=next(self._tokens), user=self.user(data['id']))
+
+        if endpoint == 'get_account_info':
+            return dict(
+                OK, id='pa:75346594275468546724', name='account name', uri='accountUri',
+                icon='http://example.com', background='http://example.com', category='category',
+                subcategory='sub category', location={'lon': 0.1, 'lat': 0.2}, country='UK',
+                webhook='https://my.site.com', event_types=['delivered', 'seen'], subscribers_count=35,
+                members=[{'id': '01234567890A=', 'name': 'my name', 'avatar': 'http://example.com', 'role': 'admin'}],
+            )
+
+        return dict(OK)
+
+    @staticmethod
+    def online_status(user_id: str) -> dict:
+        # stable per user: a third of users is online
+        if sum(map(ord, user_id)) % 3 == 0:
+            return {'id': user_id, 'online_status': 0, 'online_status_message': 'online'}
+        return {'id': user_id, 'online_status': 1, 'online_status_message': 'offline',
+                'last_online': 1457764197627}
+
+    @staticmethod
+    def user(user_id: str) -> dict:
+        return {
+            'id': user_id, 'name': 'John McClane', 'avatar': 'http://avatar.example.com',
+            'country': 'UK', 'language': 'en', 'primary_device_os': 'Android 7.1',
+            'api_version': 1, 'viber_version': '6.5.0', 'mcc': 1, 'mnc': 1, 'device_type': 'iPhone9,4',
+        }
+
+    @staticmethod
+    def response(result: dict) -> web.Response:
+        return web.Response(text=json.dumps(result), content_type='application/json')
+
+    def error(self, status: int) -> web.Response:
+        return self.response({'status': status, 'status_message': STATUS_MESSAGES.get(status, 'generalError')})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fake Viber REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--auth-token')
+    parser.add_argument('--latency', type=float, default=0, help='median latency, seconds')
+    parser.add_argument('--sigma', type=float, default=0.5, help='lognormal sigma of latency')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--max-rps', type=float)
+    parser.add_argument('--http-error-rate', type=float, default=0)
+    parser.add_argument('--drop-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    faults = Faults(
+        latency=lognormal(args.latency, args.sigma) if args.latency else 0,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, max_rps=args.max_rps,
+        http_error_rate=args.http_error_rate, drop_rate=args.drop_rate, seed=args.seed,
+    )
+    fake = FakeViberApi(args.auth_token, host=args.host, port=args.port, faults=faults)
+    fake.keep_requests = False
+    print('Fake Viber API on {}'.format(fake.url))
+    web.run_app(fake.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import asyncio as aio
+import logging
+from typing import Dict
+from urllib.parse import urlparse
+
+import aiohttp
+from aiohttp import web
+
+from aioviber.api import SessionConfig
+from aioviber.app import ping
+from aioviber.bot import Bot
+from aioviber.dispatcher import Dispatcher, sender_id
+from aioviber.middleware import signature_middleware
+
+logger = logging.getLogger('aioviber.hub')
+
+
+class BotHub:
+    """
+    Many bots served by one aiohttp application on one port. Bots are
+    mounted by the path of their webhook and share one client session
+    (connection pool) and one dispatcher (worker pool). Every bot keeps its
+    own auth token for signature checks, its own rate limiter, retry policy,
+    cache and outbox.
+
+    Bots should be added before the application is started:
+
+        hub = BotHub(port=8000)
+        hub.add(Bot(name='first', webhook='https://example.com/first', ...))
+        hub.add(Bot(name='second', webhook='https://example.com/second', ...))
+        hub.run()
+    """
+
+    def __init__(self,
+                 host: str = '0.0.0.0',
+                 port: int = 8000,
+                 loop: aio.AbstractEventLoop = None,
+                 session_config: SessionConfig = None,
+                 dispatcher: Dispatcher = None) -> None:
+        self.host = host
+        self.port = port
+        self.loop = aio.get_event_loop() if loop is None else loop
+
+        # Shared client session, created on startup
+        self.session_config = session_config or SessionConfig()
+        self.session = None  # type: aiohttp.ClientSession
+
+        # Shared workers, requests of one user are processed in order
+        self.dispatcher = dispatcher or Dispatcher(key=sender_id)
+
+        self.bots = {}  # type: Dict[str, Bot]
+        self.app = self.get_app()
+
+    def __len__(self) -> int:
+        return len(self.bots)
+
+    def add(self, bot: Bot) -> Bot:
+        """ Mount bot on the path of its webhook """
+        path = urlparse(bot.webhook).path
+        assert path not in self.bots, 'webhook path {} is already taken'.format(path)
+
+        bot.dispatcher = self.dispatcher
+        bot.api.session = self.session
+        bot.api._owns_session = False
+
+        self.bots[path] = bot
+        self.app.router.add_post(path, bot.webhook_handle)
+        return bot
+
+    def get_app(self) -> web.Application:
+        app = web.Application(middlewares=[signature_middleware])
+        app.router.add_get('/ping', ping)
+        app.bots = self.bots
+        app.hub = self
+
+        app.on_startup.append(lambda a: a.hub.start())
+        app.on_cleanup.append(lambda a: a.hub.close())
+        return app
+
+    async def start(self) -> None:
+        if self.session is None:
+            self.session = self.session_config.create_session()
+        for bot in self.bots.values():
+            bot.api.session = self.session
+            await bot.api.start()
+        await self.dispatcher.start()
+
+        await aio.gather(*[
+            bot.set_webhook_on_startup() for bot in self.bots.values() if bot._set_webhook_on_startup
+        ])
+
+    async def close(self) -> None:
+        for bot in self.bots.values():
+            await bot.close_status_batcher()
+        await self.dispatcher.close()
+
+        results = await aio.gather(*[
+            bot.unset_webhook_on_cleanup() for bot in self.bots.values() if bot._unset_webhook_on_cleanup
+        ], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning('unset webhook failed: %r', result)
+
+        # bots close their outboxes, the session is owned by hub
+        for bot in self.bots.values():
+            await bot.api.close()
+            bot.api.session = None
+
+        if self.session is not None:
+            session, self.session = self.session, None
+            await session.close()
+
+    def run(self) -> None:
+        web.run_app(self.app, host=self.host, port=self.port, loop=self.loop)
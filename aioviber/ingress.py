@@ -0,0 +1,248 @@
+import asyncio as aio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Any, Optional, Set, Tuple
+
+from aioviber.dedup import callback_key
+from aioviber.request import Request
+from aioviber.sqlite import BatchWriter, ProcessConnectionMixin, transaction
+from aioviber.tracing import current_span
+
+logger = logging.getLogger('aioviber.ingress')
+
+Item = Tuple[Any, bytes]  # ack token and raw webhook body
+
+
+class IngressQueue:
+    """
+    Queue of raw webhook bodies between the ingress, which only checks
+    signatures and puts bodies, and worker processes running handlers.
+    """
+
+    async def put(self, payload: bytes) -> None:
+        """ Append body, raises aio.QueueFull when the queue is full """
+        raise NotImplementedError
+
+    async def get(self, timeout: float) -> Optional[Item]:
+        """ Next body with its ack token, None when there is none within timeout """
+        raise NotImplementedError
+
+    def ack(self, token) -> None:
+        """ Body is processed and may be forgotten """
+
+    def close(self) -> None:
+        pass
+
+
+class ProcessQueue(IngressQueue):
+    """
+    multiprocessing queue, for an ingress and workers forked from one
+    process. It should be created before the fork. Bodies in the queue are
+    lost with the processes.
+    """
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        self._queue = multiprocessing.Queue(maxsize)
+
+    async def put(self, payload: bytes) -> None:
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            raise aio.QueueFull()
+
+    async def get(self, timeout: float) -> Optional[Item]:
+        loop = aio.get_event_loop()
+        try:
+            payload = await loop.run_in_executor(None, self._queue.get, True, timeout)
+        except queue.Empty:
+            return None
+        return None, payload
+
+    def close(self) -> None:
+        self._queue.close()
+
+
+class SQLiteQueue(ProcessConnectionMixin, IngressQueue):
+    """
+    Durable queue in a SQLite file (WAL mode) shared by any processes on
+    the host. Bodies put within one loop iteration are written in one
+    transaction, `put` returns once the body is written. A body is deleted
+    when it is acked; a body taken by a worker which did not ack it within
+    `visibility_timeout` seconds is given out again, so processing is
+    at-least-once.
+    """
+    _synchronous = 'NORMAL'
+
+    def __init__(self,
+                 path: str,
+                 visibility_timeout: float = 60,
+                 poll_interval: float = 0.05,
+                 table: str = 'aioviber_ingress') -> None:
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.table = table
+
+        self._writer = BatchWriter(
+            lambda: self._db, 'INSERT INTO {} (payload) VALUES (?)'.format(table),
+            'DELETE FROM {} WHERE id = ?'.format(table), name='ingress queue'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'payload BLOB, visible REAL DEFAULT 0)'.format(table)
+        )
+
+    @property
+    def depth(self) -> int:
+        """ Queued bodies, including the ones taken but not acked """
+        self._writer.flush()
+        return self._db.execute('SELECT count(*) FROM {}'.format(self.table)).fetchone()[0]
+
+    async def put(self, payload: bytes) -> None:
+        await self._writer.insert(payload)
+
+    def ack(self, token: int) -> None:
+        self._writer.delete(token)
+
+    def _claim(self) -> Optional[Item]:
+        self._writer.flush()
+        now = time.time()
+        with transaction(self._db) as db:
+            row = db.execute(
+                'SELECT id, payload FROM {} WHERE visible <= ? ORDER BY id LIMIT 1'.format(self.table), (now,)
+            ).fetchone()
+            if row is not None:
+                db.execute('UPDATE {} SET visible = ? WHERE id = ?'.format(self.table),
+                           (now + self.visibility_timeout, row[0]))
+        return row
+
+    async def get(self, timeout: float) -> Optional[Item]:
+        expires = time.monotonic() + timeout
+        while True:
+            row = self._claim()
+            if row is not None:
+                return row[0], bytes(row[1])
+            if time.monotonic() >= expires:
+                return None
+            await aio.sleep(self.poll_interval)
+
+    def close(self) -> None:
+        self._writer.close()
+        self._close_db()
+
+
+class QueueWorker:
+    """
+    Worker side of an ingress queue: takes bodies, decodes them, drops
+    duplicates with bot dedup and processes them with the bot dispatcher.
+    At most `prefetch` bodies are taken and not yet processed, a body is
+    acked once its handlers are done. Dedup keys are recorded then too, so
+    a body of a crashed worker is processed again when it is given out.
+    """
+
+    def __init__(self, bot, ingress: IngressQueue, prefetch: int = 100, poll_timeout: float = 0.5) -> None:
+        assert prefetch > 0, 'prefetch should be positive'
+        self.bot = bot
+        self.ingress = ingress
+        self.prefetch = prefetch
+        self.poll_timeout = poll_timeout
+
+        self._slots = None  # type: aio.Semaphore
+        self._stop = None  # type: aio.Event
+        self._processing = set()  # type: Set[str]  # dedup keys of bodies being processed
+
+        # Stats
+        self.received = 0
+        self.invalid = 0
+        self.duplicates = 0
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+
+    def _install_signal_handlers(self) -> None:
+        loop = aio.get_event_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):  # not in the main thread
+                pass
+
+    async def run(self, handle_signals: bool = False) -> None:
+        """ Process bodies until `stop`, then wait for taken ones """
+        self._slots = aio.Semaphore(self.prefetch)
+        self._stop = aio.Event()
+        if handle_signals:
+            self._install_signal_handlers()
+
+        bot = self.bot
+        await bot.api.start()
+        await bot.dispatcher.start()
+        try:
+            while not self._stop.is_set():
+                await self._slots.acquire()
+                item = await self.ingress.get(self.poll_timeout)
+                if item is None:
+                    self._slots.release()
+                    continue
+                if bot.tracer is None:
+                    await self._submit(*item)
+                else:
+                    with bot.tracer.span('ingress'):
+                        await self._submit(*item)
+        finally:
+            await bot.close_status_batcher()
+            await bot.dispatcher.close()
+            await bot.api.close()
+
+    async def _submit(self, token, payload: bytes) -> None:
+        self.received += 1
+        bot = self.bot
+        try:
+            data = bot.codec.loads(payload)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'event' not in data:
+            logger.warning('invalid request body: %r', payload[:100])
+            self.invalid += 1
+            return self._done(token)
+        if bot.tracer is not None:
+            bot.tracer.bind_callback(current_span(), data)
+
+        key = callback_key(data) if bot.dedup is not None else None
+        if key is not None:
+            if key in self._processing or bot.dedup.seen(key):
+                self.duplicates += 1
+                return self._done(token)
+            self._processing.add(key)
+
+        def done() -> None:
+            if key is not None:
+                self._processing.discard(key)
+                bot.dedup.add(key)
+            self._done(token)
+
+        async def handle(request: Request) -> None:
+            try:
+                await bot._process_request(request)
+            finally:
+                done()
+
+        request = Request(data)
+        while True:
+            try:
+                if bot._batch_status(request, done):
+                    return
+                if not await bot.dispatcher.submit(request, request.event_type, handle):
+                    done()  # shed
+                return
+            except aio.QueueFull:
+                # the body is already acked to Viber, wait for a free lane or batch instead of rejecting
+                await aio.sleep(0.01)
+
+    def _done(self, token) -> None:
+        self.ingress.ack(token)
+        self._slots.release()
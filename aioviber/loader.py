@@ -0,0 +1,75 @@
+import asyncio as aio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+BatchFn = Callable[[List], Awaitable[Dict[Hashable, Any]]]
+
+
+class BatchLoader:
+    """
+    DataLoader style batcher: keys requested with `load` within `delay`
+    seconds are merged into one `batch_fn(keys)` call of at most
+    `max_batch_size` keys. `batch_fn` returns a mapping key -> value, every
+    awaiter gets the value for its key; concurrent loads of the same key
+    share one future.
+    """
+
+    def __init__(self,
+                 batch_fn: BatchFn,
+                 max_batch_size: int = 100,
+                 delay: float = 0.005,
+                 loop: aio.AbstractEventLoop = None) -> None:
+        assert max_batch_size > 0, 'max_batch_size should be positive'
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.delay = delay
+        self.loop = loop
+
+        self._batch = OrderedDict()  # type: Dict[Hashable, aio.Future]
+        self._timer = None  # type: aio.Handle
+
+        # Stats
+        self.loads = 0
+        self.batches = 0
+
+    def load(self, key: Hashable) -> aio.Future:
+        loop = self.loop or aio.get_event_loop()
+        self.loads += 1
+
+        future = self._batch.get(key)
+        if future is None:
+            future = self._batch[key] = loop.create_future()
+            if len(self._batch) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.delay, self._dispatch)
+
+        # callers of one key share the future, a cancelled caller should not cancel it for the others
+        return aio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._batch = self._batch, OrderedDict()
+        if batch:
+            self.batches += 1
+            (self.loop or aio.get_event_loop()).create_task(self._run(batch))
+
+    async def _run(self, batch: Dict[Hashable, aio.Future]) -> None:
+        try:
+            results = await self.batch_fn(list(batch.keys()))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, future in batch.items():
+            if future.done():
+                continue
+            if key in results:
+                future.set_result(results[key])
+            else:
+                future.set_exception(KeyError(key))
@@ -0,0 +1,144 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{{{}}}'.format(','.join(pairs)) if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None  # type: str
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.values = {}  # type: Dict[Tuple, float]
+
+    def inc(self, *labels, value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self) -> List[str]:
+        return ['{}{} {}'.format(self.name, _labels(self.labels, key), _number(value))
+                for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """ Gauge set by code, or read from `fn` on every render """
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float] = None) -> None:
+        super().__init__(name, help)
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, value: float = 1) -> None:
+        self.value += value
+
+    def dec(self, value: float = 1) -> None:
+        self.value -= value
+
+    def samples(self) -> List[str]:
+        value = self.fn() if self.fn is not None else self.value
+        return ['{} {}'.format(self.name, _number(value))]
+
+
+class Histogram(Metric):
+    """ Histogram with fixed buckets, an observation is a bisect and two additions """
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # type: Dict[Tuple, list]  # bucket counts, +Inf count last, then sum
+
+    def observe(self, value: float, *labels) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                le = 'le="{}"'.format(bound if bound == '+Inf' else _number(float(bound)))
+                lines.append('{}_bucket{} {}'.format(self.name, _labels(self.labels, key, le), total))
+            lines.append('{}_sum{} {}'.format(self.name, _labels(self.labels, key), _number(counts[-1])))
+            lines.append('{}_count{} {}'.format(self.name, _labels(self.labels, key), total))
+        return lines
+
+
+class Metrics:
+    """
+    Metrics of a bot, rendered in Prometheus text format by `render` and
+    served on /metrics when passed to `Bot(metrics=Metrics())`. Recording is
+    plain arithmetic on dicts, so it can be left on under full load.
+
+    - aioviber_api_request_seconds{endpoint} — Viber API request latency,
+      every attempt, rate limiter wait excluded
+    - aioviber_api_responses_total{endpoint,status} — Viber status codes,
+      exception name for failed requests
+    - aioviber_api_requests_in_flight
+    - aioviber_handler_seconds{handler} — handler duration by command
+      pattern, message type or event type
+    - aioviber_webhook_seconds{status} — webhook response latency
+    - gauges registered with `gauge`, e.g. queue depths
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.api_seconds = Histogram(
+            'aioviber_api_request_seconds', 'Viber API request latency', ['endpoint'], buckets)
+        self.api_responses = Counter(
+            'aioviber_api_responses_total', 'Viber API responses by status', ['endpoint', 'status'])
+        self.api_in_flight = Gauge(
+            'aioviber_api_requests_in_flight', 'Viber API requests in flight')
+        self.handler_seconds = Histogram(
+            'aioviber_handler_seconds', 'Handler duration', ['handler'], buckets)
+        self.webhook_seconds = Histogram(
+            'aioviber_webhook_seconds', 'Webhook response latency', ['status'], buckets)
+
+        self._metrics = [
+            self.api_seconds, self.api_responses, self.api_in_flight, self.handler_seconds, self.webhook_seconds
+        ]  # type: List[Metric]
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        """ Register gauge read from fn on every render """
+        gauge = Gauge(name, help, fn)
+        self._metrics.append(gauge)
+        return gauge
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
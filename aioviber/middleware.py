@@ -1,32 +1,78 @@
 import hmac
 import hashlib
+from functools import lru_cache
 
 import logging
 from aiohttp import web
 from aiohttp.web_request import Request
 
+from aioviber.codec import JsonCodec
+
 logger = logging.getLogger(__name__)
 
+PAYLOAD_KEY = 'aioviber_payload'
+
+
+class SignatureVerifier:
+    """ HMAC-SHA256 signer with the key state prepared once per auth token """
+
+    def __init__(self, auth_token: str) -> None:
+        self._hmac = hmac.new(auth_token.encode('ascii'), digestmod=hashlib.sha256)
+
+    def signature(self, message: bytes) -> str:
+        signer = self._hmac.copy()
+        signer.update(message)
+        return signer.hexdigest()
+
+    def verify(self, message: bytes, signature: str) -> bool:
+        if not signature:
+            return False
+        # constant time compare
+        return hmac.compare_digest(self.signature(message).encode('ascii'), signature.encode('utf-8'))
+
+
+@lru_cache(maxsize=128)
+def get_verifier(auth_token: str) -> SignatureVerifier:
+    return SignatureVerifier(auth_token)
+
 
 def calculate_message_signature(message, auth_token):
-    return hmac.new(
-        bytes(auth_token.encode('ascii')),
-        msg=message,
-        digestmod=hashlib.sha256).hexdigest()
+    return get_verifier(auth_token).signature(message)
 
 
 def verify_signature(request_data, signature, auth_token):
-    return signature == calculate_message_signature(request_data, auth_token)
+    return get_verifier(auth_token).verify(request_data, signature)
+
+
+async def read_payload(request: Request, codec: JsonCodec) -> dict:
+    """
+    Decoded JSON body of request. The body is read once (aiohttp keeps the
+    bytes checked by signature_middleware) and decoded once, the payload is
+    stored on request for the next stages.
+    """
+    payload = request.get(PAYLOAD_KEY)
+    if payload is None:
+        payload = request[PAYLOAD_KEY] = codec.loads(await request.read())
+    return payload
+
+
+def request_bot(app, request: Request):
+    """ Bot the request is addressed to, BotHub apps find it by webhook path """
+    bots = getattr(app, 'bots', None)
+    if bots is not None:
+        return bots.get(request.path)
+    return app.bot
 
 
 async def signature_middleware(app, handler):
     """Check request signature"""
 
     async def middleware_handler(request: Request):
-        if request.method == 'POST' and app.bot.check_signature:
+        bot = request_bot(app, request) if request.method == 'POST' else None
+        if bot is not None and bot.check_signature:
             sig = request.query.get('sig')
             body = await request.read()
-            if verify_signature(body, sig, app.bot.auth_token):
+            if verify_signature(body, sig, bot.auth_token):
                 response = await handler(request)
             else:
                 logger.warning('Post requests with bad signature {sig} {body}'.format(
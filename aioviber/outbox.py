@@ -0,0 +1,177 @@
+import asyncio as aio
+import logging
+import time
+from typing import Set
+
+from aioviber.retry import RetryPolicy
+from aioviber.sqlite import BatchWriter, ProcessConnectionMixin, transaction
+
+logger = logging.getLogger('aioviber.outbox')
+
+
+class Outbox(ProcessConnectionMixin):
+    """
+    Durable queue of outbound api requests in a SQLite file (WAL mode).
+
+    `put` appends a request; requests put within one loop iteration are
+    written in one transaction. A background worker sends queued requests
+    with at most `concurrency` in flight and deletes an entry only after
+    Viber accepted it, so delivery is at-least-once across restarts.
+    Failures retryable by `retry_policy` are rescheduled with backoff,
+    the others are dropped and logged. Order is not preserved.
+
+    Several processes (e.g. `Bot.run(workers=N)`) may drain one file:
+    entries are claimed in a transaction and hidden from the others for
+    `lease_timeout` seconds, an entry of a process which died while sending
+    it is sent again once the lease expires.
+
+    Bind it to api with `Api(outbox=Outbox('outbox.db'))`, it is started
+    and closed together with the api.
+    """
+    _synchronous = 'NORMAL'
+
+    def __init__(self,
+                 path: str,
+                 concurrency: int = 10,
+                 batch_size: int = 100,
+                 poll_interval: float = 1.0,
+                 retry_policy: RetryPolicy = None,
+                 lease_timeout: float = 300) -> None:
+        assert concurrency > 0, 'concurrency should be positive'
+        self.path = path
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_policy = retry_policy or RetryPolicy(attempts=10, backoff=1, max_backoff=60)
+        self.lease_timeout = lease_timeout
+        self.api = None
+
+        self._writer = BatchWriter(
+            lambda: self._db, 'INSERT INTO outbox (endpoint, body) VALUES (?, ?)',
+            'DELETE FROM outbox WHERE id = ?', name='outbox'
+        )
+        self._wakeup = None  # type: aio.Event
+        self._semaphore = None  # type: aio.Semaphore
+        self._worker = None  # type: aio.Task
+        self._sending = set()  # type: Set[aio.Task]
+        self._claimed = set()  # type: Set[int]  # leased entries without outcome
+
+        # Stats
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _connected(self) -> None:
+        # leases of the parent process are not ours
+        self._claimed = set()
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, endpoint TEXT, body BLOB, '
+            'attempts INTEGER DEFAULT 0, next_attempt REAL DEFAULT 0)'
+        )
+
+    async def start(self) -> None:
+        assert self.api is not None, 'outbox is not bound to api'
+        self._wakeup = aio.Event()
+        self._semaphore = aio.Semaphore(self.concurrency)
+        self._worker = aio.ensure_future(self._drain())
+
+    async def close(self) -> None:
+        """ Stop sending, requests being sent stay in the queue and are due at once """
+        tasks = list(self._sending)
+        if self._worker is not None:
+            tasks.append(self._worker)
+            self._worker = None
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await aio.wait(tasks)
+
+        if self._db_open:
+            self._writer.close()
+            if self._claimed:
+                with transaction(self._db):
+                    self._db.executemany('UPDATE outbox SET next_attempt = 0 WHERE id = ?',
+                                         [(i,) for i in self._claimed])
+                self._claimed.clear()
+            self._close_db()
+
+    @property
+    def depth(self) -> int:
+        """ Queued requests, including the ones being sent """
+        self._writer.flush()
+        return self._db.execute('SELECT count(*) FROM outbox').fetchone()[0]
+
+    async def put(self, endpoint: str, data: dict) -> int:
+        """ Append request and wait until it is written, returns entry id """
+        entry_id = await self._writer.insert(endpoint, self.api.codec.dumps(data))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return entry_id
+
+    def _claim(self) -> list:
+        """ Take due entries, they are not due for anyone until the lease expires """
+        now = time.time()
+        with transaction(self._db):
+            rows = self._db.execute(
+                'SELECT id, endpoint, body, attempts FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?',
+                (now, self.batch_size)
+            ).fetchall()
+            self._db.executemany('UPDATE outbox SET next_attempt = ? WHERE id = ?',
+                                 [(now + self.lease_timeout, row[0]) for row in rows])
+        self._claimed.update(row[0] for row in rows)
+        return rows
+
+    async def _drain(self) -> None:
+        while True:
+            try:
+                await self._drain_step()
+            except aio.CancelledError:
+                raise
+            except Exception:
+                # e.g. the database is locked by another process, entries are claimed on the next step
+                logger.exception('outbox drain failed, retry in %ss', self.poll_interval)
+                await aio.sleep(self.poll_interval)
+
+    async def _drain_step(self) -> None:
+        rows = self._claim()
+        if not rows:
+            self._wakeup.clear()
+            try:
+                await aio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except aio.TimeoutError:
+                pass
+            return
+
+        for row in rows:
+            await self._semaphore.acquire()
+            task = aio.ensure_future(self._send(*row))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, entry_id: int, endpoint: str, body: bytes, attempts: int) -> None:
+        try:
+            await self.api._make_request(endpoint, self.api.codec.loads(body))
+        except aio.CancelledError:
+            raise
+        except Exception as e:
+            attempts += 1
+            if attempts < self.retry_policy.attempts and self.retry_policy.is_retryable(e):
+                self.retried += 1
+                self._db.execute(
+                    'UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?',
+                    (attempts, time.time() + self.retry_policy.delay(attempts), entry_id)
+                )
+                self._claimed.discard(entry_id)
+            else:
+                self.failed += 1
+                logger.error('outbox entry %d dropped after %d attempts: %r', entry_id, attempts, e)
+                self._claimed.discard(entry_id)
+                self._writer.delete(entry_id)
+        else:
+            self.sent += 1
+            self._claimed.discard(entry_id)
+            self._writer.delete(entry_id)
+        finally:
+            # sent entries are leased until their delete is flushed, so they are not claimed again meanwhile
+            self._semaphore.release()
@@ -0,0 +1,83 @@
+import asyncio as aio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+Send = Callable[[str, Any], Awaitable]
+
+
+class _Lane:
+    __slots__ = ('queue', 'in_flight')
+
+    def __init__(self) -> None:
+        self.queue = deque()  # type: Deque[Tuple[Send, Any, aio.Future]]
+        self.in_flight = 0
+
+
+class SendPipeline:
+    """
+    Outbound send pipeline: messages to one receiver are sent in submission
+    order, while different receivers are served concurrently.
+
+    :param per_receiver: sends in flight per receiver. 1 keeps strict
+        ordering — next message goes only after the previous one is accepted
+        by Viber; bigger values keep only the order of the requests start.
+    :param concurrency: sends in flight over all receivers
+    """
+
+    def __init__(self, loop: aio.AbstractEventLoop = None, per_receiver: int = 1, concurrency: int = 100) -> None:
+        assert per_receiver > 0, 'per_receiver should be positive'
+        assert concurrency > 0, 'concurrency should be positive'
+        self.loop = loop
+        self.per_receiver = per_receiver
+        self.concurrency = concurrency
+        self._lanes = {}  # type: Dict[str, _Lane]
+        self._semaphore = None  # type: aio.Semaphore
+
+    @property
+    def in_flight(self) -> int:
+        return sum(lane.in_flight for lane in self._lanes.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(len(lane.queue) for lane in self._lanes.values())
+
+    def submit(self, send: Send, to: str, message) -> aio.Future:
+        """ Schedule `send(to, message)`, future is resolved with its result """
+        loop = self.loop or aio.get_event_loop()
+        if self._semaphore is None:
+            self._semaphore = aio.Semaphore(self.concurrency)
+
+        lane = self._lanes.get(to)
+        if lane is None:
+            lane = self._lanes[to] = _Lane()
+
+        future = loop.create_future()
+        lane.queue.append((send, message, future))
+        self._pump(loop, to, lane)
+        return future
+
+    async def send_messages(self, send: Send, to: str, messages: list) -> List:
+        return await aio.gather(*[self.submit(send, to, message) for message in messages])
+
+    def _pump(self, loop: aio.AbstractEventLoop, to: str, lane: _Lane) -> None:
+        while lane.queue and lane.in_flight < self.per_receiver:
+            send, message, future = lane.queue.popleft()
+            lane.in_flight += 1
+            loop.create_task(self._run(loop, to, lane, send, message, future))
+
+    async def _run(self, loop, to: str, lane: _Lane, send: Send, message, future: aio.Future) -> None:
+        try:
+            async with self._semaphore:
+                result = await send(to, message)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            lane.in_flight -= 1
+            if lane.queue:
+                self._pump(loop, to, lane)
+            elif not lane.in_flight:
+                del self._lanes[to]
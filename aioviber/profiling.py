@@ -0,0 +1,136 @@
+import asyncio as aio
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger('aioviber.profiling')
+
+HANDLER = 'handler'  # command, message and event handlers
+API = 'api'  # Viber API calls, retries included
+
+_profiling = False  # cProfile can profile one call at a time
+
+
+class SlowCall:
+    """ Call which took longer than its threshold """
+    __slots__ = ('kind', 'name', 'sender', 'elapsed', 'stack', 'profile')
+
+    def __init__(self, kind: str, name: str, sender: Optional[str], elapsed: float,
+                 stack: str = None, profile: str = None) -> None:
+        self.kind = kind
+        self.name = name
+        self.sender = sender
+        self.elapsed = elapsed
+        self.stack = stack
+        self.profile = profile
+
+    def as_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __str__(self) -> str:
+        return 'slow {} {} for {}: {:.3f}s'.format(self.kind, self.name, self.sender, self.elapsed)
+
+
+def coroutine_stack(coro) -> str:
+    """ Where a suspended coroutine is waiting, following its awaits """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return ''.join(traceback.StackSummary.extract(frames).format())
+
+
+class Profiler:
+    """
+    Reports handler and api calls which take longer than `threshold`
+    seconds (`thresholds` overrides it by kind: 'handler', 'api'). A report
+    is a SlowCall with the command pattern, message type, event type or
+    endpoint, the sender and elapsed time; it is logged as a warning with
+    the `slow_call` extra field and passed to `callback`.
+
+    A `sample_rate` share of calls is sampled: with `sample='stack'` the
+    coroutine stack is taken when the call reaches its threshold, with
+    `sample='profile'` the call runs under cProfile (one call at a time, the
+    profile covers everything the loop runs meanwhile). Samples are
+    attached to reports of slow calls.
+    """
+
+    def __init__(self,
+                 threshold: float = 1.0,
+                 thresholds: Dict[str, float] = None,
+                 callback: Callable[[SlowCall], None] = None,
+                 log: bool = True,
+                 sample_rate: float = 0.0,
+                 sample: str = 'stack',
+                 profile_lines: int = 30) -> None:
+        assert sample in ('stack', 'profile'), 'sample should be stack or profile'
+        self.threshold = threshold
+        self.thresholds = thresholds or {}
+        self.callback = callback
+        self.log = log
+        self.sample_rate = sample_rate
+        self.sample = sample
+        self.profile_lines = profile_lines
+
+        # Stats
+        self.calls = 0
+        self.slow = 0
+        self.sampled = 0
+
+    async def measure(self, kind: str, name: str, sender: Optional[str], coro: Awaitable):
+        """ Await coro and report it when it is slow """
+        global _profiling
+
+        threshold = self.thresholds.get(kind, self.threshold)
+        stack = []  # type: List[str]
+        snapshot = profile = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            self.sampled += 1
+            if self.sample == 'stack':
+                snapshot = aio.get_event_loop().call_later(threshold, lambda: stack.append(coroutine_stack(coro)))
+            elif not _profiling:
+                _profiling = True
+                profile = cProfile.Profile()
+                profile.enable()
+
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            elapsed = time.perf_counter() - start
+            if snapshot is not None:
+                snapshot.cancel()
+            if profile is not None:
+                profile.disable()
+                _profiling = False
+
+            self.calls += 1
+            if elapsed >= threshold:
+                self.report(SlowCall(
+                    kind, name, sender, elapsed,
+                    stack=stack[0] if stack else None,
+                    profile=self._format(profile) if profile is not None else None,
+                ))
+
+    def _format(self, profile: cProfile.Profile) -> str:
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(self.profile_lines)
+        return out.getvalue()
+
+    def report(self, call: SlowCall) -> None:
+        self.slow += 1
+        if self.log:
+            logger.warning(str(call), extra={'slow_call': call.as_dict()})
+        if self.callback is not None:
+            try:
+                self.callback(call)
+            except Exception:
+                logger.exception('slow call callback failed')
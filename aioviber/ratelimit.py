@@ -0,0 +1,125 @@
+import asyncio as aio
+import time
+from typing import Dict, Union, Tuple
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    Tokens are reserved on acquire, so the balance may go negative while
+    callers are waiting — every caller sleeps exactly for its share of the
+    debt and callers are served in arrival order without any lock. A caller
+    cancelled while waiting gives its tokens back.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        assert rate > 0, 'rate should be positive'
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        assert self.capacity >= 1, 'capacity should be at least 1'
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+        # Stats
+        self.acquired = 0
+        self.delayed = 0
+        self.wait_time = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def fill(self) -> float:
+        """ Tokens available right now; negative when callers are queued """
+        self._refill()
+        return self._tokens
+
+    def reserve(self, tokens: float = 1) -> float:
+        """ Take tokens and return how long the caller has to wait for them """
+        self._refill()
+        self._tokens -= tokens
+        self.acquired += 1
+        if self._tokens >= 0:
+            return 0.0
+
+        delay = -self._tokens / self.rate
+        self.delayed += 1
+        self.wait_time += delay
+        return delay
+
+    def refund(self, tokens: float = 1) -> None:
+        """ Return reserved tokens which were not used """
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + tokens)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            try:
+                await aio.sleep(delay)
+            except aio.CancelledError:
+                # e.g. deadline of the api call, otherwise the debt slows down later callers
+                self.refund(tokens)
+                raise
+
+    def stats(self) -> dict:
+        return {
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'fill': self.fill,
+            'acquired': self.acquired,
+            'delayed': self.delayed,
+            'wait_time': self.wait_time,
+        }
+
+
+class RateLimiter:
+    """
+    Rate limiter for Viber API requests: a global bucket shared by every
+    endpoint plus optional per-endpoint buckets.
+
+        RateLimiter(rate=100, endpoints={
+            'send_message': 80,
+            'get_online': (5, 10),  # rate, capacity
+        })
+    """
+
+    def __init__(self,
+                 rate: float = None,
+                 capacity: float = None,
+                 endpoints: Dict[str, Union[float, Tuple[float, float], TokenBucket]] = None) -> None:
+        self.bucket = TokenBucket(rate, capacity) if rate is not None else None
+        self.endpoints = {}  # type: Dict[str, TokenBucket]
+        for endpoint, limit in (endpoints or {}).items():
+            self.set_endpoint_limit(endpoint, limit)
+
+    def set_endpoint_limit(self, endpoint: str, limit: Union[float, Tuple[float, float], TokenBucket]) -> None:
+        if isinstance(limit, TokenBucket):
+            bucket = limit
+        elif isinstance(limit, (tuple, list)):
+            bucket = TokenBucket(*limit)
+        else:
+            bucket = TokenBucket(limit)
+        self.endpoints[endpoint] = bucket
+
+    async def acquire(self, endpoint: str = None) -> None:
+        bucket = self.endpoints.get(endpoint)
+        if bucket is not None:
+            await bucket.acquire()
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire()
+            except aio.CancelledError:
+                if bucket is not None:
+                    bucket.refund()
+                raise
+
+    def stats(self) -> dict:
+        return {
+            'global': self.bucket.stats() if self.bucket is not None else None,
+            'endpoints': {endpoint: bucket.stats() for endpoint, bucket in self.endpoints.items()},
+        }
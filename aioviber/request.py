@@ -0,0 +1,113 @@
+from viberbot.api import messages
+from viberbot.api.messages.message import Message
+from viberbot.api.user_profile import UserProfile
+from viberbot.api.viber_requests import ViberRequest, create_request
+
+
+class Request:
+    """
+    Lightweight viber callback over the decoded payload. Fields are read
+    from the payload on access; sender, user and message objects (viberbot
+    UserProfile and Message) are built only when they are accessed.
+    Fields not sent with the event type are None.
+
+    `to_viber_request()` returns the same callback as a viberbot request.
+    """
+    __slots__ = ('data', '_sender', '_user', '_message')
+
+    def __init__(self, data: dict) -> None:
+        self.data = data
+        self._sender = None
+        self._user = None
+        self._message = None
+
+    @property
+    def event_type(self) -> str:
+        return self.data['event']
+
+    @property
+    def timestamp(self) -> int:
+        return self.data.get('timestamp')
+
+    @property
+    def message_token(self):
+        return self.data.get('message_token')
+
+    @property
+    def sender_id(self) -> str:
+        """ Id of the user the callback is about, without building profiles """
+        data = self.data
+        for key in ('sender', 'user'):
+            if key in data:
+                return data[key].get('id')
+        return data.get('user_id')
+
+    @property
+    def sender(self) -> UserProfile:
+        if self._sender is None and 'sender' in self.data:
+            self._sender = UserProfile().from_dict(self.data['sender'])
+        return self._sender
+
+    @property
+    def user(self) -> UserProfile:
+        if self._user is None and 'user' in self.data:
+            self._user = UserProfile().from_dict(self.data['user'])
+        return self._user
+
+    @property
+    def user_id(self) -> str:
+        return self.data.get('user_id')
+
+    @property
+    def message(self) -> Message:
+        if self._message is None and 'message' in self.data:
+            self._message = messages.get_message(self.data['message'])
+        return self._message
+
+    @property
+    def message_type(self) -> str:
+        message = self.data.get('message')
+        return message.get('type') if message is not None else None
+
+    @property
+    def text(self) -> str:
+        message = self.data.get('message')
+        return message.get('text') if message is not None else None
+
+    @property
+    def silent(self) -> bool:
+        return self.data.get('silent')
+
+    @property
+    def chat_id(self):
+        return self.data.get('chat_id')
+
+    @property
+    def reply_type(self):
+        return self.data.get('reply_type')
+
+    @property
+    def type(self) -> str:
+        return self.data.get('type')
+
+    @property
+    def context(self) -> str:
+        return self.data.get('context')
+
+    @property
+    def subscribed(self) -> bool:
+        return self.data.get('subscribed')
+
+    @property
+    def api_version(self) -> int:
+        return self.data.get('api_version')
+
+    @property
+    def desc(self) -> str:
+        return self.data.get('desc')
+
+    def to_viber_request(self) -> ViberRequest:
+        return create_request(self.data)
+
+    def __str__(self) -> str:
+        return 'Request [{}]'.format(self.data)
@@ -0,0 +1,51 @@
+import asyncio as aio
+import random
+
+import aiohttp
+
+from aioviber.exceptions import ViberApiError
+
+
+class RetryPolicy:
+    """
+    Retry policy for Viber API requests.
+
+    Only transient failures are retried: Viber statuses marked as transient
+    (tooManyRequests, generalError), HTTP 429 and 5xx responses (e.g. from
+    proxies) and the exceptions from `retry_on` (aiohttp connection errors
+    and timeouts by default). Other HTTP errors are not. Delays grow
+    exponentially and use "full jitter" — a random value between zero and the
+    exponential delay — so concurrent clients do not retry in lockstep.
+
+    :param attempts: total number of attempts, 1 disables retries
+    :param backoff: base delay in seconds
+    :param max_backoff: upper bound of a single delay
+    :param deadline: seconds for the whole call including retries, None for no limit
+    """
+
+    def __init__(self,
+                 attempts: int = 3,
+                 backoff: float = 0.5,
+                 max_backoff: float = 10.0,
+                 deadline: float = None,
+                 retry_on: tuple = (aiohttp.ClientConnectionError, aio.TimeoutError)) -> None:
+        assert attempts >= 1, 'attempts should be at least 1'
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_on = retry_on
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, ViberApiError):
+            return exc.transient
+        if isinstance(exc, aiohttp.ClientResponseError):
+            return exc.status == 429 or exc.status >= 500
+        return isinstance(exc, self.retry_on)
+
+    def delay(self, attempt: int) -> float:
+        """ Delay before the next try after `attempt` failed attempts """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+NO_RETRY = RetryPolicy(attempts=1)
@@ -0,0 +1,151 @@
+import re
+from typing import Any, Callable, Dict, Iterator, List, Match, Optional, Pattern, Tuple
+
+_META = set('.^$*+?{}[]\\|()')
+_NAMED_GROUP = re.compile(r'\(\?P<[^>]+>')
+_BACKREF = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def _literal(pattern: str) -> bool:
+    return bool(pattern) and not _META.intersection(pattern)
+
+
+class CommandRouter:
+    """
+    Text commands router with the semantics of checking
+    `re.search(pattern, text, re.I)` for every pattern in registration
+    order — the first matched command wins — but without the linear scan:
+
+    - `^literal$` patterns are looked up in a dict,
+    - `^literal` patterns are looked up in dicts by prefix length,
+    - other patterns are compiled into one regex, an alternation of
+      lookaheads in registration order, so one match call finds the first
+      matching pattern.
+
+    Patterns with backreferences and compiled patterns are checked one by one.
+    With `re.I` literals are looked up lowercased. `str.lower` does not
+    fold every character like `re.I` does (e.g. 'İ', 'ſ'), so literals and
+    texts with such characters go through the regexes one by one.
+    """
+
+    def __init__(self, flags: int = re.I) -> None:
+        self.flags = flags
+        self._ignore_case = bool(flags & re.I)
+        self._commands = []  # type: List[Tuple[Any, Pattern, Callable]]
+        self._exact = {}  # type: Dict[str, int]
+        self._prefixes = {}  # type: Dict[int, Dict[str, int]]
+        self._rest = []  # type: List[int]
+        self._individual = []  # type: List[int]
+        self._combined = None  # type: Pattern
+        self._group_command = {}  # type: Dict[int, int]
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def __iter__(self) -> Iterator[Tuple[Any, Callable]]:
+        return iter([(pattern, handler) for pattern, _, handler in self._commands])
+
+    def add(self, pattern, handler: Callable) -> None:
+        index = len(self._commands)
+        if isinstance(pattern, str):
+            compiled = re.compile(pattern, self.flags)
+        else:
+            compiled = pattern
+        self._commands.append((pattern, compiled, handler))
+
+        if not isinstance(pattern, str) or _BACKREF.search(pattern):
+            self._individual.append(index)
+        elif pattern.startswith('^') and pattern.endswith('$') and self._lookup(pattern[1:-1]):
+            self._exact.setdefault(self._key(pattern[1:-1]), index)
+        elif pattern.startswith('^') and self._lookup(pattern[1:]):
+            literal = self._key(pattern[1:])
+            self._prefixes.setdefault(len(literal), {}).setdefault(literal, index)
+        else:
+            self._rest.append(index)
+            self._dirty = True
+
+    def _key(self, text: str) -> str:
+        return text.lower() if self._ignore_case else text
+
+    def _foldable(self, text: str) -> bool:
+        """ Lowercased text compares like re.I: same length and stable under case changes """
+        if not self._ignore_case:
+            return True
+        lowered = text.lower()
+        return len(lowered) == len(text) and lowered.upper().lower() == lowered
+
+    def _lookup(self, pattern: str) -> bool:
+        return _literal(pattern) and self._foldable(pattern)
+
+    def _compile(self) -> None:
+        self._dirty = False
+        if not self._rest:
+            self._combined = None
+            return
+
+        parts = [
+            r'(?=[\s\S]*?(?:{})(?P<_cmd{}>))'.format(_NAMED_GROUP.sub('(?:', self._commands[i][0]), i)
+            for i in self._rest
+        ]
+        try:
+            combined = re.compile('|'.join(parts), self.flags)
+        except re.error:
+            # e.g. inline flags in the middle of a pattern, fall back to one by one checks
+            self._individual = sorted(self._individual + self._rest)
+            self._rest = []
+            self._combined = None
+            return
+
+        self._combined = combined
+        self._group_command = {
+            combined.groupindex['_cmd{}'.format(i)]: i for i in self._rest
+        }
+
+    def match(self, text: str) -> Optional[Tuple[Callable, Match]]:
+        """ Handler of the first matched command and its match object """
+        if self._dirty:
+            self._compile()
+        if not self._foldable(text):
+            return self._scan(text)
+
+        key = self._key(text)
+        best = self._exact.get(key)
+        if best is None and key.endswith('\n'):
+            best = self._exact.get(key[:-1])
+
+        for length, literals in self._prefixes.items():
+            index = literals.get(key[:length])
+            if index is not None and (best is None or index < best):
+                best = index
+
+        if self._combined is not None and (best is None or self._rest[0] < best):
+            matched = self._combined.match(text)
+            if matched is not None:
+                index = self._group_command[matched.lastindex]
+                if best is None or index < best:
+                    best = index
+
+        for index in self._individual:
+            if best is not None and index >= best:
+                break
+            if self._commands[index][1].search(text):
+                best = index
+                break
+
+        if best is None:
+            return None
+
+        _, compiled, handler = self._commands[best]
+        matched = compiled.search(text)
+        if matched is None:
+            # a lookup hit the regex does not confirm
+            return self._scan(text)
+        return handler, matched
+
+    def _scan(self, text: str) -> Optional[Tuple[Callable, Match]]:
+        for _, compiled, handler in self._commands:
+            matched = compiled.search(text)
+            if matched is not None:
+                return handler, matched
+        return None
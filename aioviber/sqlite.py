@@ -0,0 +1,139 @@
+import asyncio as aio
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Tuple
+
+logger = logging.getLogger('aioviber.sqlite')
+
+
+def connect(path: str, synchronous: str = None, timeout: float = 5) -> sqlite3.Connection:
+    """
+    Autocommit connection in WAL mode: readers of other processes do not
+    wait for a writer. Statements are grouped with `transaction`.
+    """
+    conn = sqlite3.connect(path, isolation_level=None, timeout=timeout)
+    conn.execute('PRAGMA journal_mode=WAL')
+    if synchronous is not None:
+        conn.execute('PRAGMA synchronous={}'.format(synchronous))
+    return conn
+
+
+@contextmanager
+def transaction(db: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """ Write transaction, rolled back on error """
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+        db.execute('COMMIT')
+    except BaseException:
+        if db.in_transaction:
+            db.execute('ROLLBACK')
+        raise
+
+
+class ProcessConnectionMixin:
+    """
+    `_db` connection to the `path` SQLite file, opened by every process on
+    first use: connections can not be shared with forked processes.
+    `_connected` is called with a new connection, e.g. to reset buffers
+    inherited from the parent process.
+    """
+    path = None  # type: str
+    _synchronous = None  # type: str
+    _conn = None  # type: sqlite3.Connection
+    _pid = None  # type: int
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._conn = connect(self.path, self._synchronous)
+            self._pid = os.getpid()
+            self._connected()
+        return self._conn
+
+    @property
+    def _db_open(self) -> bool:
+        """ Connection of this process is open """
+        return self._conn is not None and self._pid == os.getpid()
+
+    def _connected(self) -> None:
+        pass
+
+    def _close_db(self) -> None:
+        if self._db_open:
+            self._conn.close()
+        self._conn = None
+        self._pid = None
+
+
+class BatchWriter:
+    """
+    Inserts and deletes made within one loop iteration, written by `flush`
+    in one transaction. `insert` returns the row id once it is written, a
+    failed write is logged and raised to the waiting inserts. Writes
+    buffered by the parent of a forked process are dropped in the child.
+    """
+
+    def __init__(self, connection: Callable[[], sqlite3.Connection], insert: str, delete: str,
+                 name: str = 'sqlite') -> None:
+        self.connection = connection
+        self.insert_sql = insert
+        self.delete_sql = delete
+        self.name = name
+
+        self._inserts = []  # type: List[Tuple[Tuple, aio.Future]]
+        self._deletes = []  # type: List[int]
+        self._handle = None  # type: aio.Handle
+        self._pid = os.getpid()
+
+    async def insert(self, *values: Any) -> int:
+        self._own_buffers()
+        future = aio.get_event_loop().create_future()
+        self._inserts.append((values, future))
+        self._schedule()
+        return await future
+
+    def delete(self, row_id: int) -> None:
+        self._own_buffers()
+        self._deletes.append(row_id)
+        self._schedule()
+
+    def _own_buffers(self) -> None:
+        if self._pid != os.getpid():
+            self._inserts, self._deletes, self._handle = [], [], None
+            self._pid = os.getpid()
+
+    def _schedule(self) -> None:
+        if self._handle is None:
+            self._handle = aio.get_event_loop().call_soon(self.flush)
+
+    def flush(self) -> None:
+        self._own_buffers()
+        self._handle = None
+        inserts, self._inserts = self._inserts, []
+        deletes, self._deletes = self._deletes, []
+        if not inserts and not deletes:
+            return
+
+        try:
+            with transaction(self.connection()) as db:
+                ids = [db.execute(self.insert_sql, values).lastrowid for values, _ in inserts]
+                db.executemany(self.delete_sql, [(row_id,) for row_id in deletes])
+        except Exception as e:
+            logger.exception('%s write failed', self.name)
+            for _, future in inserts:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), row_id in zip(inserts, ids):
+            if not future.done():
+                future.set_result(row_id)
+
+    def close(self) -> None:
+        """ Write buffered changes now """
+        if self._handle is not None:
+            self._handle.cancel()
+        self.flush()
@@ -0,0 +1,56 @@
+from typing import List
+
+from viberbot.api.messages.message import Message
+
+from aioviber.codec import JsonCodec, default_codec
+from aioviber.exceptions import InvalidMessageError
+
+
+class MessageTemplate:
+    """
+    Message validated and encoded once, for sending the same message (with
+    the same keyboard) to many receivers. Only receiver and tracking_data
+    (or broadcast_list) are spliced into the encoded bytes on render.
+
+    Usually created with `Api.create_template(message)`.
+    """
+
+    def __init__(self,
+                 message: Message,
+                 auth_token: str,
+                 sender: dict = None,
+                 codec: JsonCodec = None) -> None:
+        if not message.validate():
+            raise InvalidMessageError("failed validating message: {0}".format(message))
+
+        self.codec = codec or default_codec()
+
+        data = message.to_dict()
+        self.tracking_data = data.pop('tracking_data', None)
+        data.pop('receiver', None)
+        if sender is not None:
+            data['sender'] = sender
+        data['auth_token'] = auth_token
+
+        # encoded object without closing brace
+        self._prefix = self.codec.dumps(data)[:-1]
+        self._default_tracking_data = self._encode_tracking_data(self.tracking_data)
+
+    def _encode_tracking_data(self, tracking_data: str) -> bytes:
+        if tracking_data is None:
+            return b''
+        return b',"tracking_data":' + self.codec.dumps(tracking_data)
+
+    def render(self, receiver: str, tracking_data: str = None) -> bytes:
+        """ Request body for send_message to receiver """
+        if tracking_data is None:
+            tracking_data_part = self._default_tracking_data
+        else:
+            tracking_data_part = self._encode_tracking_data(tracking_data)
+
+        return b''.join((self._prefix, b',"receiver":', self.codec.dumps(receiver), tracking_data_part, b'}'))
+
+    def render_broadcast(self, receivers: List[str]) -> bytes:
+        """ Request body for broadcast_message to receivers """
+        return b''.join((self._prefix, b',"broadcast_list":', self.codec.dumps(receivers),
+                         self._default_tracking_data, b'}'))
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from aioviber import Bot
+from aioviber.tracing import Exporter
+
+
+class ListExporter(Exporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class FakeResponse:
+    def __init__(self, result):
+        self.result = result
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self):
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return json.dumps(self.result).encode()
+
+
+class FakeSession:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def post(self, url, data=None, **kwargs):
+        self.calls.append((url, json.loads(data)))
+        return FakeResponse(self.results.pop(0))
+
+
+@pytest.fixture
+def fake_session():
+    """ Replaces api session with one answering requests with results in order """
+    def install(api, *results):
+        api.session = FakeSession(*results)
+        api._owns_session = False
+        return api.session
+
+    return install
+
+
+@pytest.fixture
+def bot_params(loop):
+    return dict(
+        name='test',
+        avatar='http://example.com/avatar.jpg',
+        auth_token='test-token',
+        webhook='https://example.com/webhook',
+        loop=loop,
+        set_webhook_on_startup=False,
+        unset_webhook_on_cleanup=False
+    )
+
+
+@pytest.fixture
+def make_bot(bot_params):
+    """ Bot factory, keyword arguments override bot_params """
+    def factory(**kwargs):
+        return Bot(**dict(bot_params, **kwargs))
+
+    return factory
+
+
+@pytest.fixture
+def bot(make_bot):
+    return make_bot()
+
+
+@pytest.fixture
+def exporter():
+    return ListExporter()
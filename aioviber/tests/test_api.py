@@ -1,10 +1,15 @@
 from unittest.mock import Mock, MagicMock, call, ANY
 
+import json
+
+import aiohttp
 import pytest
 import asyncio
 from asynctest import CoroutineMock
+from viberbot.api.messages import TextMessage
 
-from aioviber import Api, EventType
+from aioviber import Api, BotConfiguration, EventType, Outbox, RateLimiter, RetryPolicy, SessionConfig
+from aioviber.exceptions import ReceiverNotSubscribedError, TooManyRequestsError
 
 try:
     _is_coroutine = asyncio.coroutines._is_coroutine
@@ -30,7 +35,7 @@ def get_message():
 
 @pytest.fixture
 def bot_configuration():
-    return Mock()
+    return BotConfiguration(auth_token='test-token', name='test', avatar='http://example.com/avatar.jpg')
 
 
 @pytest.fixture
@@ -61,11 +66,119 @@ async def test_send_messages(api, user, get_message):
     await api.send_messages(user, messages)
 
 
+async def test_send_messages_ordered(api, get_message):
+    api.send_message = CoroutineMock(side_effect=lambda to, message: message)
+    messages = [get_message() for _ in range(3)]
+
+    assert await api.send_messages('user', messages) == messages
+    assert [c[0][1] for c in api.send_message.call_args_list] == messages
+
+
+async def test_send_messages_unordered(api, get_message):
+    api.pipeline = Mock()
+    await api.send_messages('user', [get_message()], ordered=False)
+
+    assert not api.pipeline.send_messages.called
+
+
 @pytest.mark.skip
 async def test_send_not_valid_messages(api, user, get_message):
     assert False
 
 
+async def test_broadcast_message_chunks(api, get_message):
+    message = get_message()
+    message.to_dict = Mock(return_value={'type': 'text', 'text': 'hi'})
+    api._make_request = CoroutineMock(return_value={'status': 0, 'failed_list': []})
+
+    failed = await api.broadcast_message(['user-{}'.format(i) for i in range(7)], message, chunk_size=3)
+
+    assert failed == []
+    assert api._make_request.call_count == 3
+    bodies = [json.loads(c[0][1]) for c in api._make_request.call_args_list]
+    assert sorted(len(body['broadcast_list']) for body in bodies) == [1, 3, 3]
+    assert all(body['text'] == 'hi' and body['auth_token'] == 'test-token' for body in bodies)
+    assert all(c[0][0] == 'broadcast_message' for c in api._make_request.call_args_list)
+
+
+async def test_broadcast_message_async_iterator(api, get_message):
+    class Receivers:
+        def __init__(self, n):
+            self.n = n
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self.n:
+                raise StopAsyncIteration
+            self.n -= 1
+            return 'user-{}'.format(self.n)
+
+    message = get_message()
+    message.to_dict = Mock(return_value={})
+    failure = {'receiver': 'user-1', 'status': 6, 'status_message': 'notSubscribed'}
+    api._make_request = CoroutineMock(return_value={'status': 0, 'failed_list': [failure]})
+
+    failed = await api.broadcast_message(Receivers(2), message)
+
+    assert api._make_request.call_count == 1
+    assert failed == [failure]
+
+
+async def test_broadcast_message_failed_chunk(api, get_message):
+    message = get_message()
+    message.to_dict = Mock(return_value={})
+    api._make_request = CoroutineMock(side_effect=Exception('boom'))
+
+    failed = await api.broadcast_message(['a', 'b'], message)
+
+    assert [f['receiver'] for f in failed] == ['a', 'b']
+    assert failed[0]['status_message'] == 'boom'
+
+
+async def test_broadcast_message_receivers_fail(api, get_message):
+    class Receivers:
+        def __init__(self):
+            self.items = ['a', 'b']
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(0.01)
+            if not self.items:
+                raise ValueError('database is gone')
+            return self.items.pop(0)
+
+    started, cancelled = [], []
+
+    async def make_request(endpoint, body):
+        started.append(body)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(body)
+            raise
+
+    message = get_message()
+    message.to_dict = Mock(return_value={})
+    api._make_request = make_request
+
+    with pytest.raises(ValueError):
+        await api.broadcast_message(Receivers(), message, chunk_size=1)
+
+    assert len(started) == 2
+    assert sorted(cancelled) == sorted(started)
+
+
+async def test_broadcast_not_valid_message(api, get_message):
+    with pytest.raises(Exception):
+        await api.broadcast_message(['a'], get_message(False))
+
+    assert not api._make_request.called
+
+
 async def test_get_users_status_not_list(api):
     with pytest.raises(AssertionError):
         await api.get_users_status('some_id')
@@ -80,6 +193,28 @@ async def test_get_users_status(api):
     await api.get_users_status(['some_id'])
 
 
+async def test_get_user_status(api):
+    api._make_request = CoroutineMock(return_value={'status': 0, 'users': [
+        {'id': 'a', 'online_status': 0}, {'id': 'b', 'online_status': 1}
+    ]})
+    a, b = await asyncio.gather(api.get_user_status('a'), api.get_user_status('b'))
+
+    assert a['online_status'] == 0
+    assert b['online_status'] == 1
+    assert api._make_request.call_args == call('get_online', {'ids': ['a', 'b']})
+
+
+async def test_get_user_status_cancelled_caller(api):
+    api._make_request = CoroutineMock(return_value={'status': 0, 'users': [{'id': 'a', 'online_status': 0}]})
+    first = asyncio.ensure_future(api.get_user_status('a'))
+    second = asyncio.ensure_future(api.get_user_status('a'))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert (await second)['online_status'] == 0
+    assert first.cancelled()
+
+
 async def test_set_common_webhook(api):
     await api.set_webhook(url='http://example.com')
     assert api._make_request.call_args == call('set_webhook', {'url': 'http://example.com'})
@@ -115,10 +250,146 @@ async def test_get_user_details(api):
     assert api._make_request.call_args == call('get_user_details', {'id': 'user_id'})
 
 
+async def test_get_user_details_cached(api):
+    api._make_request = CoroutineMock(return_value={'status': 0, 'user': {'id': 'user_id'}})
+    await asyncio.gather(api.get_user_details('user_id'), api.get_user_details('user_id'))
+    assert await api.get_user_details('user_id') == {'id': 'user_id'}
+
+    assert api._make_request.call_count == 1
+
+
 async def test_get_account_info(api):
     await api.get_account_info()
     assert api._make_request.call_args == call('get_account_info')
 
+
+@pytest.fixture
+def raw_api(loop, fake_session):
+    def factory(*results, **kwargs):
+        bot_configuration = BotConfiguration(auth_token='test-token', name='test', avatar=None)
+        api = Api(bot_configuration, loop=loop, **kwargs)
+        fake_session(api, *results)
+        api._logger = Mock()
+        return api
+
+    return factory
+
+
+async def test_make_request(raw_api):
+    api = raw_api({'status': 0, 'message_token': 1})
+    result = await api._make_request('send_message', {'text': 'hi'})
+
+    assert result['message_token'] == 1
+    url, data = api.session.calls[0]
+    assert url.endswith('/send_message')
+    assert data['text'] == 'hi'
+    assert data['auth_token'] == 'test-token'
+
+
+async def test_make_request_rate_limited(raw_api):
+    limiter = RateLimiter(rate=10, endpoints={'send_message': 5})
+    api = raw_api({'status': 0}, rate_limiter=limiter)
+    await api._make_request('send_message', {})
+
+    stats = limiter.stats()
+    assert stats['global']['acquired'] == 1
+    assert stats['endpoints']['send_message']['acquired'] == 1
+
+
+async def test_make_request_error(raw_api):
+    api = raw_api({'status': 6, 'status_message': 'notSubscribed'})
+    with pytest.raises(ReceiverNotSubscribedError):
+        await api._make_request('send_message', {})
+
+    assert len(api.session.calls) == 1
+
+
+async def test_make_request_retry(raw_api, mocker):
+    sleep = mocker.patch('aioviber.api.aio.sleep', new=CoroutineMock())
+    api = raw_api(
+        {'status': 12}, aiohttp.ClientConnectionError(), {'status': 0},
+        retry_policy=RetryPolicy(attempts=3)
+    )
+    result = await api._make_request('send_message', {})
+
+    assert result == {'status': 0}
+    assert len(api.session.calls) == 3
+    assert sleep.call_count == 2
+
+
+async def test_make_request_retry_exhausted(raw_api, mocker):
+    mocker.patch('aioviber.api.aio.sleep', new=CoroutineMock())
+    api = raw_api({'status': 12}, {'status': 12}, retry_policy=RetryPolicy(attempts=2))
+    with pytest.raises(TooManyRequestsError):
+        await api._make_request('send_message', {})
+
+    assert len(api.session.calls) == 2
+
+
+async def test_make_request_not_retryable(raw_api):
+    api = raw_api({'status': 6}, {'status': 0}, retry_policy=RetryPolicy(attempts=3))
+    with pytest.raises(ReceiverNotSubscribedError):
+        await api._make_request('send_message', {})
+
+    assert len(api.session.calls) == 1
+
+
+async def test_make_request_deadline(raw_api):
+    api = raw_api({'status': 12}, {'status': 0}, retry_policy=RetryPolicy(attempts=3, backoff=10, max_backoff=10))
+    api.retry_policy.delay = Mock(return_value=5)
+    with pytest.raises(TooManyRequestsError):
+        await api._make_request('send_message', {}, deadline=1)
+
+    assert len(api.session.calls) == 1
+
+
+async def test_send_template(raw_api):
+    api = raw_api({'status': 0, 'message_token': 42})
+    template = api.create_template(TextMessage(text='hi'))
+
+    assert await api.send_template('user', template, tracking_data='t') == 42
+    url, data = api.session.calls[0]
+    assert url.endswith('/send_message')
+    assert data == {
+        'type': 'text', 'text': 'hi', 'receiver': 'user', 'tracking_data': 't',
+        'auth_token': 'test-token', 'sender': {'name': 'test', 'avatar': None},
+    }
+
+
+async def test_enqueue_message(bot_configuration, loop, tmpdir):
+    api = Api(bot_configuration, session=Mock(), loop=loop, outbox=Outbox(str(tmpdir.join('outbox.db'))))
+    api.outbox.put = CoroutineMock(return_value=1)
+
+    assert await api.enqueue_message('user', TextMessage(text='hi')) == 1
+    endpoint, data = api.outbox.put.call_args[0]
+    assert endpoint == 'send_message'
+    assert data['receiver'] == 'user'
+    assert api.outbox.api is api
+
+
+async def test_owned_session(bot_configuration, loop):
+    api = Api(bot_configuration, loop=loop, session_config=SessionConfig(limit=10, limit_per_host=5, timeout=3))
+    await api.start()
+    session = api.session
+
+    assert session.connector.limit == 10
+    assert session.connector.limit_per_host == 5
+    assert session.timeout.total == 3
+
+    await api.close()
+    assert session.closed
+    assert api.session is None
+
+
+async def test_external_session_not_closed(bot_configuration, loop):
+    session = Mock()
+    api = Api(bot_configuration, session=session, loop=loop)
+    await api.start()
+    await api.close()
+
+    assert api.session is session
+    assert not session.close.called
+
 #
 # class CoroutineContextManager(CoroutineMock):
 #     async def __aexit__(self, *args, **kwargs):
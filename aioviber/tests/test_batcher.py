@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber.batcher import StatusBatcher
+
+
+async def test_flush_by_size(loop):
+    handler = CoroutineMock()
+    batcher = StatusBatcher(handler, max_size=3, max_delay=10)
+
+    for i in range(7):
+        batcher.add(i)
+    await asyncio.sleep(0)
+
+    assert [c[0][0] for c in handler.call_args_list] == [[0, 1, 2], [3, 4, 5]]
+    assert batcher.pending == 1
+
+    await batcher.close()
+    assert handler.call_args_list[-1][0][0] == [6]
+    assert batcher.events == 7
+    assert batcher.batches == 3
+
+
+async def test_flush_by_time(loop):
+    handler = CoroutineMock()
+    batcher = StatusBatcher(handler, max_size=100, max_delay=0.01)
+
+    batcher.add('first')
+    batcher.add('second')
+    assert not handler.called
+
+    await asyncio.sleep(0.03)
+    handler.assert_called_once_with(['first', 'second'])
+
+
+async def test_done_callbacks_after_failed_batch(loop):
+    done = []
+    batcher = StatusBatcher(CoroutineMock(side_effect=ValueError), max_size=2)
+
+    batcher.add('first', lambda: done.append('first'))
+    batcher.add('second', lambda: done.append('second'))
+    await batcher.close()
+
+    assert done == ['first', 'second']
+    assert batcher.errors == 1
+
+
+async def test_concurrency_limit(loop):
+    release = asyncio.Event()
+    batches = []
+
+    async def handler(events):
+        batches.append(events)
+        await release.wait()
+
+    batcher = StatusBatcher(handler, max_size=2, max_delay=10, concurrency=1)
+    for i in range(4):
+        batcher.add(i)
+    await asyncio.sleep(0)
+
+    # the second batch waits for the running one
+    assert batches == [[0, 1]]
+    assert batcher.pending == 2
+    with pytest.raises(asyncio.QueueFull):
+        batcher.add(4)
+
+    release.set()
+    await batcher.close()
+    assert batches == [[0, 1], [2, 3]]
+    assert batcher.events == 4
+    assert batcher.rejected == 1
@@ -1,24 +1,14 @@
-import pytest
-
-from aioviber import Bot
+import asyncio
+import json
+from unittest.mock import Mock
 
+import pytest
+from asynctest import CoroutineMock
+from viberbot.api.viber_requests import ViberMessageRequest, ViberSubscribedRequest
 
-@pytest.fixture
-def bot_params(loop):
-    return dict(
-        name='test',
-        avatar='http://example.com/avatar.jpg',
-        auth_token='test-token',
-        webhook='https://example.com/webhook',
-        loop=loop,
-        set_webhook_on_startup=False,
-        unset_webhook_on_cleanup=False
-    )
-
+from aioviber.request import Request
 
-@pytest.fixture
-def bot(bot_params):
-    return Bot(**bot_params)
+from aioviber import Bot, MemoryDedup, Metrics, Tracer
 
 
 def test_bad_initial():
@@ -53,3 +43,192 @@ def test_default_command(bot):
     @bot.default
     def default(chat):
         pass
+
+
+async def test_session_lifecycle(bot, test_client):
+    assert bot.session is None
+
+    client = await test_client(bot.app)
+    session = bot.session
+    assert session is not None
+    assert not session.closed
+
+    await client.close()
+    assert session.closed
+    assert bot.session is None
+
+
+async def test_webhook_handle_uses_codec(bot_params, test_client):
+    codec = Mock()
+    codec.loads = Mock(side_effect=json.loads)
+    bot = Bot(codec=codec, check_signature=False, **bot_params)
+    bot._process_request = CoroutineMock()
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps({'event': 'webhook', 'timestamp': 1}))
+
+    assert resp.status == 200
+    assert codec.loads.called
+    assert bot.api.codec is codec
+
+
+async def test_webhook_overflow(bot_params, test_client):
+    bot = Bot(check_signature=False, **bot_params)
+    bot.dispatcher.submit = CoroutineMock(side_effect=asyncio.QueueFull)
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps({
+        'event': 'delivered', 'timestamp': 1, 'message_token': 1, 'user_id': 'user'
+    }))
+
+    assert resp.status == 503
+
+
+async def test_process_request_awaits_handler(bot):
+    handler = CoroutineMock()
+    bot.event_handler('subscribed')(handler)
+    request = Request({'event': 'subscribed', 'timestamp': 1, 'user': {'id': 'user'}})
+
+    await bot._process_request(request)
+    viber_request = handler.call_args[0][0]
+    assert isinstance(viber_request, ViberSubscribedRequest)
+    assert viber_request.user.id == 'user'
+
+
+async def test_native_requests(bot_params):
+    bot = Bot(viberbot_requests=False, **bot_params)
+    handler = CoroutineMock()
+    bot.event_handler('subscribed')(handler)
+    request = Request({'event': 'subscribed', 'timestamp': 1, 'user': {'id': 'user'}})
+
+    await bot._process_request(request)
+    handler.assert_called_once_with(request)
+
+
+async def test_unhandled_events(bot):
+    await bot._process_request(Request({'event': 'seen', 'timestamp': 1, 'message_token': 1, 'user_id': 'u'}))
+    await bot._process_message(Request(message_payload('hi')))
+    await bot._process_message(Request(message_payload(type='sticker', sticker_id=1)))
+
+
+def message_payload(text=None, **message):
+    message.setdefault('type', 'text')
+    if text is not None:
+        message['text'] = text
+    return {
+        'event': 'message', 'timestamp': 1, 'message_token': 1,
+        'sender': {'id': 'user'}, 'message': message,
+    }
+
+
+async def test_webhook_dedup(bot_params, test_client):
+    bot = Bot(check_signature=False, dedup=MemoryDedup(), **bot_params)
+    bot.dispatcher.submit = CoroutineMock()
+    payload = json.dumps({'event': 'delivered', 'timestamp': 1, 'message_token': 1, 'user_id': 'user'})
+
+    client = await test_client(bot.app)
+    for _ in range(2):
+        resp = await client.post('/webhook', data=payload)
+        assert resp.status == 200
+
+    assert bot.dispatcher.submit.call_count == 1
+
+
+async def test_webhook_dedup_rejected_redelivery(bot_params, test_client):
+    bot = Bot(check_signature=False, dedup=MemoryDedup(), **bot_params)
+    bot.dispatcher.submit = CoroutineMock(side_effect=[asyncio.QueueFull(), True])
+    payload = json.dumps(message_payload('hi'))
+
+    client = await test_client(bot.app)
+    statuses = [(await client.post('/webhook', data=payload)).status for _ in range(3)]
+
+    # rejected callback is re-sent by Viber and accepted, the next one is a duplicate
+    assert statuses == [503, 200, 200]
+    assert bot.dispatcher.submit.call_count == 2
+
+
+async def test_process_message_routes_command(bot):
+    ping, echo = CoroutineMock(), CoroutineMock()
+    bot.command('^ping$')(ping)
+    bot.command('(?P<word>.+)')(echo)
+
+    await bot._process_message(Request(message_payload('PING')))
+
+    assert ping.called
+    assert not echo.called
+    chat, matched = ping.call_args[0]
+    assert matched.group(0) == 'PING'
+    assert isinstance(chat.message, ViberMessageRequest)
+    assert chat.sender.id == 'user'
+
+
+async def test_process_message_builds_chat_for_handler_only(bot):
+    bot._handler_request = Mock(wraps=bot._handler_request)
+    sticker = message_payload(type='sticker', sticker_id=1)
+
+    await bot._process_message(Request(sticker))
+    await bot._process_message(Request(message_payload('unknown')))
+    assert not bot._handler_request.called
+
+    handler = CoroutineMock()
+    bot.message_handler('sticker')(handler)
+    await bot._process_message(Request(sticker))
+    assert bot._handler_request.call_count == 1
+    assert handler.called
+
+
+async def test_webhook_without_event(bot_params, test_client):
+    bot = Bot(check_signature=False, **bot_params)
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps({'timestamp': 1}))
+
+    assert resp.status == 400
+
+
+async def test_status_handler(bot_params, test_client):
+    bot = Bot(check_signature=False, viberbot_requests=False, **bot_params)
+    bot.dispatcher.submit = CoroutineMock()
+    statuses = CoroutineMock()
+    bot.status_handler(max_size=2, max_delay=10)(statuses)
+
+    client = await test_client(bot.app)
+    for event, token in (('delivered', 1), ('seen', 1), ('subscribed', None)):
+        payload = {'event': event, 'timestamp': 1, 'message_token': token, 'user_id': 'user'}
+        resp = await client.post('/webhook', data=json.dumps(payload))
+        assert resp.status == 200
+    await asyncio.sleep(0)
+
+    batch = statuses.call_args[0][0]
+    assert [r.event_type for r in batch] == ['delivered', 'seen']
+    assert bot.dispatcher.submit.call_count == 1
+
+
+async def test_status_handler_full(bot_params, test_client):
+    bot = Bot(check_signature=False, dedup=MemoryDedup(), **bot_params)
+    bot.status_handler()(CoroutineMock())
+    bot.status_batcher.add = Mock(side_effect=asyncio.QueueFull)
+    payload = json.dumps({'event': 'delivered', 'timestamp': 1, 'message_token': 1, 'user_id': 'user'})
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=payload)
+    assert resp.status == 503
+    assert not bot.dedup.seen('delivered:1')
+
+
+async def test_status_handler_instrumented(make_bot, exporter, test_client):
+    bot = make_bot(check_signature=False, metrics=Metrics(), tracer=Tracer(exporter))
+    statuses = CoroutineMock()
+    bot.status_handler(max_size=1)(statuses)
+
+    client = await test_client(bot.app)
+    payload = {'event': 'delivered', 'timestamp': 1, 'message_token': 1, 'user_id': 'user'}
+    resp = await client.post('/webhook', data=json.dumps(payload))
+    assert resp.status == 200
+    await bot.close_status_batcher()
+
+    assert statuses.called
+    assert 'aioviber_handler_seconds_count{handler="status"} 1' in bot.metrics.render()
+    handler = [span for span in exporter.spans if span.name == 'handler'][0]
+    assert handler.attributes == {'handler': 'status', 'sender': ''}
+    assert handler.parent_id is None
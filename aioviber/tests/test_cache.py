@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber.cache import Cache, MemoryBackend, SQLiteBackend, MISSING
+
+
+@pytest.fixture
+def clock():
+    with patch('aioviber.cache.time') as time:
+        time.monotonic.return_value = 0.0
+        time.time.return_value = 0.0
+        yield time
+
+
+def test_memory_ttl(clock):
+    backend = MemoryBackend()
+    backend.set('key', 'value', ttl=10)
+    assert backend.get('key') == 'value'
+
+    clock.monotonic.return_value = 11
+    assert backend.get('key') is MISSING
+    assert len(backend) == 0
+
+
+def test_memory_lru():
+    backend = MemoryBackend(maxsize=2)
+    backend.set('a', 1, ttl=10)
+    backend.set('b', 2, ttl=10)
+    backend.get('a')
+    backend.set('c', 3, ttl=10)
+
+    assert backend.get('b') is MISSING
+    assert backend.get('a') == 1
+    assert backend.get('c') == 3
+
+
+def test_sqlite(tmpdir, clock):
+    path = str(tmpdir.join('cache.db'))
+    backend = SQLiteBackend(path)
+    backend.set('user', {'id': 'user', 'name': 'Name'}, ttl=10)
+    backend.close()
+
+    backend = SQLiteBackend(path)
+    assert backend.get('user') == {'id': 'user', 'name': 'Name'}
+
+    clock.time.return_value = 11
+    assert backend.get('user') is MISSING
+
+    backend.delete('user')
+    backend.prune()
+    assert backend._db.execute('SELECT count(*) FROM aioviber_cache').fetchone()[0] == 0
+
+
+def test_sqlite_prune(tmpdir):
+    backend = SQLiteBackend(str(tmpdir.join('cache.db')), maxsize=2)
+    for i in range(3):
+        backend.set(str(i), i, ttl=10 + i)
+    backend.prune()
+
+    assert backend.get('0') is MISSING
+    assert backend.get('2') == 2
+
+
+async def test_single_flight():
+    async def load():
+        await asyncio.sleep(0.01)
+        return 'details'
+
+    load = CoroutineMock(side_effect=load)
+    cache = Cache()
+
+    results = await asyncio.gather(*[cache.get_or_load('user', load) for _ in range(3)])
+    assert results == ['details'] * 3
+    assert load.call_count == 1
+    assert (cache.misses, cache.shared) == (1, 2)
+
+    assert await cache.get_or_load('user', load) == 'details'
+    assert cache.hits == 1
+
+
+async def test_load_error_not_cached():
+    cache = Cache()
+    with pytest.raises(ValueError):
+        await cache.get_or_load('user', CoroutineMock(side_effect=ValueError))
+
+    assert await cache.get_or_load('user', CoroutineMock(return_value='details')) == 'details'
+    assert cache._in_flight == {}
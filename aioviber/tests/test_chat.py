@@ -63,6 +63,11 @@ def test_send_messages(chat, message):
     assert chat.api.send_messages.called
 
 
+def test_send_template(chat, message):
+    chat.send_template(message)
+    assert chat.api.send_template.called
+
+
 def test_send_sticker(chat, message):
     chat.send_sticker(message)
     assert chat.api.send_message.called
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from aioviber import codec
+from aioviber.codec import JsonCodec, OrjsonCodec, default_codec
+
+payload = {'event': 'message', 'text': 'Привет', 'ids': [1, 2], 'silent': True, 'none': None}
+
+
+@pytest.mark.parametrize('codec_class', [JsonCodec, OrjsonCodec])
+def test_round_trip(codec_class):
+    if codec_class is OrjsonCodec and codec.orjson is None:
+        pytest.skip('orjson is not installed')
+
+    json_codec = codec_class()
+    data = json_codec.dumps(payload)
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == payload
+    assert JsonCodec().loads(data) == payload
+
+
+def test_json_loads_text_only(monkeypatch):
+    # Python 3.5 json.loads accepts str only
+    json_loads = json.loads
+
+    def loads(data):
+        assert isinstance(data, str)
+        return json_loads(data)
+
+    monkeypatch.setattr(codec.json, 'loads', loads)
+    data = JsonCodec().dumps(payload)
+    assert JsonCodec().loads(data) == payload
+    assert JsonCodec().loads(bytearray(data)) == payload
+    assert JsonCodec().loads(data.decode('utf-8')) == payload
+    with pytest.raises(ValueError):
+        JsonCodec().loads(b'\xff')
+
+
+def test_default_codec(monkeypatch):
+    monkeypatch.setattr(codec, 'orjson', None)
+    assert type(default_codec()) is JsonCodec
+
+    with pytest.raises(AssertionError):
+        OrjsonCodec()
@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+import pytest
+
+from aioviber.dedup import MemoryDedup, BloomDedup, BloomFilter, SQLiteDedup, callback_key
+
+
+@pytest.fixture
+def clock():
+    with patch('aioviber.dedup.time') as time:
+        time.monotonic.return_value = 0.0
+        time.time.return_value = 1000.0
+        yield time
+
+
+@pytest.mark.parametrize('dedup_class', [MemoryDedup, BloomDedup])
+def test_rotating_window(dedup_class, clock):
+    dedup = dedup_class(window=10)
+    assert not dedup.is_duplicate('a')
+    assert dedup.is_duplicate('a')
+
+    # still remembered in previous generation
+    clock.monotonic.return_value = 15
+    assert dedup.is_duplicate('a')
+
+    clock.monotonic.return_value = 40
+    assert not dedup.is_duplicate('a')
+    assert dedup.duplicates == 2
+
+
+@pytest.mark.parametrize('dedup_class', [MemoryDedup, BloomDedup])
+def test_rotating_forget(dedup_class, clock):
+    dedup = dedup_class(window=10)
+    assert not dedup.is_duplicate('a')
+    dedup.forget('a')
+    assert not dedup.is_duplicate('a')
+    assert dedup.is_duplicate('a')
+
+
+@pytest.mark.parametrize('dedup_class', [MemoryDedup, BloomDedup])
+def test_rotating_seen_add(dedup_class, clock):
+    dedup = dedup_class(window=10)
+    assert not dedup.seen('a')
+    assert not dedup.seen('a')
+    dedup.add('a')
+    assert dedup.seen('a')
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(str(i))
+
+    assert all(str(i) in bloom for i in range(1000))
+    false_positives = sum(str(i) in bloom for i in range(1000, 11000))
+    assert false_positives < 200
+
+
+def test_sqlite_shared(tmpdir, clock):
+    path = str(tmpdir.join('dedup.db'))
+    first, second = SQLiteDedup(path, window=10), SQLiteDedup(path, window=10)
+
+    assert not first.is_duplicate('a')
+    assert second.is_duplicate('a')
+
+    clock.time.return_value = 1011
+    assert not second.is_duplicate('a')
+    assert first.is_duplicate('a')
+
+    second.forget('a')
+    assert not first.is_duplicate('a')
+
+    assert not first.seen('b')
+    second.add('b')
+    assert first.seen('b')
+    clock.time.return_value = 1022
+    assert not first.seen('b')
+
+    clock.time.return_value = 1100
+    first.prune()
+    assert first._db.execute('SELECT count(*) FROM aioviber_dedup').fetchone()[0] == 0
+
+
+def test_callback_key():
+    assert callback_key({'event': 'seen', 'message_token': 1}) == 'seen:1'
+    assert callback_key({'event': 'subscribed'}) is None
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from asynctest import CoroutineMock
+
+from viberbot.api.viber_requests import create_request
+
+from aioviber.dispatcher import Dispatcher, Overflow, sender_id
+from aioviber.request import Request
+
+
+def get_dispatcher(handler=None, **kwargs):
+    dispatcher = Dispatcher(**kwargs)
+    dispatcher.handler = handler or CoroutineMock()
+    return dispatcher
+
+
+async def test_process():
+    dispatcher = get_dispatcher(workers=2)
+    await dispatcher.start()
+    for i in range(5):
+        assert await dispatcher.submit(i)
+    await dispatcher.close()
+
+    assert sorted(c[0][0] for c in dispatcher.handler.call_args_list) == list(range(5))
+    assert dispatcher.processed == 5
+    assert not dispatcher.running
+
+
+async def test_errors_counted():
+    dispatcher = get_dispatcher(handler=CoroutineMock(side_effect=ValueError))
+    await dispatcher.submit('request')
+    await dispatcher.close()
+
+    assert dispatcher.errors == 1
+
+
+async def full_dispatcher(**kwargs):
+    """ Dispatcher with one busy worker and full queue """
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+
+    dispatcher = get_dispatcher(handler=handler, workers=1, queue_size=1, **kwargs)
+    await dispatcher.submit('busy')
+    await asyncio.sleep(0)
+    await dispatcher.submit('queued')
+    return dispatcher, release
+
+
+async def test_reject():
+    dispatcher, release = await full_dispatcher(overflow=Overflow.reject)
+    with pytest.raises(asyncio.QueueFull):
+        await dispatcher.submit('extra', 'delivered')
+
+    assert dispatcher.stats()['rejected'] == 1
+    assert dispatcher.depth == 1
+    release.set()
+    await dispatcher.close()
+
+
+async def test_shed():
+    dispatcher, release = await full_dispatcher(overflow=Overflow.shed)
+
+    assert not await dispatcher.submit('extra', 'delivered')
+    with pytest.raises(asyncio.QueueFull):
+        await dispatcher.submit('extra', 'message')
+
+    assert (dispatcher.dropped, dispatcher.rejected) == (1, 1)
+    release.set()
+    await dispatcher.close()
+
+
+async def test_block():
+    dispatcher, release = await full_dispatcher(overflow=Overflow.block)
+
+    submit = asyncio.ensure_future(dispatcher.submit('extra', 'message'))
+    await asyncio.sleep(0.01)
+    assert not submit.done()
+
+    release.set()
+    assert await submit
+    await dispatcher.close()
+    assert dispatcher.processed == 3
+
+
+def test_bad_params():
+    with pytest.raises(AssertionError):
+        Dispatcher(workers=0)
+
+    with pytest.raises(AssertionError):
+        Dispatcher(overflow='wrong')
+
+
+async def test_lanes_keep_order_per_key():
+    processed = []
+
+    async def handler(request):
+        user, n = request
+        # first requests of user "a" are slow
+        await asyncio.sleep(0.01 if n == 0 else 0)
+        processed.append(request)
+
+    dispatcher = get_dispatcher(handler=handler, workers=4, key=lambda request: request[0])
+    for n in range(3):
+        for user in 'ab':
+            await dispatcher.submit((user, n))
+    await dispatcher.close()
+
+    assert [n for user, n in processed if user == 'a'] == [0, 1, 2]
+    assert [n for user, n in processed if user == 'b'] == [0, 1, 2]
+
+
+async def test_lanes_spread():
+    dispatcher = get_dispatcher(workers=2, key=lambda request: request)
+    await dispatcher.start()
+    lanes = {dispatcher._lane(key) for key in [str(i) for i in range(20)]}
+    await dispatcher.close()
+
+    assert len(lanes) == 2
+
+
+def test_sender_id():
+    message = create_request({
+        'event': 'message', 'timestamp': 1, 'message_token': 1,
+        'sender': {'id': 'sender'}, 'message': {'type': 'text', 'text': 'hi'}
+    })
+    subscribed = create_request({'event': 'subscribed', 'timestamp': 1, 'user': {'id': 'user'}})
+    seen = create_request({'event': 'seen', 'timestamp': 1, 'message_token': 1, 'user_id': 'user_id'})
+    webhook = create_request({'event': 'webhook', 'timestamp': 1})
+
+    assert [sender_id(r) for r in (message, subscribed, seen, webhook)] == ['sender', 'user', 'user_id', '']
+    assert sender_id(Request({'event': 'seen', 'user_id': 'user_id'})) == 'user_id'
+    assert sender_id(Request({'event': 'webhook'})) == ''
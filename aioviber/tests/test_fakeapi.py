@@ -0,0 +1,119 @@
+import time
+
+import pytest
+from viberbot.api.messages import TextMessage
+
+from aioviber import Api, BotConfiguration, RetryPolicy
+from aioviber.exceptions import InvalidAuthTokenError, TooManyRequestsError
+from aioviber.fakeapi import FakeViberApi, Faults, constant
+
+
+@pytest.fixture
+def fake_api(loop):
+    fakes = []
+
+    async def factory(*args, **kwargs):
+        fake = FakeViberApi('test-token', *args, **kwargs)
+        await fake.start()
+        fakes.append(fake)
+        return fake
+
+    yield factory
+    for fake in fakes:
+        loop.run_until_complete(fake.close())
+
+
+def get_api(loop, fake, auth_token='test-token', **kwargs):
+    return Api(BotConfiguration(auth_token=auth_token, name='test', avatar=None), loop=loop,
+               base_url=fake.url, **kwargs)
+
+
+async def test_send_message(loop, fake_api):
+    fake = await fake_api()
+    received = []
+    fake.observers.append(lambda endpoint, data: received.append(endpoint))
+    api = get_api(loop, fake)
+
+    token = await api.send_message('user', TextMessage(text='hi'))
+    await api.close()
+
+    assert isinstance(token, int)
+    assert received == ['send_message']
+    assert fake.requests[0][1]['text'] == 'hi'
+
+
+async def test_response_shapes(loop, fake_api):
+    api = get_api(loop, await fake_api())
+
+    users = await api.get_users_status(['a', 'b', 'c'])
+    details = await api.get_user_details('a')
+    account = await api.get_account_info()
+    await api.close()
+
+    assert [user['id'] for user in users] == ['a', 'b', 'c']
+    assert all(user['online_status_message'] in ('online', 'offline') for user in users)
+    assert details['id'] == 'a'
+    assert account['subscribers_count'] == 35
+
+
+async def test_wrong_auth_token(loop, fake_api):
+    fake = await fake_api()
+    api = get_api(loop, fake, auth_token='wrong')
+
+    with pytest.raises(InvalidAuthTokenError):
+        await api.get_account_info()
+    await api.close()
+    assert fake.requests == []
+
+
+async def test_throttling(loop, fake_api):
+    fake = await fake_api(faults=Faults(max_rps=2))
+    api = get_api(loop, fake)
+
+    await api.get_account_info()
+    await api.get_account_info()
+    with pytest.raises(TooManyRequestsError):
+        await api.get_account_info()
+    await api.close()
+    assert fake.throttled == 1
+
+
+async def test_latency(loop, fake_api):
+    fake = await fake_api(endpoint_faults={'get_account_info': Faults(latency=constant(0.05))})
+    api = get_api(loop, fake)
+
+    started = time.monotonic()
+    await api.get_account_info()
+    assert time.monotonic() - started >= 0.05
+    await api.close()
+
+
+@pytest.mark.parametrize('faults', [
+    Faults(drop_rate=0.5, seed=1),
+    Faults(http_error_rate=0.5, seed=1),
+    Faults(error_rate=0.5, error_statuses=(999,), seed=1),
+    Faults(throttle_rate=0.5, seed=1),
+])
+async def test_retry_recovers_from_faults(loop, fake_api, faults):
+    fake = await fake_api(faults=faults)
+    api = get_api(loop, fake, retry_policy=RetryPolicy(attempts=20, backoff=0.001))
+
+    for _ in range(10):
+        await api.get_account_info()
+    await api.close()
+
+    stats = fake.stats()
+    failed = stats['dropped'] + stats['http_errors'] + stats['errors'] + stats['throttled']
+    assert failed > 0
+    assert stats['received'] == 10 + failed
+
+
+async def test_api_without_loop(loop, fake_api):
+    fake = await fake_api()
+    api = Api(BotConfiguration(auth_token='test-token', name='test', avatar=None), base_url=fake.url)
+    await api.start()
+
+    assert isinstance(await api.send_message('a', TextMessage(text='hi')), int)
+    assert await api.broadcast_message(['a', 'b'], TextMessage(text='hi')) == []
+    assert (await api._make_request('get_account_info', deadline=5))['status'] == 0
+    await api.close()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber import BotHub, RateLimiter
+from aioviber.middleware import calculate_message_signature
+
+
+@pytest.fixture
+def get_bot(make_bot):
+    def factory(name, **kwargs):
+        return make_bot(name=name, auth_token='{}-token'.format(name), webhook='https://example.com/{}'.format(name),
+                        **kwargs)
+
+    return factory
+
+
+def signed(bot, payload):
+    body = json.dumps(payload).encode('utf-8')
+    return '/{}?sig={}'.format(bot.name, calculate_message_signature(body, bot.auth_token)), body
+
+
+PAYLOAD = {'event': 'webhook', 'timestamp': 1}
+
+
+async def test_hub_routes_by_webhook_path(loop, test_client, get_bot):
+    hub = BotHub(loop=loop)
+    first = hub.add(get_bot('first'))
+    second = hub.add(get_bot('second'))
+    first._process_request = CoroutineMock()
+    second._process_request = CoroutineMock()
+    assert len(hub) == 2
+
+    client = await test_client(hub.app)
+    for bot in (first, second):
+        url, body = signed(bot, PAYLOAD)
+        resp = await client.post(url, data=body)
+        assert resp.status == 200
+
+    await asyncio.sleep(0.01)
+    assert first._process_request.call_count == 1
+    assert second._process_request.call_count == 1
+
+
+async def test_hub_checks_signature_with_bot_token(loop, test_client, get_bot):
+    hub = BotHub(loop=loop)
+    first = hub.add(get_bot('first'))
+    second = hub.add(get_bot('second'))
+    second._process_request = CoroutineMock()
+
+    client = await test_client(hub.app)
+    url, body = signed(first, PAYLOAD)
+    resp = await client.post(url.replace('/first', '/second'), data=body)
+    assert resp.status == 403
+    assert not second._process_request.called
+
+
+async def test_hub_shares_session_and_workers(loop, test_client, get_bot):
+    hub = BotHub(loop=loop)
+    first = hub.add(get_bot('first', rate_limiter=RateLimiter(rate=10)))
+    second = hub.add(get_bot('second', rate_limiter=RateLimiter(rate=20)))
+
+    await test_client(hub.app)
+    session = hub.session
+    assert session is not None
+    assert first.api.session is session and second.api.session is session
+    assert first.dispatcher is second.dispatcher is hub.dispatcher
+    assert hub.dispatcher.running
+    assert first.api.rate_limiter is not second.api.rate_limiter
+
+    await hub.close()
+    assert session.closed
+    assert first.api.session is None
+    assert not hub.dispatcher.running
+
+
+def test_hub_rejects_taken_path(loop, get_bot):
+    hub = BotHub(loop=loop)
+    hub.add(get_bot('first'))
+    with pytest.raises(AssertionError):
+        hub.add(get_bot('first'))
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from asynctest import CoroutineMock
+
+from aioviber import MemoryDedup, ProcessQueue, SQLiteDedup, SQLiteQueue
+from aioviber.ingress import QueueWorker
+
+PAYLOAD = {'event': 'delivered', 'timestamp': 1, 'message_token': 1, 'user_id': 'user'}
+
+
+@pytest.fixture
+def get_bot(make_bot):
+    def factory(ingress, **kwargs):
+        return make_bot(check_signature=False, ingress=ingress, **kwargs)
+
+    return factory
+
+
+async def test_process_queue(loop):
+    ingress = ProcessQueue(maxsize=1)
+    await ingress.put(b'body')
+    with pytest.raises(asyncio.QueueFull):
+        await ingress.put(b'other')
+
+    assert await ingress.get(1) == (None, b'body')
+    assert await ingress.get(0.01) is None
+    ingress.close()
+
+
+async def test_sqlite_queue(loop, tmpdir):
+    path = str(tmpdir.join('ingress.db'))
+    ingress = SQLiteQueue(path)
+    await asyncio.gather(ingress.put(b'first'), ingress.put(b'second'))
+    assert ingress.depth == 2
+
+    token, payload = await ingress.get(0)
+    assert payload == b'first'
+    ingress.ack(token)
+    ingress.close()
+
+    # survives restarts, taken and not acked body is not given out again until timeout
+    ingress = SQLiteQueue(path, visibility_timeout=0.05)
+    assert ingress.depth == 1
+    token, payload = await ingress.get(0)
+    assert payload == b'second'
+    assert await ingress.get(0) is None
+    await asyncio.sleep(0.06)
+    assert (await ingress.get(0))[1] == b'second'
+    ingress.ack(token)
+    assert ingress.depth == 0
+    ingress.close()
+
+
+async def test_webhook_only_enqueues(loop, test_client, tmpdir, get_bot):
+    ingress = SQLiteQueue(str(tmpdir.join('ingress.db')))
+    bot = get_bot(ingress)
+    bot._process_request = CoroutineMock()
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps(PAYLOAD))
+
+    assert resp.status == 200
+    assert ingress.depth == 1
+    assert not bot._process_request.called
+
+
+async def test_webhook_ingress_full(loop, test_client, get_bot):
+    bot = get_bot(ProcessQueue(maxsize=1))
+
+    client = await test_client(bot.app)
+    assert (await client.post('/webhook', data=json.dumps(PAYLOAD))).status == 200
+    assert (await client.post('/webhook', data=json.dumps(PAYLOAD))).status == 503
+
+
+async def test_queue_worker(loop, tmpdir, get_bot):
+    ingress = SQLiteQueue(str(tmpdir.join('ingress.db')), poll_interval=0.01)
+    bot = get_bot(ingress, dedup=MemoryDedup())
+    bot._process_request = CoroutineMock()
+
+    for payload in (PAYLOAD, PAYLOAD, {'event': 'seen', 'timestamp': 1, 'user_id': 'user'}):
+        await ingress.put(json.dumps(payload).encode('utf-8'))
+    await ingress.put(b'not json')
+
+    worker = QueueWorker(bot, ingress, poll_timeout=0.01)
+    task = asyncio.ensure_future(worker.run())
+    for _ in range(100):
+        if ingress.depth == 0:
+            break
+        await asyncio.sleep(0.01)
+    worker.stop()
+    await task
+
+    assert ingress.depth == 0
+    assert bot._process_request.call_count == 2
+    assert worker.received == 4
+    assert worker.duplicates == 1
+    assert worker.invalid == 1
+
+
+async def test_queue_worker_redelivery(loop, tmpdir, get_bot):
+    """ Body of a worker which crashed while processing it is processed by another worker """
+    path, dedup_path = str(tmpdir.join('ingress.db')), str(tmpdir.join('dedup.db'))
+    ingress = SQLiteQueue(path, visibility_timeout=0.05, poll_interval=0.01)
+    await ingress.put(json.dumps(PAYLOAD).encode('utf-8'))
+
+    crashed = get_bot(ingress, dedup=SQLiteDedup(dedup_path))
+    stuck = asyncio.Event()
+    crashed._process_request = CoroutineMock(side_effect=lambda request: stuck.wait())
+    crashed_worker = QueueWorker(crashed, ingress)
+    crashed_worker._slots = asyncio.Semaphore(1)
+    await crashed_worker._submit(*(await ingress.get(0)))
+    await asyncio.sleep(0)
+    assert crashed._process_request.called
+
+    bot = get_bot(ingress, dedup=SQLiteDedup(dedup_path))
+    bot._process_request = CoroutineMock()
+    worker = QueueWorker(bot, ingress, poll_timeout=0.01)
+    task = asyncio.ensure_future(worker.run())
+    for _ in range(100):
+        if ingress.depth == 0:
+            break
+        await asyncio.sleep(0.01)
+    worker.stop()
+    await task
+    stuck.set()
+    await crashed.dispatcher.close()
+
+    assert bot._process_request.call_count == 1
+    assert worker.duplicates == 0
+    assert ingress.depth == 0
+
+
+def serve_worker(get_bot, ingress, handled: multiprocessing.Queue) -> None:
+    """ Worker process: the same bot with handlers, processing bodies of the ingress """
+    bot = get_bot(ingress, loop=asyncio.new_event_loop())
+
+    @bot.command('^ping$')
+    async def ping(chat, matched):
+        handled.put((os.getpid(), matched.group(0)))
+
+    bot.run_worker()
+
+
+def test_run_worker_process(loop, get_bot):
+    context = multiprocessing.get_context('fork')
+    ingress = ProcessQueue()
+    handled = context.Queue()
+    worker = context.Process(target=serve_worker, args=(get_bot, ingress, handled))
+    worker.start()
+
+    try:
+        async def post():
+            client = TestClient(TestServer(get_bot(ingress).app))
+            await client.start_server()
+            try:
+                resp = await client.post('/webhook', data=json.dumps({
+                    'event': 'message', 'timestamp': 1, 'message_token': 1,
+                    'sender': {'id': 'user'}, 'message': {'type': 'text', 'text': 'ping'},
+                }))
+                return resp.status
+            finally:
+                await client.close()
+
+        assert loop.run_until_complete(post()) == 200
+        # the handler ran in the worker process
+        assert handled.get(timeout=10) == (worker.pid, 'ping')
+    finally:
+        os.kill(worker.pid, signal.SIGTERM)
+        worker.join(10)
+        if worker.is_alive():
+            os.kill(worker.pid, signal.SIGKILL)
+        ingress.close()
+
+    assert worker.exitcode == 0
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber.loader import BatchLoader
+
+
+def squares(keys):
+    return {key: key * key for key in keys}
+
+
+async def test_coalesce():
+    batch_fn = CoroutineMock(side_effect=squares)
+    loader = BatchLoader(batch_fn)
+
+    results = await asyncio.gather(*[loader.load(i) for i in range(5)])
+
+    assert results == [0, 1, 4, 9, 16]
+    batch_fn.assert_called_once_with([0, 1, 2, 3, 4])
+
+
+async def test_same_key_shares_future():
+    batch_fn = CoroutineMock(side_effect=squares)
+    loader = BatchLoader(batch_fn)
+
+    assert await asyncio.gather(loader.load(3), loader.load(3)) == [9, 9]
+    batch_fn.assert_called_once_with([3])
+
+
+async def test_cancelled_caller():
+    batch_fn = CoroutineMock(side_effect=squares)
+    loader = BatchLoader(batch_fn)
+
+    first, second = loader.load(3), loader.load(3)
+    first.cancel()
+
+    assert await second == 9
+    assert first.cancelled()
+
+
+async def test_max_batch_size():
+    batch_fn = CoroutineMock(side_effect=squares)
+    loader = BatchLoader(batch_fn, max_batch_size=2)
+
+    await asyncio.gather(*[loader.load(i) for i in range(5)])
+
+    assert [c[0][0] for c in batch_fn.call_args_list] == [[0, 1], [2, 3], [4]]
+    assert loader.batches == 3
+
+
+async def test_missing_key():
+    loader = BatchLoader(CoroutineMock(return_value={}))
+    with pytest.raises(KeyError):
+        await loader.load('missing')
+
+
+async def test_batch_error():
+    loader = BatchLoader(CoroutineMock(side_effect=ValueError))
+    futures = [loader.load(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            await future
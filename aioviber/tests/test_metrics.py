@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber import Metrics, ViberApiError
+from aioviber.metrics import Counter, Histogram
+
+
+def test_counter():
+    counter = Counter('requests_total', 'Requests', ['endpoint', 'status'])
+    counter.inc('send_message', '0')
+    counter.inc('send_message', '0')
+    counter.inc('get_online', 'say "hi"\n')
+
+    assert counter.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{endpoint="get_online",status="say \\"hi\\"\\n"} 1',
+        'requests_total{endpoint="send_message",status="0"} 2',
+    ]
+
+
+def test_histogram():
+    histogram = Histogram('latency_seconds', 'Latency', ['endpoint'], buckets=[0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, 'send_message')
+
+    assert histogram.samples() == [
+        'latency_seconds_bucket{endpoint="send_message",le="0.1"} 2',
+        'latency_seconds_bucket{endpoint="send_message",le="1.0"} 3',
+        'latency_seconds_bucket{endpoint="send_message",le="+Inf"} 4',
+        'latency_seconds_sum{endpoint="send_message"} 3.65',
+        'latency_seconds_count{endpoint="send_message"} 4',
+    ]
+
+
+async def test_bot_metrics(make_bot, fake_session, test_client):
+    metrics = Metrics()
+    bot = make_bot(check_signature=False, metrics=metrics)
+    bot.command('^ping$')(CoroutineMock())
+    fake_session(bot.api, {'status': 0}, {'status': 12})
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps({
+        'event': 'message', 'timestamp': 1, 'message_token': 1,
+        'sender': {'id': 'user'}, 'message': {'type': 'text', 'text': 'ping'},
+    }))
+    assert resp.status == 200
+    await bot.dispatcher.close()
+
+    await bot.api.get_account_info()
+    with pytest.raises(ViberApiError):
+        await bot.api.get_account_info()
+
+    resp = await client.get('/metrics')
+    assert resp.status == 200
+    assert resp.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = await resp.text()
+    assert 'aioviber_api_responses_total{endpoint="get_account_info",status="0"} 1' in text
+    assert 'aioviber_api_responses_total{endpoint="get_account_info",status="12"} 1' in text
+    assert 'aioviber_api_request_seconds_count{endpoint="get_account_info"} 2' in text
+    assert 'aioviber_handler_seconds_count{handler="^ping$"} 1' in text
+    assert 'aioviber_webhook_seconds_count{status="200"} 1' in text
+    assert 'aioviber_api_requests_in_flight 0' in text
+    assert 'aioviber_dispatcher_queued 0' in text
@@ -0,0 +1,133 @@
+import asyncio
+import sqlite3
+from unittest.mock import Mock, patch
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber.codec import JsonCodec
+from aioviber.exceptions import ReceiverNotSubscribedError, TooManyRequestsError
+from aioviber.outbox import Outbox
+from aioviber.retry import RetryPolicy
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('outbox.db'))
+
+
+def get_api(side_effect=None):
+    api = Mock()
+    api.codec = JsonCodec()
+    api._make_request = CoroutineMock(return_value={'status': 0, 'message_token': 1}, side_effect=side_effect)
+    return api
+
+
+def get_outbox(path, api, **kwargs):
+    outbox = Outbox(path, poll_interval=0.01, **kwargs)
+    outbox.api = api
+    return outbox
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError('condition is not reached')
+
+
+async def test_put_batches_in_one_transaction(path):
+    outbox = get_outbox(path, get_api())
+    ids = await asyncio.gather(*[outbox.put('send_message', {'receiver': str(i)}) for i in range(3)])
+
+    assert ids == [1, 2, 3]
+    assert outbox.depth == 3
+    await outbox.close()
+
+
+async def test_drain(path):
+    api = get_api()
+    outbox = get_outbox(path, api)
+    await outbox.start()
+    await outbox.put('send_message', {'receiver': 'user'})
+
+    await wait_for(lambda: outbox.sent == 1)
+    api._make_request.assert_called_once_with('send_message', {'receiver': 'user'})
+    assert outbox.depth == 0
+    await outbox.close()
+
+
+async def test_drain_survives_failed_claim(path):
+    api = get_api()
+    outbox = get_outbox(path, api)
+    claim = outbox._claim
+    errors = [sqlite3.OperationalError('database is locked')]
+
+    def failing_claim():
+        if errors:
+            raise errors.pop()
+        return claim()
+
+    await outbox.put('send_message', {'receiver': 'user'})
+    with patch.object(outbox, '_claim', side_effect=failing_claim):
+        await outbox.start()
+        await wait_for(lambda: outbox.sent == 1)
+
+    assert not outbox._worker.done()
+    assert outbox.depth == 0
+    await outbox.close()
+
+
+async def test_survives_restart(path):
+    outbox = get_outbox(path, get_api())
+    await outbox.put('send_message', {'receiver': 'user'})
+    await outbox.close()
+
+    api = get_api()
+    outbox = get_outbox(path, api)
+    await outbox.start()
+    await wait_for(lambda: outbox.sent == 1)
+    assert api._make_request.call_count == 1
+    await outbox.close()
+
+
+async def test_retry_transient(path):
+    api = get_api(side_effect=[TooManyRequestsError({'status': 12}), {'status': 0}])
+    outbox = get_outbox(path, api, retry_policy=RetryPolicy(attempts=3, backoff=0.01))
+    await outbox.start()
+    await outbox.put('send_message', {'receiver': 'user'})
+
+    await wait_for(lambda: outbox.sent == 1)
+    assert outbox.retried == 1
+    assert outbox.depth == 0
+    await outbox.close()
+
+
+async def test_drop_not_retryable(path):
+    api = get_api(side_effect=ReceiverNotSubscribedError({'status': 6}))
+    outbox = get_outbox(path, api)
+    await outbox.start()
+    await outbox.put('send_message', {'receiver': 'user'})
+
+    await wait_for(lambda: outbox.failed == 1)
+    assert outbox.depth == 0
+    await outbox.close()
+
+
+async def test_concurrency(path):
+    active = []
+
+    async def send(*args):
+        active.append(len(api._make_request.mock_calls) - outbox.sent - outbox.failed)
+        await asyncio.sleep(0.01)
+        return {'status': 0}
+
+    api = get_api(side_effect=send)
+    outbox = get_outbox(path, api, concurrency=2)
+    await asyncio.gather(*[outbox.put('send_message', {'receiver': str(i)}) for i in range(6)])
+    await outbox.start()
+
+    await wait_for(lambda: outbox.sent == 6)
+    assert max(active) <= 2
+    await outbox.close()
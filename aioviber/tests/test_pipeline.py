@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from aioviber.pipeline import SendPipeline
+
+
+class Recorder:
+    """ Fake send with controllable latency """
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.started = []
+        self.finished = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, to, message):
+        self.started.append((to, message))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delays.get(message, 0))
+        self.active -= 1
+        if message == 'fail':
+            raise ValueError(message)
+        self.finished.append((to, message))
+        return 'token-{}'.format(message)
+
+
+async def test_order_per_receiver():
+    send = Recorder(delays={'first': 0.02, 'second': 0})
+    pipeline = SendPipeline()
+
+    tokens = await pipeline.send_messages(send, 'user', ['first', 'second', 'third'])
+
+    assert tokens == ['token-first', 'token-second', 'token-third']
+    assert send.finished == [('user', 'first'), ('user', 'second'), ('user', 'third')]
+    assert pipeline._lanes == {}
+
+
+async def test_receivers_in_parallel():
+    send = Recorder(delays={'slow': 0.02})
+    pipeline = SendPipeline()
+
+    await asyncio.gather(
+        pipeline.send_messages(send, 'a', ['slow', 'a2']),
+        pipeline.send_messages(send, 'b', ['b1', 'b2']),
+    )
+
+    assert send.finished.index(('b', 'b2')) < send.finished.index(('a', 'slow'))
+
+
+async def test_global_concurrency():
+    send = Recorder(delays={m: 0.01 for m in range(10)})
+    pipeline = SendPipeline(concurrency=3)
+
+    await asyncio.gather(*[pipeline.submit(send, str(i), i) for i in range(10)])
+
+    assert send.max_active == 3
+
+
+async def test_per_receiver_in_flight():
+    send = Recorder(delays={m: 0.01 for m in range(6)})
+    pipeline = SendPipeline(per_receiver=2)
+
+    futures = [pipeline.submit(send, 'user', i) for i in range(6)]
+    assert pipeline.in_flight == 2
+    assert pipeline.queued == 4
+
+    await asyncio.gather(*futures)
+    assert send.max_active == 2
+    assert [m for _, m in send.started] == list(range(6))
+
+
+async def test_failure_does_not_stop_lane():
+    send = Recorder()
+    pipeline = SendPipeline()
+
+    failed = pipeline.submit(send, 'user', 'fail')
+    ok = pipeline.submit(send, 'user', 'ok')
+
+    with pytest.raises(ValueError):
+        await failed
+    assert await ok == 'token-ok'
+
+
+def test_bad_params():
+    with pytest.raises(AssertionError):
+        SendPipeline(per_receiver=0)
+
+    with pytest.raises(AssertionError):
+        SendPipeline(concurrency=0)
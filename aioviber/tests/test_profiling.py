@@ -0,0 +1,82 @@
+import asyncio as aio
+import json
+import logging
+
+from aioviber import Profiler
+
+
+async def slow(seconds):
+    await aio.sleep(seconds)
+    return 'done'
+
+
+async def test_slow_call_reported(loop, caplog):
+    reports = []
+    profiler = Profiler(threshold=0.02, callback=reports.append)
+
+    assert await profiler.measure('handler', 'fast', 'user', slow(0)) == 'done'
+    with caplog.at_level(logging.WARNING, logger='aioviber.profiling'):
+        await profiler.measure('handler', '^ping$', 'user', slow(0.03))
+
+    assert profiler.calls == 2
+    assert [(call.name, call.sender) for call in reports] == [('^ping$', 'user')]
+    assert reports[0].elapsed >= 0.02
+    assert reports[0].stack is None and reports[0].profile is None
+    assert caplog.records[0].slow_call['name'] == '^ping$'
+
+
+async def test_thresholds_by_kind(loop):
+    reports = []
+    profiler = Profiler(threshold=10, thresholds={'api': 0.01}, callback=reports.append, log=False)
+
+    await profiler.measure('handler', 'text', 'user', slow(0.02))
+    await profiler.measure('api', 'send_message', 'user', slow(0.02))
+
+    assert [call.kind for call in reports] == ['api']
+
+
+async def test_stack_sample(loop):
+    reports = []
+    profiler = Profiler(threshold=0.01, callback=reports.append, log=False, sample_rate=1)
+
+    await profiler.measure('handler', 'text', 'user', slow(0.03))
+
+    assert profiler.sampled == 1
+    assert 'in slow' in reports[0].stack
+    assert 'aio.sleep(seconds)' in reports[0].stack
+
+
+async def test_profile_sample(loop):
+    reports = []
+    profiler = Profiler(threshold=0, callback=reports.append, log=False, sample_rate=1, sample='profile')
+
+    await aio.gather(*[profiler.measure('handler', 'text', 'user', slow(0.01)) for _ in range(3)])
+
+    assert profiler.sampled == 3
+    # one call at a time is profiled
+    profiles = [call.profile for call in reports if call.profile]
+    assert len(profiles) == 1
+    assert 'function calls' in profiles[0]
+
+
+async def test_bot_profiler(make_bot, fake_session, test_client):
+    reports = []
+    bot = make_bot(check_signature=False, profiler=Profiler(threshold=0, callback=reports.append, log=False))
+    fake_session(bot.api, {'status': 0, 'message_token': 1})
+
+    @bot.command('^ping$')
+    async def ping(chat, matched):
+        await chat.send_text('pong')
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps({
+        'event': 'message', 'timestamp': 1, 'message_token': 1,
+        'sender': {'id': 'user'}, 'message': {'type': 'text', 'text': 'ping'},
+    }))
+    assert resp.status == 200
+    await bot.dispatcher.close()
+
+    assert sorted((call.kind, call.name, call.sender) for call in reports) == [
+        ('api', 'send_message', 'user'),
+        ('handler', '^ping$', 'user'),
+    ]
@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber.ratelimit import TokenBucket, RateLimiter
+
+
+@pytest.fixture
+def clock():
+    with patch('aioviber.ratelimit.time.monotonic') as monotonic:
+        monotonic.return_value = 0.0
+        yield monotonic
+
+
+def test_bucket_starts_full(clock):
+    bucket = TokenBucket(rate=10)
+    assert bucket.capacity == 10
+    assert bucket.fill == 10
+
+
+def test_bucket_reserve(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+
+    stats = bucket.stats()
+    assert stats['acquired'] == 4
+    assert stats['delayed'] == 2
+    assert stats['wait_time'] == 1.5
+    assert stats['fill'] == -2
+
+
+def test_bucket_refill(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket.reserve(2)
+    assert bucket.fill == 0
+
+    clock.return_value = 0.5
+    assert bucket.fill == 1
+
+    clock.return_value = 10
+    assert bucket.fill == 2
+
+
+def test_bucket_bad_params():
+    with pytest.raises(AssertionError):
+        TokenBucket(rate=0)
+
+    with pytest.raises(AssertionError):
+        TokenBucket(rate=1, capacity=0.5)
+
+
+def test_bucket_acquire_sleeps(clock, loop):
+    bucket = TokenBucket(rate=1)
+    with patch('aioviber.ratelimit.aio.sleep', new=CoroutineMock()) as sleep:
+        loop.run_until_complete(bucket.acquire())
+        assert not sleep.called
+
+        loop.run_until_complete(bucket.acquire())
+        sleep.assert_called_once_with(1.0)
+
+
+async def test_limiter_endpoint_buckets(clock):
+    limiter = RateLimiter(rate=100, endpoints={'send_message': 10, 'get_online': (1, 5)})
+
+    await limiter.acquire('send_message')
+    await limiter.acquire('get_online')
+    await limiter.acquire('get_account_info')
+
+    stats = limiter.stats()
+    assert stats['global']['acquired'] == 3
+    assert stats['endpoints']['send_message']['acquired'] == 1
+    assert stats['endpoints']['get_online']['capacity'] == 5
+
+
+async def test_limiter_without_global_bucket(clock):
+    limiter = RateLimiter(endpoints={'send_message': TokenBucket(1)})
+    await limiter.acquire('send_message')
+    await limiter.acquire('get_online')
+
+    assert limiter.stats()['global'] is None
+
+
+async def test_bucket_cancelled_acquire_refunds(clock, loop):
+    bucket = TokenBucket(rate=1)
+    await bucket.acquire()
+
+    waiting = asyncio.ensure_future(bucket.acquire())
+    await asyncio.sleep(0)
+    assert bucket.fill == -1
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert bucket.fill == 0
+
+
+async def test_limiter_cancelled_acquire_refunds_endpoint(clock, loop):
+    limiter = RateLimiter(rate=1, endpoints={'send_message': 10})
+    await limiter.acquire('send_message')
+
+    waiting = asyncio.ensure_future(limiter.acquire('send_message'))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert limiter.bucket.fill == 0
+    assert limiter.endpoints['send_message'].fill == 9
@@ -0,0 +1,54 @@
+from viberbot.api.messages import TextMessage
+from viberbot.api.viber_requests import ViberMessageRequest, ViberConversationStartedRequest
+
+from aioviber.request import Request
+
+message = {
+    'event': 'message', 'timestamp': 1, 'message_token': 42, 'silent': False,
+    'sender': {'id': 'sender', 'name': 'Name'}, 'message': {'type': 'text', 'text': 'hi'},
+}
+conversation_started = {
+    'event': 'conversation_started', 'timestamp': 1, 'message_token': 42, 'type': 'open',
+    'context': 'context', 'subscribed': False, 'user': {'id': 'user'},
+}
+
+
+def test_lazy_fields():
+    request = Request(message)
+    assert request.event_type == 'message'
+    assert request.message_type == 'text'
+    assert request.text == 'hi'
+    assert request.sender_id == 'sender'
+    assert request._sender is None and request._message is None
+
+    assert request.sender.name == 'Name'
+    assert request.sender is request.sender
+    assert isinstance(request.message, TextMessage)
+    assert request.message.text == 'hi'
+
+
+def test_slots():
+    assert not hasattr(Request(message), '__dict__')
+
+
+def test_missing_fields():
+    request = Request({'event': 'seen', 'timestamp': 1, 'message_token': 1, 'user_id': 'user'})
+    assert request.sender_id == 'user'
+    assert request.sender is None
+    assert request.message is None
+    assert request.message_type is None
+    assert request.desc is None
+
+
+def test_conversation_started():
+    request = Request(conversation_started)
+    assert (request.type, request.context, request.subscribed) == ('open', 'context', False)
+    assert request.user.id == 'user'
+    assert request.sender_id == 'user'
+
+
+def test_to_viber_request():
+    assert isinstance(Request(message).to_viber_request(), ViberMessageRequest)
+    viber_request = Request(conversation_started).to_viber_request()
+    assert isinstance(viber_request, ViberConversationStartedRequest)
+    assert viber_request.user.id == 'user'
@@ -0,0 +1,50 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from aioviber.exceptions import (
+    error_from_result, ReceiverNotSubscribedError, TooManyRequestsError, GeneralError, ViberApiError
+)
+from aioviber.retry import RetryPolicy
+
+
+@pytest.mark.parametrize('status,error_class', [
+    (6, ReceiverNotSubscribedError),
+    (12, TooManyRequestsError),
+    (100, GeneralError),
+])
+def test_error_from_result(status, error_class):
+    error = error_from_result({'status': status, 'status_message': 'message'})
+    assert type(error) is error_class
+    assert isinstance(error, ViberApiError)
+    assert error.status_message == 'message'
+
+
+@pytest.mark.parametrize('exc,retryable', [
+    (TooManyRequestsError({'status': 12}), True),
+    (GeneralError({'status': 100}), True),
+    (ReceiverNotSubscribedError({'status': 6}), False),
+    (aiohttp.ClientConnectionError(), True),
+    (aiohttp.ServerDisconnectedError(), True),
+    (aiohttp.ClientResponseError(None, (), status=503), True),
+    (aiohttp.ClientResponseError(None, (), status=429), True),
+    (aiohttp.ClientResponseError(None, (), status=404), False),
+    (aiohttp.ClientResponseError(None, (), status=401), False),
+    (aiohttp.ClientPayloadError(), False),
+    (asyncio.TimeoutError(), True),
+    (KeyError('status'), False),
+])
+def test_is_retryable(exc, retryable):
+    assert RetryPolicy().is_retryable(exc) is retryable
+
+
+def test_delay_bounds():
+    policy = RetryPolicy(backoff=1, max_backoff=3)
+    for attempt in range(1, 10):
+        assert 0 <= policy.delay(attempt) <= min(3, 2 ** (attempt - 1))
+
+
+def test_bad_attempts():
+    with pytest.raises(AssertionError):
+        RetryPolicy(attempts=0)
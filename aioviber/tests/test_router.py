@@ -0,0 +1,117 @@
+import re
+
+import pytest
+
+from aioviber.router import CommandRouter
+
+PATTERNS = [
+    '^/start$', '^/help', 'ping', r'^buy (\d+)$', '^/start', r'(?P<word>hello|hi)\b', r'(\w)\1',
+    'pong$', '^exact$', re.compile('COMPILED'), r'order #(?P<id>\d+)', 'p.ng',
+]
+
+TEXTS = [
+    '/start', '/START', '/start now', '/help me', 'say ping', 'buy 10', 'buy ten', 'Hello there', 'hi',
+    'aab', 'ping pong', 'pong', 'exact', 'exact\n', 'not exact', 'COMPILED', 'compiled', 'order #42',
+    'pang', '', 'nothing here',
+]
+
+
+def reference(patterns, text):
+    for index, pattern in enumerate(patterns):
+        if isinstance(pattern, str):
+            matched = re.search(pattern, text, re.I)
+        else:
+            matched = pattern.search(text)
+        if matched:
+            return index, matched
+
+
+@pytest.fixture
+def router():
+    router = CommandRouter()
+    for index, pattern in enumerate(PATTERNS):
+        router.add(pattern, index)
+    return router
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_same_as_linear_search(router, text):
+    expected = reference(PATTERNS, text)
+    routed = router.match(text)
+
+    if expected is None:
+        assert routed is None
+    else:
+        index, matched = routed
+        assert index == expected[0]
+        assert matched.group(0) == expected[1].group(0)
+        assert matched.groups() == expected[1].groups()
+
+
+def test_first_registered_wins():
+    router = CommandRouter()
+    router.add('world', 'first')
+    router.add('^hello', 'second')
+
+    assert router.match('hello world')[0] == 'first'
+
+
+def test_named_groups():
+    router = CommandRouter()
+    router.add(r'(?P<id>\d+) apples', 'apples')
+    router.add(r'(?P<id>\d+) pears', 'pears')
+
+    handler, matched = router.match('3 pears')
+    assert handler == 'pears'
+    assert matched.group('id') == '3'
+
+
+def test_iter(router):
+    assert len(router) == len(PATTERNS)
+    assert [handler for _, handler in router] == list(range(len(PATTERNS)))
+
+
+def test_many_commands():
+    router = CommandRouter()
+    patterns = []
+    for i in range(500):
+        patterns += ['^/cmd{}$'.format(i), r'word{}\b'.format(i)]
+    for index, pattern in enumerate(patterns):
+        router.add(pattern, index)
+
+    for text in ['/cmd499', 'some word250 text', 'word2', 'nothing']:
+        expected = reference(patterns, text)
+        routed = router.match(text)
+        assert (routed and routed[0]) == (expected and expected[0])
+
+
+UNICODE_PATTERNS = ['^i̇$', '^i$', '^İ', '^s$', '^ſ$', '^k$', '^ping']
+
+
+@pytest.mark.parametrize('text', [
+    'İ', 'i̇', 'I', 'İx', 'S', 'ſ', 'K', 'PİNG', 'ping', 'İ̇',
+])
+def test_unicode_case_folding(text):
+    router = CommandRouter()
+    for index, pattern in enumerate(UNICODE_PATTERNS):
+        router.add(pattern, index)
+
+    expected = reference(UNICODE_PATTERNS, text)
+    routed = router.match(text)
+
+    if expected is None:
+        assert routed is None
+    else:
+        assert routed[0] == expected[0]
+        assert routed[1].group(0) == expected[1].group(0)
+
+
+def test_case_sensitive_lookups():
+    router = CommandRouter(flags=0)
+    router.add('^Start$', 'exact')
+    router.add('^Help', 'prefix')
+
+    assert router.match('Start')[0] == 'exact'
+    assert router.match('start') is None
+    assert router.match('Help me')[0] == 'prefix'
+    assert router.match('help me') is None
@@ -2,7 +2,8 @@ import pytest
 from aiohttp import web
 
 from aioviber.app import get_app, ping
-from aioviber.middleware import verify_signature, signature_middleware
+from aioviber.codec import JsonCodec
+from aioviber.middleware import verify_signature, signature_middleware, SignatureVerifier, read_payload
 
 
 def test_verify_signature():
@@ -13,6 +14,36 @@ def test_verify_signature():
     )
 
 
+def test_verifier():
+    verifier = SignatureVerifier('42f4f225c0d00988-a383ac39c65562af-3c9281ce7fd04419')
+    signature = '9f29ef85c59020f5ab11d6a0937e841c0231116f91e078cc0c5e17c60509a199'
+
+    # key state is reused between messages
+    assert not verifier.verify(b'other_message', signature)
+    assert verifier.verify(b'test_message', signature)
+    assert not verifier.verify(b'test_message', None)
+    assert not verifier.verify(b'test_message', 'подпись')
+
+
+async def test_read_payload_once(test_client):
+    codec = JsonCodec()
+    payloads = []
+
+    async def handler(request):
+        payloads.append(await read_payload(request, codec))
+        payloads.append(await read_payload(request, None))
+        return web.Response()
+
+    app = get_app(bot=Bot(check_signature=False))
+    app.router.add_post('/post', handler)
+
+    client = await test_client(app)
+    resp = await client.post('/post', data=b'{"event": "webhook"}')
+    assert resp.status == 200
+    assert payloads == [{'event': 'webhook'}] * 2
+    assert payloads[0] is payloads[1]
+
+
 class Bot:
     auth_token = '42f4f225c0d00988-a383ac39c65562af-3c9281ce7fd04419'
 
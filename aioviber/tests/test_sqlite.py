@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from aioviber.sqlite import BatchWriter, ProcessConnectionMixin, transaction
+
+
+class Store(ProcessConnectionMixin):
+    def __init__(self, path):
+        self.path = path
+        self._db.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, value TEXT UNIQUE)')
+        self.writer = BatchWriter(lambda: self._db, 'INSERT INTO items (value) VALUES (?)',
+                                  'DELETE FROM items WHERE id = ?')
+
+    def values(self):
+        return [row[0] for row in self._db.execute('SELECT value FROM items ORDER BY id')]
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = Store(str(tmpdir.join('store.db')))
+    yield store
+    store._close_db()
+
+
+async def test_batch_writer(store):
+    ids = await asyncio.gather(store.writer.insert('a'), store.writer.insert('b'))
+    assert ids == [1, 2]
+
+    store.writer.delete(1)
+    await store.writer.insert('c')
+    assert store.values() == ['b', 'c']
+
+
+async def test_batch_writer_failed_transaction(store):
+    await store.writer.insert('a')
+
+    results = await asyncio.gather(store.writer.insert('b'), store.writer.insert('a'), return_exceptions=True)
+
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert isinstance(results[0], sqlite3.IntegrityError)
+    # the whole batch is rolled back
+    assert store.values() == ['a']
+
+
+def test_transaction_rollback(store):
+    with pytest.raises(ValueError):
+        with transaction(store._db) as db:
+            db.execute("INSERT INTO items (value) VALUES ('a')")
+            raise ValueError()
+    assert store.values() == []
+    assert not store._db.in_transaction
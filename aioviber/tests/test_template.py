@@ -0,0 +1,48 @@
+import json
+
+import pytest
+from viberbot.api.messages import TextMessage
+
+from aioviber import Keyboard, Button
+from aioviber.codec import JsonCodec
+from aioviber.exceptions import InvalidMessageError
+from aioviber.template import MessageTemplate
+
+
+@pytest.fixture
+def message():
+    keyboard = Keyboard([Button(action_body='menu', text='Menu')])
+    return TextMessage(text='Привет', keyboard=keyboard.to_dict(), tracking_data='default')
+
+
+def test_render(message):
+    template = MessageTemplate(message, auth_token='token', sender={'name': 'bot'}, codec=JsonCodec())
+    data = json.loads(template.render('user'))
+
+    assert data == dict(message.to_dict(), receiver='user', auth_token='token', sender={'name': 'bot'})
+
+
+def test_render_broadcast(message):
+    template = MessageTemplate(message, auth_token='token', sender={'name': 'bot'}, codec=JsonCodec())
+    data = json.loads(template.render_broadcast(['a', 'b']))
+
+    expected = dict(message.to_dict(), broadcast_list=['a', 'b'], auth_token='token', sender={'name': 'bot'})
+    expected.pop('receiver', None)
+    assert data == expected
+
+
+def test_render_tracking_data(message):
+    template = MessageTemplate(message, auth_token='token')
+
+    assert json.loads(template.render('user'))['tracking_data'] == 'default'
+    assert json.loads(template.render('user', tracking_data='"quoted"'))['tracking_data'] == '"quoted"'
+
+
+def test_without_tracking_data():
+    template = MessageTemplate(TextMessage(text='hi'), auth_token='token')
+    assert 'tracking_data' not in json.loads(template.render('user'))
+
+
+def test_not_valid_message():
+    with pytest.raises(InvalidMessageError):
+        MessageTemplate(TextMessage(), auth_token='token')
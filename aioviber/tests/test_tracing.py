@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from aioviber import OtlpExporter, Tracer
+from aioviber.tracing import current_span, trace_id
+
+
+async def test_spans(loop, exporter):
+    tracer = Tracer(exporter)
+
+    with tracer.span('webhook') as root:
+        with tracer.span('handler', handler='^ping$') as child:
+            assert current_span() is child
+        with pytest.raises(ValueError):
+            with tracer.span('api'):
+                raise ValueError('bad')
+        assert current_span() is root
+    assert current_span() is None
+
+    handler, api, webhook = exporter.spans
+    assert webhook is root and webhook.parent_id is None
+    assert handler.parent_id == api.parent_id == root.span_id
+    assert {span.trace_id for span in exporter.spans} == {root.trace_id}
+    assert handler.attributes == {'handler': '^ping$'}
+    assert api.error.startswith("ValueError('bad'")
+    assert webhook.duration >= handler.duration
+
+
+def test_trace_id():
+    assert trace_id(5741311803571721087) == '00000000000000004fad3caaa4a6537f'
+    assert len(trace_id(None)) == 32
+    assert trace_id(None) != trace_id(None)
+
+
+async def test_otlp_exporter(loop):
+    payloads = []
+    tracer = Tracer(OtlpExporter(payloads.append, service_name='bot', batch_size=2))
+
+    with tracer.span('webhook', status=200):
+        with tracer.span('api', endpoint='send_message', retries=1):
+            pass
+    with tracer.span('webhook'):
+        pass
+    assert len(payloads) == 1
+    tracer.exporter.flush()
+
+    resource_spans = payloads[0]['resourceSpans'][0]
+    assert resource_spans['resource']['attributes'] == [{'key': 'service.name', 'value': {'stringValue': 'bot'}}]
+    api, webhook = resource_spans['scopeSpans'][0]['spans']
+    assert api['parentSpanId'] == webhook['spanId']
+    assert api['attributes'] == [
+        {'key': 'endpoint', 'value': {'stringValue': 'send_message'}},
+        {'key': 'retries', 'value': {'intValue': '1'}},
+    ]
+    assert int(webhook['endTimeUnixNano']) >= int(webhook['startTimeUnixNano'])
+    assert webhook['status'] == {'code': 1}
+    assert len(payloads) == 2
+
+
+async def test_bot_tracing(make_bot, exporter, fake_session, test_client):
+    bot = make_bot(check_signature=False, tracer=Tracer(exporter))
+    fake_session(bot.api, {'status': 0, 'message_token': 2})
+
+    @bot.command('^ping$')
+    async def ping(chat, matched):
+        await chat.send_text('pong')
+
+    client = await test_client(bot.app)
+    resp = await client.post('/webhook', data=json.dumps({
+        'event': 'message', 'timestamp': 1, 'message_token': 1,
+        'sender': {'id': 'user'}, 'message': {'type': 'text', 'text': 'ping'},
+    }))
+    assert resp.status == 200
+    await bot.dispatcher.close()
+
+    spans = {span.name: span for span in exporter.spans}
+    assert sorted(spans) == ['api', 'handler', 'webhook']
+    assert {span.trace_id for span in exporter.spans} == {trace_id(1)}
+    assert spans['webhook'].attributes == {'event': 'message', 'message_token': 1, 'status': 200}
+    assert spans['handler'].parent_id == spans['webhook'].span_id
+    assert spans['handler'].attributes == {'handler': '^ping$', 'sender': 'user'}
+    assert spans['api'].parent_id == spans['handler'].span_id
+    assert spans['api'].attributes == {'endpoint': 'send_message', 'receiver': 'user'}
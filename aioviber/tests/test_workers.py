@@ -0,0 +1,221 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from unittest.mock import Mock
+
+import pytest
+from asynctest import CoroutineMock
+
+from aioviber.codec import JsonCodec
+from aioviber.outbox import Outbox
+from aioviber.workers import Supervisor, bind_socket
+
+SERVER = '''
+import logging, sys
+logging.basicConfig(level=logging.INFO)
+from aioviber import Bot
+bot = Bot(name='test', avatar='http://example.com/avatar.jpg', auth_token='test-token',
+          webhook='https://example.com/webhook', host='127.0.0.1', port=int(sys.argv[1]),
+          set_webhook_on_startup=False, unset_webhook_on_cleanup=False)
+bot.run(workers=2, health_port=int(sys.argv[2]), reuse_port={reuse_port})
+'''
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(port: int, path: str):
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:{}{}'.format(port, path), timeout=1) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def wait_for(check, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            result = check()
+            if result:
+                return result
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise AssertionError('timeout')
+
+
+def drain_outbox(outbox: Outbox, sent: multiprocessing.Queue) -> None:
+    """ Worker process draining a shared outbox until it is empty """
+    async def send(endpoint, data):
+        await asyncio.sleep(0.005)
+        sent.put(data['receiver'])
+        return {'status': 0}
+
+    async def run():
+        outbox.api = Mock(codec=JsonCodec(), _make_request=send)
+        await outbox.start()
+        deadline = time.monotonic() + 10
+        while outbox.depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await outbox.close()
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    asyncio.get_event_loop().run_until_complete(run())
+
+
+def test_outbox_drained_by_workers(tmpdir, loop):
+    outbox = Outbox(str(tmpdir.join('outbox.db')), poll_interval=0.01, batch_size=5)
+    outbox.api = Mock(codec=JsonCodec())
+    loop.run_until_complete(asyncio.gather(*[outbox.put('send_message', {'receiver': str(i)}) for i in range(60)]))
+
+    context = multiprocessing.get_context('fork')
+    sent = context.Queue()
+    workers = [context.Process(target=drain_outbox, args=(outbox, sent)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(15)
+    receivers = []
+    while not sent.empty():
+        receivers.append(sent.get())
+
+    # every entry is sent once, by one of the processes
+    assert sorted(receivers, key=int) == [str(i) for i in range(60)]
+    assert outbox.depth == 0
+
+
+def test_bind_socket():
+    sock = bind_socket('127.0.0.1', 0)
+    try:
+        assert sock.get_inheritable()
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR)
+        assert sock.getsockname()[1] > 0
+    finally:
+        sock.close()
+
+
+def test_status_without_workers(loop):
+    supervisor = Supervisor(Mock(), workers=2)
+    status = supervisor.status()
+    assert status['expected'] == 2
+    assert status['workers'] == []
+    assert status['healthy'] is False
+
+
+async def test_worker_does_not_manage_webhook(make_bot):
+    bot = make_bot(set_webhook_on_startup=True, unset_webhook_on_cleanup=True)
+    bot.api.set_webhook = CoroutineMock()
+    bot.api.unset_webhook = CoroutineMock()
+    bot._webhook_owner = False
+
+    await bot.set_webhook_on_startup()
+    await bot.unset_webhook_on_cleanup()
+
+    bot.api.set_webhook.assert_not_called()
+    bot.api.unset_webhook.assert_not_called()
+
+
+def start_server(tmpdir, port: int, health_port: int, reuse_port: bool) -> subprocess.Popen:
+    script = tmpdir.join('server.py')
+    script.write(SERVER.format(reuse_port=reuse_port))
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=root)
+    # own process group, so workers are killed with the primary
+    return subprocess.Popen([sys.executable, str(script), str(port), str(health_port)], env=env,
+                            start_new_session=True)
+
+
+def kill_server(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def test_restart_requested_once(loop):
+    supervisor = Supervisor(Mock(), workers=2)
+    supervisor.restart()
+    supervisor.restart()
+    assert supervisor._restart_requested
+
+    supervisor._restarting, supervisor._restart_requested = True, False
+    supervisor.restart()
+    assert not supervisor._restart_requested
+
+
+@pytest.mark.parametrize('reuse_port', [True, False])
+def test_run_workers(tmpdir, reuse_port):
+    if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+        pytest.skip('SO_REUSEPORT is not available')
+    port, health_port = free_port(), free_port()
+    process = start_server(tmpdir, port, health_port, reuse_port)
+    try:
+        wait_for(lambda: get(port, '/ping') == (200, b'pong'))
+        status = json.loads(wait_for(lambda: get(health_port, '/health')[0] == 200 and get(health_port, '/health')[1]))
+        assert len(status['workers']) == 2
+        pids = {w['pid'] for w in status['workers']}
+
+        # dead worker is restarted
+        os.kill(pids.pop(), signal.SIGKILL)
+        status = wait_for(lambda: json.loads(get(health_port, '/health')[1])['restarts'] == 1
+                          and json.loads(get(health_port, '/health')[1]))
+        assert status['healthy']
+
+        # graceful restart replaces all workers
+        before = {w['pid'] for w in json.loads(get(health_port, '/health')[1])['workers']}
+        process.send_signal(signal.SIGHUP)
+        wait_for(lambda: not before & {w['pid'] for w in json.loads(get(health_port, '/health')[1])['workers']})
+        assert get(port, '/ping') == (200, b'pong')
+
+        # SIGHUP during a restart does not start another one
+        before = {w['pid'] for w in json.loads(get(health_port, '/health')[1])['workers']}
+        process.send_signal(signal.SIGHUP)
+        process.send_signal(signal.SIGHUP)
+        wait_for(lambda: not before & {w['pid'] for w in json.loads(get(health_port, '/health')[1])['workers']})
+        time.sleep(1)
+        status = json.loads(get(health_port, '/health')[1])
+        assert status['healthy'] and status['restarts'] == 1
+        assert not before & {w['pid'] for w in status['workers']}
+        assert get(port, '/ping') == (200, b'pong')
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(10) == 0
+    finally:
+        kill_server(process)
+
+
+def test_workers_follow_primary(tmpdir):
+    port, health_port = free_port(), free_port()
+    process = start_server(tmpdir, port, health_port, reuse_port=False)
+    try:
+        status = json.loads(wait_for(lambda: get(health_port, '/health')[0] == 200 and get(health_port, '/health')[1]))
+        # a replacement worker is forked while the health server listens
+        os.kill(status['workers'][0]['pid'], signal.SIGKILL)
+        wait_for(lambda: json.loads(get(health_port, '/health')[1])['restarts'] == 1)
+
+        process.kill()
+        process.wait()
+        with pytest.raises(ConnectionRefusedError):
+            socket.create_connection(('127.0.0.1', health_port), timeout=1).close()
+
+        # orphaned workers stop and close the shared port
+        def refused():
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            except ConnectionRefusedError:
+                return True
+        wait_for(refused)
+    finally:
+        kill_server(process)
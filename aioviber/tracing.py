@@ -0,0 +1,237 @@
+import asyncio as aio
+import logging
+import random
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7: the span is kept per task, tasks created inside do not inherit it
+    class ContextVar:  # type: ignore
+        def __init__(self, name: str, default=None) -> None:
+            self.name = name
+            self._default = default
+            self._values = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+        def get(self):
+            task = aio.Task.current_task()
+            return self._default if task is None else self._values.get(task, self._default)
+
+        def set(self, value):
+            task = aio.Task.current_task()
+            if task is None:
+                return None
+            token = (task, self._values.get(task, self._default))
+            self._values[task] = value
+            return token
+
+        def reset(self, token) -> None:
+            if token is not None:
+                task, value = token
+                self._values[task] = value
+
+logger = logging.getLogger('aioviber.tracing')
+
+_current = ContextVar('aioviber_span', default=None)
+
+
+def current_span() -> Optional['Span']:
+    return _current.get()
+
+
+def attach(span: Optional['Span']):
+    """ Make span current, e.g. in a dispatcher worker; returns token for detach """
+    return _current.set(span)
+
+
+def detach(token) -> None:
+    _current.reset(token)
+
+
+def _new_id(bits: int) -> str:
+    return '{:0{}x}'.format(random.getrandbits(bits), bits // 4)
+
+
+def trace_id(message_token) -> str:
+    """ Trace id of a callback: its message token, re-sent callbacks share the trace """
+    if not isinstance(message_token, int) or message_token <= 0:
+        return _new_id(128)
+    return '{:032x}'.format(message_token & (2 ** 128 - 1))
+
+
+class Span:
+    """ Timed operation of a trace """
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start', 'duration', 'error', '_started')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: Dict[str, Any] = None) -> None:
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.duration = None  # type: float
+        self.error = None  # type: str
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+    def as_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+    def as_otlp(self) -> dict:
+        """ Span in OTLP JSON encoding """
+        start = int(self.start * 1e9)
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # internal
+            'startTimeUnixNano': str(start),
+            'endTimeUnixNano': str(start + int((self.duration or 0) * 1e9)),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+    def __str__(self) -> str:
+        return 'trace={} span={} parent={} {} {:.3f}ms{}'.format(
+            self.trace_id, self.span_id, self.parent_id or '-', self.name, (self.duration or 0) * 1000,
+            ''.join(' {}={}'.format(key, value) for key, value in self.attributes.items()),
+        )
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+class Exporter:
+    """ Destination of finished spans """
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+
+class LogExporter(Exporter):
+    """ Span per log line, the `span` extra field holds span dict """
+
+    def __init__(self, logger: logging.Logger = logger, level: int = logging.INFO) -> None:
+        self.logger = logger
+        self.level = level
+
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            self.logger.log(self.level, str(span), extra={'span': span.as_dict()})
+
+
+class OtlpExporter(Exporter):
+    """
+    Passes spans to `sink` as OTLP JSON `ExportTraceServiceRequest` dicts,
+    e.g. to post them to `/v1/traces` of an OpenTelemetry collector.
+    Spans are passed in batches of `batch_size`, the rest on `flush`.
+    """
+
+    def __init__(self, sink: Callable[[dict], None], service_name: str = 'aioviber', batch_size: int = 1) -> None:
+        self.sink = sink
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._spans = []  # type: List[Span]
+
+    def export(self, spans: List[Span]) -> None:
+        self._spans.extend(spans)
+        if len(self._spans) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._spans:
+            return
+        spans, self._spans = self._spans, []
+        self.sink({'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'aioviber'},
+                'spans': [span.as_otlp() for span in spans],
+            }],
+        }]})
+
+
+class Tracer:
+    """
+    Traces webhook callbacks: a trace starts in the webhook handler with
+    the callback message token as trace id, the current span is carried in
+    a context variable through the dispatcher to handlers and to every api
+    call they make. Finished spans go to `exporter`, log lines by default.
+    With `Bot(ingress=...)` the trace of a callback starts in the worker
+    process which takes its body from the queue.
+
+    On Python < 3.7 the current span is kept per task: it reaches handlers
+    and their api calls, but not tasks they create.
+    """
+
+    def __init__(self, exporter: Exporter = None) -> None:
+        self.exporter = exporter or LogExporter()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """ Child span of the current one or a new trace """
+        parent = _current.get()
+        if parent is None:
+            span = Span(name, _new_id(128), attributes=attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.finish()
+            self.export(span)
+
+    async def trace(self, name: str, coro: Awaitable, **attributes):
+        """ Await coro in a span """
+        with self.span(name, **attributes):
+            return await coro
+
+    @staticmethod
+    def bind_callback(span: Span, data: dict) -> None:
+        """ Use the callback message token as trace id of a root span """
+        if span.parent_id is None:
+            span.trace_id = trace_id(data.get('message_token'))
+        for key in ('event', 'message_token'):
+            if data.get(key) is not None:
+                span.set(key, data[key])
+
+    def export(self, span: Span) -> None:
+        try:
+            self.exporter.export([span])
+        except Exception:
+            logger.exception('span export failed')
@@ -0,0 +1,332 @@
+import asyncio as aio
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger('aioviber.workers')
+
+
+def bind_socket(host: str, port: int, reuse_port: bool = False, backlog: int = 128) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerInfo:
+    __slots__ = ('pid', 'started', 'restarts', 'ready_fd')
+
+    def __init__(self, pid: int, restarts: int = 0, ready_fd: int = None) -> None:
+        self.pid = pid
+        self.started = time.time()
+        self.restarts = restarts
+        self.ready_fd = ready_fd  # readable once the worker listens
+
+    def close(self) -> None:
+        if self.ready_fd is not None:
+            os.close(self.ready_fd)
+            self.ready_fd = None
+
+
+class Supervisor:
+    """
+    Primary process of `Bot.run(workers=N)`.
+
+    Forks N worker processes serving the bot app on one port: every worker
+    binds its own SO_REUSEPORT socket, so the kernel balances connections,
+    or — where SO_REUSEPORT is not available — all of them accept on a
+    socket bound by the primary. Only the primary sets and unsets the
+    webhook. Dead workers are restarted; SIGHUP restarts workers one by one
+    without closing the port; SIGINT / SIGTERM stop workers gracefully.
+    Workers stop by themselves when the primary dies.
+    Workers are forked between runs of the primary loop, so they do not
+    inherit a running loop.
+
+    With `health_port` the primary serves GET /health with the workers
+    state: 200 when all workers are alive, 503 otherwise.
+    """
+
+    def __init__(self,
+                 bot,
+                 workers: int,
+                 reuse_port: bool = None,
+                 health_port: int = None,
+                 shutdown_timeout: float = 30) -> None:
+        assert hasattr(os, 'fork'), 'workers mode needs os.fork'
+        assert workers > 0, 'workers should be positive'
+        self.bot = bot
+        self.workers = workers
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT') if reuse_port is None else reuse_port
+        self.health_port = health_port
+        self.shutdown_timeout = shutdown_timeout
+
+        self._sock = None  # type: socket.socket
+        self._health_sock = None  # type: socket.socket
+        self._workers = {}  # type: Dict[int, WorkerInfo]
+        self._wakeup = None  # type: aio.Event
+        self._stop_requested = False
+        self._restart_requested = False
+        self._restarting = False
+        self._stopping = False
+        self.restarts = 0
+
+    def status(self) -> dict:
+        return {
+            'primary': os.getpid(),
+            'workers': [
+                {'pid': w.pid, 'uptime': round(time.time() - w.started, 1), 'restarts': w.restarts}
+                for w in self._workers.values()
+            ],
+            'expected': self.workers,
+            'restarts': self.restarts,
+            'healthy': len(self._workers) == self.workers,
+        }
+
+    def run(self) -> None:
+        if not self.reuse_port:
+            self._sock = bind_socket(self.bot.host, self.bot.port)
+        if self.health_port is not None:
+            self._health_sock = bind_socket(self.bot.host, self.health_port)
+
+        for _ in range(self.workers):
+            self._spawn()
+
+        loop = aio.new_event_loop()
+        aio.set_event_loop(loop)
+        self.bot._set_loop(loop)
+        try:
+            health = loop.run_until_complete(self._start(loop))
+            while not self._stop_requested:
+                self._reap()
+                if self._restart_requested:
+                    self._restart(loop)
+                loop.run_until_complete(self._idle(0.5))
+            loop.run_until_complete(self._finish(health))
+        finally:
+            loop.close()
+            for sock in (self._sock, self._health_sock):
+                if sock is not None:
+                    sock.close()
+
+    def stop(self) -> None:
+        self._stop_requested = True
+        self._wake()
+
+    def restart(self) -> None:
+        """ Request graceful restart, ignored while one is requested or running """
+        if self._restart_requested or self._restarting:
+            logger.warning('restart is already in progress')
+            return
+        self._restart_requested = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _idle(self, timeout: float) -> None:
+        try:
+            await aio.wait_for(self._wakeup.wait(), timeout)
+        except aio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _spawn(self, restarts: int = 0) -> WorkerInfo:
+        ready_r, ready_w = os.pipe()
+        primary = os.getpid()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover — worker process
+            code = 0
+            try:
+                os.close(ready_r)
+                for worker in self._workers.values():
+                    worker.close()
+                self._run_worker(ready_w, primary)
+            except Exception:
+                logger.exception('worker %d failed', os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(ready_w)
+        worker = self._workers[pid] = WorkerInfo(pid, restarts, ready_r)
+        logger.info('started worker %d', pid)
+        return worker
+
+    def _run_worker(self, ready_fd: int, primary: int) -> None:  # pragma: no cover — runs in forked process
+        # the primary loop is not running while workers are forked; it is left alone,
+        # closing it would unregister its fds from the epoll instance shared with the primary
+        if self._health_sock is not None:
+            self._health_sock.close()
+            self._health_sock = None
+        signal.set_wakeup_fd(-1)
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+
+        loop = aio.new_event_loop()
+        aio.set_event_loop(loop)
+        self.bot._set_loop(loop)
+        self.bot._webhook_owner = False
+        self.bot.api._forget_session()
+        try:
+            loop.run_until_complete(self._serve(loop, ready_fd, primary))
+        finally:
+            loop.close()
+
+    async def _serve(self, loop: aio.AbstractEventLoop, ready_fd: int, primary: int) -> None:  # pragma: no cover
+        stop = aio.Event()
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        watcher = loop.create_task(self._watch_primary(primary, stop))
+
+        runner = web.AppRunner(self.bot.app, handle_signals=False)
+        await runner.setup()
+        if self._sock is not None:
+            site = web.SockSite(runner, self._sock)
+        else:
+            site = web.TCPSite(runner, self.bot.host, self.bot.port, reuse_port=True)
+        try:
+            await site.start()
+            os.write(ready_fd, b'1')
+            os.close(ready_fd)
+            await stop.wait()
+        finally:
+            watcher.cancel()
+            await runner.cleanup()
+
+    async def _watch_primary(self, primary: int, stop: aio.Event,
+                             interval: float = 1) -> None:  # pragma: no cover
+        """ Stop the worker once the primary is gone: nobody restarts it or manages the webhook then """
+        while os.getppid() == primary:
+            await aio.sleep(interval)
+        logger.warning('primary %d is gone, stopping worker %d', primary, os.getpid())
+        stop.set()
+
+    async def _wait_ready(self, worker: WorkerInfo, timeout: float = 30) -> None:
+        """ Wait until worker listens, or exits """
+        loop = aio.get_event_loop()
+        future = loop.create_future()
+        loop.add_reader(worker.ready_fd, lambda: future.done() or future.set_result(None))
+        try:
+            await aio.wait_for(future, timeout)
+        except aio.TimeoutError:
+            logger.warning('worker %d is not ready in %ss', worker.pid, timeout)
+        finally:
+            loop.remove_reader(worker.ready_fd)
+            worker.close()
+
+    async def _start(self, loop: aio.AbstractEventLoop) -> Optional[web.AppRunner]:
+        self._wakeup = aio.Event()
+        loop.add_signal_handler(signal.SIGINT, self.stop)
+        loop.add_signal_handler(signal.SIGTERM, self.stop)
+        loop.add_signal_handler(signal.SIGHUP, self.restart)
+
+        runner = None
+        if self._health_sock is not None:
+            runner = await self._start_health()
+
+        if self.bot._set_webhook_on_startup:
+            await self.bot.set_webhook_on_startup()
+        return runner
+
+    async def _finish(self, health: Optional[web.AppRunner]) -> None:
+        await self._shutdown()
+        try:
+            if self.bot._unset_webhook_on_cleanup:
+                await self.bot.unset_webhook_on_cleanup()
+        finally:
+            await self.bot.api.close()
+            if health is not None:
+                await health.cleanup()
+
+    def _reap(self) -> None:
+        """ Collect exited workers and start new ones instead """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            worker.close()
+            if self._stopping:
+                continue
+            self.restarts += 1
+            logger.warning('worker %d exited with status %d, restarting', pid, status)
+            self._spawn(worker.restarts + 1)
+
+    def _restart(self, loop: aio.AbstractEventLoop) -> None:
+        """ Replace workers one by one, an old worker is stopped once the new one listens """
+        logger.info('graceful restart')
+        self._restart_requested = False
+        self._restarting = True
+        try:
+            for pid in list(self._workers):
+                if self._stop_requested:
+                    break
+                worker = self._workers.pop(pid, None)
+                if worker is None:
+                    continue
+                worker.close()
+                loop.run_until_complete(self._wait_ready(self._spawn(worker.restarts + 1)))
+                self._terminate([pid])
+        finally:
+            self._restarting = False
+
+    def _terminate(self, pids) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    async def _shutdown(self) -> None:
+        self._stopping = True
+        pids = list(self._workers)
+        self._terminate(pids)
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._workers and time.monotonic() < deadline:
+            for pid in list(self._workers):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    self._workers.pop(pid).close()
+            await aio.sleep(0.1)
+
+        for pid in list(self._workers):
+            logger.warning('worker %d did not stop, killing', pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._workers.pop(pid).close()
+
+    async def _health(self, request) -> web.Response:
+        status = self.status()
+        return web.json_response(status, status=200 if status['healthy'] else 503)
+
+    async def _start_health(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get('/health', self._health)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.SockSite(runner, self._health_sock).start()
+        return runner
@@ -0,0 +1,361 @@
+"""
+Webhook throughput benchmark.
+
+A bot with a few commands and handlers is served on a local port by a
+separate process, its api points to a local FakeViberApi of that process:
+the driver does not compete with the bot for the event loop. Signed callbacks of every event type and
+message type are posted to the webhook at a fixed rate or as fast as
+`concurrency` connections allow. Reported:
+
+- requests per second,
+- ack latency: webhook response time,
+- reply latency: time from posting a `ping <id>` message until the reply
+  `pong <id>` reaches the fake api.
+
+    python benchmarks/webhook.py --duration 10 --output before.json
+    python benchmarks/webhook.py --rate 500 --compare before.json
+"""
+import argparse
+import asyncio as aio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aioviber import Bot, EventType, MessageType  # noqa: E402
+from aioviber.fakeapi import FakeViberApi, Faults, lognormal  # noqa: E402
+from aioviber.middleware import calculate_message_signature  # noqa: E402
+
+AUTH_TOKEN = '445da6az1s345z78-dazcczb2542zv51a-e0vc5fva17480im9'
+USER = {
+    'id': '01234567890A=', 'name': 'John McClane', 'avatar': 'http://avatar.example.com',
+    'country': 'UK', 'language': 'en', 'api_version': 1,
+}
+MEDIA = 'http://www.images.com/img.jpg'
+
+MESSAGES = {
+    MessageType.TEXT: {'text': 'ping {id}'},
+    MessageType.PICTURE: {'media': MEDIA, 'thumbnail': MEDIA, 'text': 'photo'},
+    MessageType.VIDEO: {'media': MEDIA, 'thumbnail': MEDIA, 'size': 10000, 'duration': 10},
+    MessageType.FILE: {'media': MEDIA, 'size': 10000, 'file_name': 'name_of_file.pdf'},
+    MessageType.STICKER: {'sticker_id': 46105},
+    MessageType.CONTACT: {'contact': {'name': 'Alex', 'phone_number': '+972511123123'}},
+    MessageType.LOCATION: {'location': {'lat': 50.76891, 'lon': 6.11499}},
+    MessageType.URL: {'media': 'http://www.website.com/go_here'},
+    MessageType.RICH_MEDIA: {
+        'rich_media': {'Type': 'rich_media', 'ButtonsGroupColumns': 6, 'ButtonsGroupRows': 1, 'Buttons': []},
+        'alt_text': 'rich media',
+    },
+}
+
+SCENARIOS = ('mixed', 'text', 'status')
+
+
+def event_payload(event: str, token: int, user: dict) -> dict:
+    data = {'event': event, 'timestamp': int(time.time() * 1000), 'message_token': token}
+    if event in (EventType.DELIVERED, EventType.SEEN, EventType.UNSUBSCRIBED):
+        data['user_id'] = user['id']
+    elif event == EventType.FAILED:
+        data.update(user_id=user['id'], desc='failure description')
+    elif event == EventType.SUBSCRIBED:
+        data['user'] = user
+    elif event == EventType.CONVERSATION_STARTED:
+        data.update(type='open', context='context information', user=user, subscribed=False)
+    return data
+
+
+def message_payload(message_type: str, token: int, user: dict) -> dict:
+    message = {key: value.format(id=token) if isinstance(value, str) else value
+               for key, value in MESSAGES[message_type].items()}
+    message['type'] = message_type
+    return {
+        'event': EventType.MESSAGE, 'timestamp': int(time.time() * 1000), 'message_token': token,
+        'sender': user, 'message': message,
+    }
+
+
+def kinds(scenario: str) -> List[str]:
+    """ Payload kinds sent in turn: event types and message types """
+    if scenario == 'text':
+        return [MessageType.TEXT]
+    if scenario == 'status':
+        return [EventType.DELIVERED, EventType.SEEN]
+    events = [event for event in EventType.all() if event != EventType.MESSAGE]
+    return [MessageType.TEXT] * len(events) + events + MessageType.all()
+
+
+def payload(kind: str, token: int, users: int = 1000) -> dict:
+    user = dict(USER, id='{}{}'.format(USER['id'], token % users))
+    return message_payload(kind, token, user) if kind in MESSAGES else event_payload(kind, token, user)
+
+
+def sign(data: dict):
+    body = json.dumps(data).encode('utf-8')
+    return body, calculate_message_signature(body, AUTH_TOKEN)
+
+
+def get_bot(port: int, api_url: str) -> Bot:
+    bot = Bot(
+        name='bench', avatar='http://avatar.example.com/avatar.jpg', auth_token=AUTH_TOKEN,
+        webhook='http://127.0.0.1:{}/webhook'.format(port), host='127.0.0.1', port=port,
+        set_webhook_on_startup=False, unset_webhook_on_cleanup=False, api_base_url=api_url,
+    )
+
+    @bot.command(r'^ping (\d+)$')
+    async def ping(chat, matched):
+        await chat.send_text('pong {}'.format(matched.group(1)))
+
+    @bot.command('^help$')
+    async def help_(chat, matched):
+        pass
+
+    @bot.message_handler(MessageType.STICKER)
+    async def sticker(chat):
+        await chat.send_sticker(46105)
+
+    @bot.event_handler(EventType.SUBSCRIBED)
+    async def subscribed(request):
+        pass
+
+    return bot
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(q: float) -> float:
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(values[-1] * 1000, 3)}
+
+
+def commit() -> str:
+    """ Commit of the benchmarked tree, wherever the script is run from """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Driver:
+    def __init__(self, url: str, scenario: str, rate: float, concurrency: int, duration: float,
+                 users: int) -> None:
+        self.url = url
+        self.users = users
+        self.kinds = kinds(scenario)
+        self.rate = rate
+        self.concurrency = concurrency
+        self.duration = duration
+
+        self.tokens = itertools.count(1)
+        # monotonic clock is system-wide: post and reply times of two processes compare
+        self.sent = {}  # type: Dict[str, float]  # ping id -> post time
+        self.ack = []  # type: List[float]
+        self.reply = []  # type: List[float]
+        self.statuses = {}  # type: Dict[str, int]
+
+    def replied(self, arrivals: Dict[str, float]) -> None:
+        """ Reply latency of pong messages by their arrival at the fake api """
+        for ping, arrived in arrivals.items():
+            started = self.sent.pop(ping, None)
+            if started is not None:
+                self.reply.append(arrived - started)
+
+    async def post(self, session: aiohttp.ClientSession) -> None:
+        token = next(self.tokens)
+        kind = self.kinds[token % len(self.kinds)]
+        body, signature = sign(payload(kind, token, self.users))
+        started = time.monotonic()
+        if kind == MessageType.TEXT:
+            self.sent[str(token)] = started
+        try:
+            async with session.post(self.url, params={'sig': signature}, data=body) as response:
+                await response.read()
+                status = str(response.status)
+        except aiohttp.ClientError as e:
+            status = type(e).__name__
+        self.ack.append(time.monotonic() - started)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    async def run(self) -> float:
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            if self.rate:
+                await self._fixed_rate(session, started)
+            else:
+                await aio.gather(*[self._closed_loop(session, started) for _ in range(self.concurrency)])
+            return time.perf_counter() - started
+
+    async def _closed_loop(self, session: aiohttp.ClientSession, started: float) -> None:
+        while time.perf_counter() - started < self.duration:
+            await self.post(session)
+
+    async def _fixed_rate(self, session: aiohttp.ClientSession, started: float) -> None:
+        """ Open loop: requests are sent on schedule whether responses came or not """
+        tasks = set()
+        for i in itertools.count():
+            at = started + i / self.rate
+            if at - started >= self.duration:
+                break
+            delay = at - time.perf_counter()
+            if delay > 0:
+                await aio.sleep(delay)
+            task = aio.ensure_future(self.post(session))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await aio.wait(tasks)
+
+
+class Arrivals:
+    """ FakeViberApi observer: arrival time of pong messages by ping id """
+
+    def __init__(self) -> None:
+        self.times = {}  # type: Dict[str, float]
+
+    def __call__(self, endpoint: str, data: dict) -> None:
+        text = data.get('text') or ''
+        if endpoint == 'send_message' and text.startswith('pong '):
+            self.times[text[5:]] = time.monotonic()
+
+
+def serve(conn: Connection, args) -> None:
+    """
+    Bot process: sends `ready` once the webhook is served, on `stop` waits
+    for replies of the last requests and sends pong arrivals and handler
+    errors back.
+    """
+    logging.basicConfig(level=logging.ERROR)
+    loop = aio.new_event_loop()
+    aio.set_event_loop(loop)
+    try:
+        conn.send(loop.run_until_complete(serve_bot(conn, args)))
+    finally:
+        loop.close()
+        conn.close()
+
+
+async def serve_bot(conn: Connection, args) -> dict:
+    faults = Faults(latency=lognormal(args.api_latency / 1000) if args.api_latency else 0, seed=1)
+    fake = FakeViberApi(AUTH_TOKEN, faults=faults)
+    fake.keep_requests = False
+    arrivals = Arrivals()
+    fake.observers.append(arrivals)
+    await fake.start()
+
+    bot = get_bot(args.port, fake.url)
+    runner = web.AppRunner(bot.app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, '127.0.0.1', args.port).start()
+        conn.send('ready')
+        await aio.get_event_loop().run_in_executor(None, conn.recv)
+        await aio.wait_for(bot.dispatcher.close(), 10)
+    finally:
+        await runner.cleanup()
+        await fake.close()
+    return {'arrivals': arrivals.times, 'handler_errors': bot.dispatcher.errors}
+
+
+async def bench(args) -> dict:
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.get_context('spawn').Process(target=serve, args=(child_conn, args), daemon=True)
+    process.start()
+    child_conn.close()
+    loop = aio.get_event_loop()
+    try:
+        if not await loop.run_in_executor(None, conn.poll, 30):
+            raise RuntimeError('bot process did not start')
+        conn.recv()
+
+        driver = Driver('http://127.0.0.1:{}/webhook'.format(args.port),
+                        args.scenario, args.rate, args.concurrency, args.duration, args.users)
+        elapsed = await driver.run()
+        conn.send('stop')
+        served = await loop.run_in_executor(None, conn.recv)
+    finally:
+        conn.close()
+        await loop.run_in_executor(None, process.join, 15)
+        if process.is_alive():
+            process.terminate()
+    driver.replied(served['arrivals'])
+
+    requests = len(driver.ack)
+    return {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'config': {
+            'scenario': args.scenario, 'rate': args.rate, 'concurrency': args.concurrency,
+            'duration': args.duration, 'users': args.users, 'api_latency': args.api_latency,
+        },
+        'requests': requests,
+        'elapsed': round(elapsed, 3),
+        'rps': round(requests / elapsed, 1) if elapsed else 0,
+        'statuses': driver.statuses,
+        'ack_ms': percentiles(driver.ack),
+        'reply_ms': percentiles(driver.reply),
+        'replies_missing': len(driver.sent),
+        'handler_errors': served['handler_errors'],
+    }
+
+
+def compare(result: dict, baseline: dict) -> List[str]:
+    def change(new: float, old: float) -> str:
+        return '{:+.1f}%'.format((new - old) / old * 100) if old else 'n/a'
+
+    lines = ['rps {} -> {} ({})'.format(baseline['rps'], result['rps'], change(result['rps'], baseline['rps']))]
+    for metric in ('ack_ms', 'reply_ms'):
+        for q in ('p50', 'p99'):
+            old, new = baseline.get(metric, {}).get(q), result.get(metric, {}).get(q)
+            if old is not None and new is not None:
+                lines.append('{} {} {} -> {} ({})'.format(metric, q, old, new, change(new, old)))
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='aioviber webhook benchmark')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+    parser.add_argument('--rate', type=float, default=0, help='requests per second, 0 for max rate')
+    parser.add_argument('--concurrency', type=int, default=32, help='connections of the driver')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--users', type=int, default=1000, help='distinct senders')
+    parser.add_argument('--api-latency', type=float, default=0, help='median latency of fake api, ms')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='write JSON result to file')
+    parser.add_argument('--compare', help='JSON result to compare with')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    loop = aio.get_event_loop()
+    result = loop.run_until_complete(bench(args))
+
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(result, json.load(f))))
+
+
+if __name__ == '__main__':
+    main()